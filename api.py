@@ -0,0 +1,183 @@
+import configparser
+import hashlib
+import json
+import psycopg2
+from datetime import date, datetime
+from functools import wraps
+from psycopg2 import sql
+from flask import Blueprint, g, jsonify, request, url_for
+from werkzeug.local import LocalProxy
+import database
+from dates import get_date_range
+
+#Versioned JSON API for scanning stations and sync jobs. Every request is authenticated with an API token (Authorization: Bearer <token>)
+#created with python maintenance.py create-api-token, so no session is read or written.
+#Listings filter on any column with the same rules as the search pages, page with a keyset cursor in primary key order, and can return
+#only the fields asked for. Integer filters take a comma separated list, which fetches many records (e.g. barcodes) in one request.
+
+config = configparser.ConfigParser()
+config.read('inventory.conf')
+
+cursor = LocalProxy(database.get_db_cursor) #Cursor on the current request's connection
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+api_tables = {'inventory' : {'columns' : {'barcode' : 'int', 'serial' : 'str', 'model' : 'str', 'category' : 'str', 'department' : 'str',
+            'date_purchased' : 'date', 'date_retired' : 'date', 'last_hostname' : 'str'},
+        'key' : ['barcode']},
+    'transactions' : {'columns' : {'transactionid' : 'int', 'barcode' : 'int', 'inout' : 'str', 'username' : 'str', 'assignedto' : 'str',
+            'hostname' : 'str', 'date' : 'date'},
+        'key' : ['transactionid']},
+    'hostnames' : {'columns' : {'hostname' : 'str', 'description' : 'str', 'active' : 'bool'},
+        'key' : ['hostname']},
+    'logs' : {'columns' : {'username' : 'str', 'actiontype' : 'str', 'database' : 'str', 'timestamp' : 'timestamp', 'recordcopy' : 'str'},
+        'key' : ['timestamp', 'ctid'], 'admin_only' : True}} #Table: column types (as in the search pages' format_dict), keyset columns in sort order and whether only admin tokens can read it. logs rows are told apart by their physical row id, as on the logs page
+
+key_casts = {'ctid' : sql.SQL('::tid')} #Cursor values arrive as JSON text and need a cast to compare with these columns
+
+class APIError(Exception): #Turned into a JSON error response with the given status code
+    def __init__(self, status_code, message):
+        super().__init__(message)
+        self.status_code = status_code
+        self.message = message
+
+@api.errorhandler(APIError)
+def api_error(error):
+    return jsonify({'error' : error.message}), error.status_code
+
+def hash_token(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+def get_token_role(): #Returns the role of the request's API token, or None if it is missing, unknown or revoked. Only the token's hash is stored
+    authorization = request.headers.get('Authorization', '')
+    if not authorization.startswith('Bearer '):
+        return None
+    cursor.execute('SELECT role FROM api_tokens WHERE token_hash = %s AND NOT revoked;', (hash_token(authorization[7:].strip()),))
+    row = cursor.fetchone()
+    return row[0] if row != None else None
+
+def token_user(f): #Wrapper function used to verify that the request has an API token with at least user permissions
+    @wraps(f)
+    def decorated_func(*args, **kwargs):
+        g.api_role = get_token_role()
+        if g.api_role not in ('user', 'admin'):
+            raise APIError(401, 'A valid API token is required.')
+        return f(*args, **kwargs)
+    return decorated_func
+
+def get_table(table): #Returns the table's API settings, checking the token may read it
+    if table not in api_tables:
+        raise APIError(404, 'Unknown table.')
+    if api_tables[table].get('admin_only') and g.api_role != 'admin':
+        raise APIError(403, 'An admin API token is required.')
+    return api_tables[table]
+
+def get_fields(api_table): #Columns named in the fields query value, or every column
+    fields = [field.strip() for field in request.args.get('fields', '').split(',') if field.strip() != '']
+    if fields == []:
+        return list(api_table['columns'])
+    for field in fields:
+        if field not in api_table['columns']:
+            raise APIError(400, 'Unknown field: {}.'.format(field))
+    return fields
+
+def get_filters(api_table): #Builds the WHERE conditions from the column=value query values, following the search pages' rules
+    conditions = []
+    params = []
+    for column, column_type in api_table['columns'].items():
+        criteria = request.args.get(column)
+        if criteria == None:
+            continue
+        if column_type == 'int':
+            try:
+                values = [int(value) for value in criteria.split(',')]
+            except ValueError:
+                raise APIError(400, '{} must be a whole number or a comma separated list of them.'.format(column))
+            if len(values) > config.getint('api', 'max_bulk_values', fallback=1000):
+                raise APIError(400, 'Too many values for {}.'.format(column))
+            conditions.append(sql.SQL('{} = ANY(%s)').format(sql.Identifier(column)))
+            params.append(values)
+        elif column_type == 'str':
+            conditions.append(sql.SQL('{} ILIKE %s').format(sql.Identifier(column)))
+            params.append('%' + criteria + '%')
+        elif column_type == 'bool':
+            if criteria.lower() not in ('true', 'false'):
+                raise APIError(400, '{} must be true or false.'.format(column))
+            conditions.append(sql.SQL('{} = %s').format(sql.Identifier(column)))
+            params.append(criteria.lower() == 'true')
+        else:
+            start, end = get_date_range(criteria, include_time = column_type == 'timestamp')
+            if start == None:
+                raise APIError(400, '{} must be a date or a date range.'.format(column))
+            conditions.append(sql.SQL('{0} >= %s AND {0} < %s').format(sql.Identifier(column))) #A range on the bare column can use its index
+            params.extend([start, end])
+    return conditions, params
+
+def get_limit():
+    try:
+        limit = int(request.args.get('limit', config.getint('api', 'page_size', fallback=100)))
+    except ValueError:
+        raise APIError(400, 'limit must be a whole number.')
+    return max(1, min(limit, config.getint('api', 'max_page_size', fallback=1000)))
+
+def to_json_value(value): #Dates as ISO 8601 instead of the HTTP date format jsonify would use
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+@api.route('/<table>')
+@token_user
+def list_records(table): #Lists a table's rows in primary key order, filtered by column=value query values. The response's next value is the URL of the following page, or null on the last page
+    api_table = get_table(table)
+    fields = get_fields(api_table)
+    key = api_table['key']
+    conditions, params = get_filters(api_table)
+    after = request.args.get('after')
+    if after != None:
+        try:
+            after_values = json.loads(after)
+        except ValueError:
+            after_values = None
+        if not isinstance(after_values, list) or len(after_values) != len(key):
+            raise APIError(400, 'Invalid after cursor.')
+        conditions.append(sql.SQL('({}) > ({})').format(sql.SQL(', ').join(map(sql.Identifier, key)),
+            sql.SQL(', ').join(sql.SQL('%s{}').format(key_casts.get(column, sql.SQL(''))) for column in key)))
+        params.extend(after_values)
+    limit = get_limit()
+    try:
+        cursor.execute(sql.SQL('SELECT {}, {} FROM {} {} ORDER BY {} LIMIT %s;').format(
+            sql.SQL(', ').join(map(sql.Identifier, fields)),
+            sql.SQL(', ').join(sql.SQL('{}::TEXT').format(sql.Identifier(column)) if column in key_casts else sql.Identifier(column) for column in key),
+            sql.Identifier(table),
+            sql.SQL('WHERE ') + sql.SQL(' AND ').join(conditions) if conditions != [] else sql.SQL(''),
+            sql.SQL(', ').join(map(sql.Identifier, key))), params + [limit + 1]) #One extra row shows whether there is a next page
+    except psycopg2.DataError: #A cursor value of the wrong type for its column
+        raise APIError(400, 'Invalid after cursor.')
+    rows = cursor.fetchall()
+    next_url = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        url_args = request.args.to_dict()
+        url_args['after'] = json.dumps([to_json_value(value) for value in rows[-1][len(fields):]])
+        next_url = url_for('.list_records', table = table, **url_args)
+    return jsonify({'data' : [dict(zip(fields, map(to_json_value, row[:len(fields)]))) for row in rows], 'next' : next_url})
+
+@api.route('/<table>/<record_key>')
+@token_user
+def get_record(table, record_key): #Returns one row by primary key
+    api_table = get_table(table)
+    if len(api_table['key']) != 1:
+        raise APIError(404, 'Records in this table have no single key.')
+    fields = get_fields(api_table)
+    key_column = api_table['key'][0]
+    if api_table['columns'][key_column] == 'int':
+        try:
+            record_key = int(record_key)
+        except ValueError:
+            raise APIError(404, 'Record not found.')
+    cursor.execute(sql.SQL('SELECT {} FROM {} WHERE {} = %s;').format(sql.SQL(', ').join(map(sql.Identifier, fields)),
+        sql.Identifier(table), sql.Identifier(key_column)), (record_key,))
+    row = cursor.fetchone()
+    if row == None:
+        raise APIError(404, 'Record not found.')
+    return jsonify({'data' : dict(zip(fields, map(to_json_value, row)))})
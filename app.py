@@ -1,34 +1,45 @@
 import configparser
+import hashlib
+import json
+import os
+import uuid
 import flask
 import psycopg2
-from psycopg2 import sql
-from flask import Flask, render_template, request, redirect, session, url_for
+from psycopg2 import sql, errors
+from flask import Flask, Blueprint, Response, g, jsonify, render_template, request, redirect, session, url_for, current_app, stream_with_context
 from flask_session import Session
-from ldap3 import Server, Connection, ALL, NTLM
-from ldap3.core.exceptions import LDAPException, LDAPBindError
-from datetime import datetime
+from werkzeug.local import LocalProxy
+from datetime import timedelta
 from functools import wraps
+import database
+from dates import get_date_range
+import directory
+import importer
+import exporter
+import lookups
+import api
+import assets
+import auditlog
+import compression
+import globalsearch
+import sessionstore
 
 config = configparser.ConfigParser()
 config.read('inventory.conf')
 
-conn = psycopg2.connect(database=config.get('postgres', 'database_name'),
-    user=config.get('postgres', 'user'),
-    password=config.get('postgres', 'password'),
-    host=config.get('postgres', 'host_ip'),
-    port=config.get('postgres', 'host_port'))
+conn = LocalProxy(database.get_db_conn) #Connection checked out of the pool for the current request. Returned to the pool when the request ends
 
-cursor = conn.cursor()
+cursor = LocalProxy(database.get_db_cursor) #Cursor on the current request's connection
 
-app = Flask(__name__)
+routes = Blueprint('routes', __name__) #Every page is registered on this blueprint. create_app attaches it to the app
 
-app.config["SESSION_PERMANENT"] = False
+template_version = str(max(os.path.getmtime(os.path.join(directory_path, file_name)) 
+    for directory_path, directory_names, file_names in os.walk(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')) 
+    for file_name in file_names)) #Part of every page ETag, so editing a template doesn't leave browsers showing the old page
 
-app.config["SESSION_TYPE"] = "filesystem"
-
-app.config["SESSION_FILE_DIR"] = config.get('flask', 'session_file_dir')
-
-app.secret_key = config.get('flask', 'secret_key')
+retired_column = sql.SQL('''NOT EXISTS (SELECT 1 FROM inventory 
+    WHERE inventory.barcode = transactions.barcode 
+    AND inventory.date_retired IS NULL) AS retired''') #Added to transactions SELECTs. True if the device has been retired or is no longer in the inventory table. Looked up by primary key for each row returned
 
 error_dict = {0 : 'Given barcode is already in inventory table.',
     1 : 'Given barcode is not in inventory table.',
@@ -41,7 +52,8 @@ error_dict = {0 : 'Given barcode is already in inventory table.',
     9 : 'Given option value is not in given dropdown list.',
     10 : 'Barcode does not exist in Inventory table.',
     11 : 'Given hostname is already in hostname table.',
-    12 : 'Given hostname does not exist.'}
+    12 : 'Given hostname does not exist.',
+    13 : 'Given CSV file could not be read. Check that it has a header row and the expected columns.'}
 
 def logged_in_user(f): #Wrapper function used to verify that user logged in has at least user permissions
     @wraps(f)
@@ -58,36 +70,18 @@ def logged_in_admin(f): #Wrapper function used to verify that user logged in is
         if get_session_value('loggedin', 'invalid') == 'admin': #If session "loggedin" value is an admin, return func
             return f(*args, **kwargs)
         elif get_session_value('loggedin', 'invalid') == 'user': #If session "loggedin" value is user, yield an error for insufficient privileges
-            return redirect(url_for('error', error_code=8))
+            return redirect(url_for('.error', error_code=8))
         else: #If session "loggedin" value is invalid, redirect to login
             return redirect('/login')
     return decorated_func
 
-def update_last_hostname(barcode): #takes device barcode, gets the most recent hostname specified for the device in the transactions table, then updates the corresponding device last_hostname record in inventory table to match it.
-    cursor.execute('''SELECT hostname FROM transactions WHERE barcode=%s 
-        ORDER BY date DESC LIMIT 1;''', (barcode,)) #gets latest hostname for device as specified in transactions table
-    newest_hostname = cursor.fetchone()
-    cursor.execute('SELECT last_hostname from inventory where barcode=%s', (barcode,)) #Gets the current last_hostname in the inventory table
-    old_last_hostname = cursor.fetchone()
-    if newest_hostname != old_last_hostname: #If the newest hostname is different than what is currently in the inventory table last_hostname field
-        cursor.execute('''UPDATE INVENTORY
-            SET last_hostname=%s
-            WHERE barcode=%s''', (newest_hostname,barcode))
-        conn.commit()
-
-def entries_to_list(entrieslist): #Takes a SQL SELECT rows with junk characters and makes it clean and iterable to use with the dropdown lists
-    formattedlist = []
-    for tuple in entrieslist:
-        tuple = str(tuple)
-        tuple = tuple.replace('(', '').replace(')', '').replace(',', '').replace("'", '')
-        formattedlist.append(tuple)
-    return formattedlist
-
 def create_log(actiontype, database, recordcopy): #Creates a log for the inventory and transaction table functions
     log_data = (str(session['username']), actiontype, database, recordcopy)
-    cursor.execute('''INSERT INTO logs(username, actiontype, database, timestamp, recordcopy)
-        VALUES (%s, %s, %s, CURRENT_TIMESTAMP, %s)''', log_data)
-    conn.commit()
+    if auditlog.is_async(): #Written by the background log writer once the calling route has committed
+        auditlog.defer(log_data)
+    else:
+        cursor.execute('''INSERT INTO logs(username, actiontype, database, timestamp, recordcopy)
+            VALUES (%s, %s, %s, CURRENT_TIMESTAMP, %s)''', log_data) #Committed by the calling route together with the change it records
 
 def make_wildcard(string): #Makes a wildcard to be used with the transactions assigned search function
     wildcard_string = '%%' + string + '%%'
@@ -102,20 +96,187 @@ def get_form_value(variable_name): #Tests if a form input has been filled out. T
     except:
         return None
 
-def get_sortby(default_sortby, replace_space): #Gets the column to sort table by from the POST value on the page
-    try:
-        sortby = request.form['sortby']
-        sortby_SQL = sortby.lower().replace(' ', replace_space).replace('/', '') #Formats displayed value to SQL identifier value format. replace_space is what to replace the space in the option with, depending on the table
-    except: #Sorts by default if no value has been selected
+def get_sortby(sortby_list, default_sortby, replace_space): #Gets the column to sort table by from the POST value on the page, or from the query string on pagination links
+    sortby = request.values.get('sortby')
+    if sortby not in sortby_list: #Sorts by default if no value has been selected, or if the value is not one of the table's columns
         sortby = default_sortby
-        sortby_SQL = default_sortby.lower()
+    sortby_SQL = sortby.lower().replace(' ', replace_space).replace('/', '') #Formats displayed value to SQL identifier value format. replace_space is what to replace the space in the option with, depending on the table
     return sortby, sortby_SQL
 
-def get_dropdown(column): #Gets the dropdown list for deivcetype or devicedeparment for use in inventory table forms
-    cursor.execute(sql.SQL('''SELECT {0} FROM dropdowns
-                WHERE NOT {0} IS NULL 
-                ORDER BY {0};''').format(sql.Identifier(column))) #Gets devicetype select field
-    return entries_to_list(cursor.fetchall())
+def get_page_size(): #Number of rows shown on each page of a table
+    return config.getint('flask', 'page_size', fallback=100)
+
+def get_page_cursor(key_length): #Reads the keyset cursor from the pagination link that was clicked. Returns the direction and the key values of the row to start from
+    if request.method != 'GET': #A submitted sort form always starts from the first page
+        return None, None
+    for direction in ('after', 'before'):
+        try:
+            key_values = json.loads(request.args[direction])
+            if type(key_values) == list and len(key_values) == key_length:
+                return direction, [None if value == None else str(value) for value in key_values] #Values are sent as text, so PostgreSQL reads each one as its key column's type
+        except:
+            pass
+    return None, None
+
+def keyset_branches(key_identifiers, key_values, direction): #Splits the rows after or before a given row into parts that can each be read as one index range scan. Returns (condition, params, order) for each part, in the order they are read
+    first_column = key_identifiers[0]
+    ascending = listing_order(key_identifiers)
+    descending = sql.SQL(', ').join([sql.SQL('{} DESC NULLS FIRST').format(first_column)] + [sql.SQL('{} DESC').format(column) for column in key_identifiers[1:]])
+    if key_values == None: #First page
+        return [(sql.SQL('TRUE'), [], ascending)]
+    if direction == 'after':
+        operator, order = sql.SQL('>'), ascending
+    else:
+        operator, order = sql.SQL('<'), descending
+    if len(key_identifiers) == 1: #Sort column is the tie-breaker, so there is no tie to break
+        return [(sql.SQL('{0} {1} %s').format(first_column, operator), [key_values[0]], order)]
+    tie_condition = sql.SQL('({0}) {1} ({2})').format(sql.SQL(', ').join(key_identifiers[1:]), operator, 
+        sql.SQL(', ').join(sql.Placeholder() * (len(key_values) - 1)))
+    tie_values = list(key_values[1:])
+    if key_values[0] == None: #Cursor row is in the group of nulls sorted at the end
+        if direction == 'after':
+            return [(sql.SQL('{0} IS NULL AND {1}').format(first_column, tie_condition), tie_values, order)]
+        else: #The rest of the nulls before the cursor row, then every non-null row
+            return [(sql.SQL('{0} IS NULL AND {1}').format(first_column, tie_condition), tie_values, order),
+                (sql.SQL('{0} IS NOT NULL').format(first_column), [], order)]
+    row_condition = sql.SQL('({0}) {1} ({2})').format(sql.SQL(', ').join(key_identifiers), operator, 
+        sql.SQL(', ').join(sql.Placeholder() * len(key_values))) #A row comparison is used as the start of the index scan. It is never true for a null sort value
+    if direction == 'after': #The non-null rows after the cursor row, then the nulls sorted at the end
+        return [(row_condition, list(key_values), order), (sql.SQL('{0} IS NULL').format(first_column), [], order)]
+    else:
+        return [(row_condition, list(key_values), order)]
+
+def is_full_listing(): #Tests if the full (unpaginated, streamed) listing of a table was asked for
+    return request.values.get('full_listing') == 'True'
+
+def stream_rows(query, query_params, strip_columns=0): #Reads a query through a named server-side cursor, a chunk of rows at a time, so the whole result is never held in memory
+    with conn.cursor(name='full_listing_{}'.format(uuid.uuid4().hex)) as stream_cursor:
+        stream_cursor.itersize = config.getint('flask', 'stream_chunk_size', fallback=2000) #Rows fetched from the server per round trip
+        stream_cursor.execute(query, query_params)
+        for entry in stream_cursor:
+            if strip_columns:
+                yield entry[:-strip_columns]
+            else:
+                yield entry
+
+def render_table(template_name, **context): #Renders a table page. Full listings are streamed to the client as the rows are read instead of being rendered in memory first
+    if not is_full_listing():
+        return render_template(template_name, **context)
+    template = current_app.jinja_env.get_template(template_name)
+    current_app.update_template_context(context)
+    template_stream = template.stream(**context)
+    template_stream.enable_buffering(config.getint('flask', 'stream_buffer_rows', fallback=50)) #Sends the page in pieces of this many template chunks instead of one tiny write per cell
+    return Response(stream_with_context(template_stream), mimetype='text/html')
+
+def check_not_modified(*tables): #Returns a 304 response if the browser's copy of this page is still current, otherwise None. The page's ETag is built from the change versions of the tables it shows, so this never reads the tables themselves
+    if request.method != 'GET': #Sort forms are posted and always rendered
+        return None
+    cursor.execute('''SELECT string_agg(name || ':' || version, ',' ORDER BY name), max(changed_at) 
+        FROM (SELECT name, sum(version) AS version, max(changed_at) AS changed_at FROM lookup_versions
+            WHERE name = ANY(%s) GROUP BY name) AS table_versions;''', (list(tables),)) #Each table's version is spread over several rows
+    versions, changed_at = cursor.fetchone()
+    etag = hashlib.sha1(json.dumps([versions, request.full_path, session.get('view_style'), 
+        session.get('loggedin'), template_version]).encode()).hexdigest() #The page also depends on its URL (sort, page, filters) and the session's view style
+    g.page_validators = (etag, changed_at)
+    if request.if_none_match.contains_weak(etag): #Only the ETag decides. Last-Modified is informational, since a change committed within the same second would be missed by If-Modified-Since
+        return Response(status=304)
+    return None
+
+@routes.after_request
+def add_page_validators(response): #Adds the ETag found by check_not_modified to the page, and tells the browser to check it on every load
+    page_validators = g.pop('page_validators', None)
+    if page_validators != None and response.status_code in (200, 304):
+        response.set_etag(page_validators[0], weak=True) #Weak, since compression sends the same page as different bytes
+        response.last_modified = page_validators[1]
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        response.vary.add('Cookie')
+    return response
+
+def listing_order(key_identifiers): #ORDER BY for a table listing: the sort column first (nulls last), then the tie-breaker columns
+    return sql.SQL(', ').join([sql.SQL('{} ASC NULLS LAST').format(key_identifiers[0])] + [sql.SQL('{} ASC').format(column) for column in key_identifiers[1:]])
+
+def is_export(): #Tests if the page was asked for as a CSV download instead of a table
+    return request.values.get('export') == 'csv'
+
+def get_export_url(**url_args): #Link that downloads the table on the current page as a CSV file, with the same filter and sort
+    return url_for(request.endpoint, **request.view_args, **url_args, export='csv')
+
+def export_csv(query, query_params, filename): #Streams the result of a SELECT to the browser as a CSV file. PostgreSQL writes the CSV with COPY TO STDOUT and it is passed on a chunk at a time
+    def csv_chunks(): #Runs as the response is sent. Checks out a connection of its own and returns it when the download ends, rather than relying on the request's connection outliving the view
+        db_conn = database.checkout_connection()
+        try:
+            yield from exporter.copy_csv(db_conn, query, query_params, config.getint('flask', 'export_chunk_size', fallback=65536))
+        finally:
+            database.return_connection(db_conn)
+    return Response(stream_with_context(csv_chunks()), mimetype='text/csv',
+        headers={'Content-Disposition' : 'attachment; filename={}.csv'.format(filename)})
+
+def export_table(table, sort_column, tiebreakers, filter_query=sql.SQL('TRUE'), filter_params=(), extra_columns=None, filename=None): #Streams every row of a table listing as CSV, in the same order as the listing. The file is named after the table unless filename is given
+    select_columns = [sql.SQL('*')]
+    if extra_columns != None:
+        select_columns.append(extra_columns)
+    key_identifiers = [sql.Identifier(column) for column in [sort_column] + [column for column in tiebreakers if column != sort_column]]
+    return export_csv(sql.SQL('SELECT {0} FROM {1} WHERE {2} ORDER BY {3}').format(sql.SQL(', ').join(select_columns), 
+        sql.Identifier(table), filter_query, listing_order(key_identifiers)), list(filter_params), filename or table)
+
+def read_keyset_page(table, select_columns, key_identifiers, filter_query, filter_params, key_values, direction, page_size): #Reads up to one row more than a page after or before the cursor row, to find out if there is another page
+    entries = []
+    for condition, condition_params, order in keyset_branches(key_identifiers, key_values, direction): #Each part is only read if the ones before it ran out of rows
+        cursor.execute(sql.SQL('SELECT {0} FROM {1} WHERE {2} AND {3} ORDER BY {4} LIMIT %s;')
+            .format(sql.SQL(', ').join(select_columns + key_identifiers), sql.Identifier(table),
+            filter_query, condition, order), list(filter_params) + condition_params + [page_size + 1 - len(entries)])
+        entries += cursor.fetchall()
+        if len(entries) > page_size:
+            break
+    return entries
+
+def get_page(table, sort_column, tiebreakers, filter_query=sql.SQL('TRUE'), filter_params=(), extra_columns=None, **url_args): #Runs a keyset paginated SELECT on a table. Returns the page of rows and the links to the previous and next pages. extra_columns are computed columns added after the table's own
+    select_columns = [sql.SQL('*')]
+    if extra_columns != None:
+        select_columns.append(extra_columns)
+    key_columns = [sort_column] + [column for column in tiebreakers if column != sort_column] #Sort column first, then the columns that make the order unique
+    key_identifiers = [sql.Identifier(column) for column in key_columns]
+    pagination = {'previous_page_url' : None, 
+        'next_page_url' : None,
+        'full_listing_url' : url_for(request.endpoint, **request.view_args, **url_args, full_listing='True')}
+    if is_full_listing(): #Every row, read through a server-side cursor as the template is streamed
+        rows = stream_rows(sql.SQL('SELECT {0} FROM {1} WHERE {2} ORDER BY {3};')
+            .format(sql.SQL(', ').join(select_columns + key_identifiers), sql.Identifier(table), 
+            filter_query, listing_order(key_identifiers)), list(filter_params), len(key_columns))
+        pagination['full_listing_url'] = None
+        return rows, pagination
+    page_size = get_page_size()
+    direction, key_values = get_page_cursor(len(key_columns))
+    try:
+        entries = read_keyset_page(table, select_columns, key_identifiers, filter_query, filter_params, key_values, direction, page_size)
+    except psycopg2.DataError: #A cursor value that is not valid for its column, from an edited link. Shows the first page instead
+        if key_values == None:
+            raise
+        conn.rollback()
+        direction, key_values = None, None
+        entries = read_keyset_page(table, select_columns, key_identifiers, filter_query, filter_params, key_values, direction, page_size)
+    more_rows = len(entries) > page_size
+    entries = entries[:page_size]
+    if direction == 'before':
+        entries.reverse()
+        has_previous, has_next = more_rows, True
+    else:
+        has_previous, has_next = key_values != None, more_rows
+    rows = [entry[:-len(key_columns)] for entry in entries] #Strips the key columns added for the cursor back off each row
+    if has_previous and entries != []:
+        pagination['previous_page_url'] = url_for(request.endpoint, **request.view_args, **url_args,
+            before=json.dumps(list(entries[0][-len(key_columns):]), default=str))
+    if has_next and entries != []:
+        pagination['next_page_url'] = url_for(request.endpoint, **request.view_args, **url_args,
+            after=json.dumps(list(entries[-1][-len(key_columns):]), default=str))
+    return rows, pagination
+
+def has_results(rows): #Tests if a search found any rows. A streamed full listing can't be read ahead of the response, and is only linked to from a search with results
+    return is_full_listing() or rows != []
+
+def get_dropdown(column): #Gets the dropdown list for deivcetype or devicedeparment for use in inventory table forms. Served from the lookup cache
+    return lookups.get_lookup(cursor, column)
 
 def is_int(test_integer): #Tests if a number is an integer. Used with generated links that allow users to input values that aren't integers into integer fields
     try:
@@ -124,34 +285,13 @@ def is_int(test_integer): #Tests if a number is an integer. Used with generated
     except:
         return False
 
-def ldap_auth():
+def ldap_auth(password): #The password is passed in rather than kept in the session, so it is never written to the session store
     if config.get('general', 'auth_type') == 'ldap':
-        try:
-            ldap_server = Server(config.get('ldap', 'ldap_server_ip'), port=int(config.get('ldap', 'ldap_server_port')), use_ssl=True, get_info=ALL) #LDAP Server connection
-            ldap_conn = Connection(ldap_server, 
-                user='local\\{}'.format(session['username']), 
-                password=session['password'], 
-                authentication=NTLM, auto_bind=True) #Uses session variables to attempt an NTLM bind. Fails if no variables are set
-            ldap_conn.search(config.get('ldap', 'ldap_user_dir').replace('"', ''), 
-                '(&(objectcategory=person)(sAMAccountname={}))'.format(session['username']), 
-                attributes=['CN']) #Searches for the person associated with the username provided
-            real_name = str(ldap_conn.entries).replace(
-                str(ldap_conn.entries)[:str(ldap_conn.entries)
-                .find('cn: ') + 4], '').replace('\n]', '') #Formats the search results to only contain "Firstname Lastname"
-            ldap_conn.search(config.get('ldap', 'ldap_user_dir').replace('"', ''), 
-                '(&(objectcategory=group)(CN={}))'.format(config.get('ldap', 'admin_group_cn')), 
-                attributes=['member']) #Searches for all members in the IT inventory admin list
-            admin_list = str(ldap_conn.entries)
-            if real_name in admin_list: #If user is in admin group
-                session['loggedin'] = 'admin'
-            else:
-                session['loggedin'] = 'user' #If user is in user group
-        except:
-            session['loggedin'] = 'invalid' #If bind is unsuccessful (authentication failed)
+        session['loggedin'] = directory.authenticate(session['username'], password) #Admin if the user is in the admin group, user if not, invalid if the bind fails
     elif config.get('general', 'auth_type') == 'setup':
         login_dict = {'user' : 'password', 'admin' : 'admin'}
         try:
-            if session['password'] == login_dict[session['username']]:
+            if password == login_dict[session['username']]:
                 if session['username'] == 'admin':
                     session['loggedin'] = 'admin'
                 else:
@@ -161,52 +301,15 @@ def ldap_auth():
         except:
             session['loggedin'] = 'invalid'
 
-def get_session_value(session_name, default_value): #Used to retrieve a session value. If value is unassigned, initializes it with a default value.
-    try:
-        return session[session_name] # Error is raised if given session value is uninitialized
-    except:
-        session[session_name] = default_value # Initializes the session value with a given default value and returns it
-        return session[session_name]
-
-def get_retired_dict(): #Makes a dictionary with barcodes as keys and whether they've been retired as the value
-    cursor.execute('SELECT barcode, date_retired FROM inventory;')
-    entries = cursor.fetchall()
-    retired_dict = {} #initializes retired_dict
-    for entry in entries: #If barcode has a retired date, sets the value to true, otherwise false
-        if entry[1] != None:
-            retired_dict[entry[0]] = True
-        else:
-            retired_dict[entry[0]] = False
-    cursor.execute('''SELECT barcode FROM transactions 
-        WHERE barcode NOT IN (SELECT barcode FROM inventory);''') #Gets all barcodes in transactions that do not have an item linked to them in the inventory table
-    unlinked_barcodes = cursor.fetchall()
-    if unlinked_barcodes != []: #If there are any unlinked barcodes
-        for barcode in unlinked_barcodes:
-            retired_dict[barcode[0]] = True
-    return retired_dict
-
-def get_hostnames_list(): #Returns a list of all hostnames to be used in the datalist on transactions add/edit form
-    hostnames_list = []
-    cursor.execute('SELECT hostname FROM hostnames ORDER BY hostname;')
-    hostname_entries = cursor.fetchall()
-    for hostname in hostname_entries:
-        hostnames_list.append(hostname[0]) #For every entry in the SQL selection, appends it to the hostname list
-    return hostnames_list
-
-def get_hostnames_pattern(): #Returns a string of all hostnames separated by "|" to be used for data validation on the hostname field on transaction add/edit form
-    hostnames_pattern = ''
-    cursor.execute('SELECT hostname FROM hostnames ORDER BY hostname;')
-    hostname_entries = cursor.fetchall()
-    for hostname in hostname_entries:
-        hostnames_pattern = hostnames_pattern + hostname[0] + '|'
-    return hostnames_pattern
-
-def validate_changed(new_record, old_record): #Used in the edit record functions. This is to ensure that the submitted "edited" record has actually changed, and the save button wasn't clicked without changing anything
-    changed = False
-    for place, entry in enumerate(new_record):
-        if str(entry) != str(old_record[place]):
-            changed = True
-    return changed
+def get_session_value(session_name, default_value): #Used to retrieve a session value. Returns the default if the value is unassigned, without storing it, so reading a page doesn't cause a session write
+    return session.get(session_name, default_value)
+
+def set_session_value(session_name, value): #Assigns a session value only if it has changed. Any assignment marks the session as modified, which causes a session write
+    if session.get(session_name) != value:
+        session[session_name] = value
+
+def escape_like(string): #Escapes the LIKE wildcard characters in user input so they are matched literally
+    return string.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
 
 def format_quick_add_record(quick_add_record): #Used to make an indexible list for the quick add feature in the transactions table. Indexing allows us to fill in spaces in the add record form with data from a previous record
     quick_add_record = quick_add_record[1:] #These two lines remove the parentheses surrounding the record
@@ -219,11 +322,11 @@ def format_quick_add_record(quick_add_record): #Used to make an indexible list f
         quick_add_list.append(formatted_entry) #Adds each formatted entry to the new list.
     return quick_add_list
 
-@app.route('/')
+@routes.route('/')
 def main_page():
     return redirect('/login')
 
-@app.route('/login/', methods = ['POST', 'GET'])
+@routes.route('/login/', methods = ['POST', 'GET'])
 def login():
     if request.method in ('POST'): #POST method has two functions tied to it: logout and validate credentials
         try: #Tests if coming from logout button and clears session.
@@ -235,8 +338,7 @@ def login():
         except:
             try: #Validates credentials given.
                 session['username'] = request.form['username'].strip()
-                session['password'] = request.form['password'].strip()
-                ldap_auth()
+                ldap_auth(request.form['password'].strip())
                 if get_session_value('loggedin', 'invalid') in ('user', 'admin'):
                     return redirect('/inventory/')
                 else:
@@ -257,51 +359,56 @@ def login():
             return render_template('login.html',
                 view_style = session['view_style'])
 
-@app.route('/inventory/', methods = ['POST', 'GET'])
+@routes.route('/inventory/', methods = ['POST', 'GET'])
 @logged_in_user
 def inv_show_table():
     sortby_list = ['Barcode', 
         'Serial', 'Model', 'Category', 
         'Department', 'Date Purchased', 
         'Date Retired', 'Last Hostname']
-    session['last_inv_page'] = '/inventory'
-    sortby = get_sortby('Barcode', '_')[0]
-    sortby_SQL = get_sortby('Barcode', '_')[1]
-    cursor.execute(sql.SQL('SELECT * FROM inventory ORDER BY {};')
-        .format(sql.Identifier(sortby_SQL)))
-    inventorytable = cursor.fetchall()
+    set_session_value('last_inv_page', '/inventory')
+    not_modified = check_not_modified('inventory')
+    if not_modified != None:
+        return not_modified
+    sortby = get_sortby(sortby_list, 'Barcode', '_')[0]
+    sortby_SQL = get_sortby(sortby_list, 'Barcode', '_')[1]
+    if is_export():
+        return export_table('inventory', sortby_SQL, ['barcode'])
+    inventorytable, pagination = get_page('inventory', sortby_SQL, ['barcode'], sortby = sortby)
     sortby_list.remove(sortby)
     sortby_list.insert(0, sortby) #Removes the sortby value from its original place in the list and inserts it at the top
-    return render_template('inventorytable/inventorytable.html', 
+    return render_table('inventorytable/inventorytable.html', 
         inventorytable = inventorytable, 
+        pagination = pagination,
+        export_url = get_export_url(sortby = sortby),
         sortby_list  = sortby_list, 
         active_page = 'inventory', 
         searched_table = False,     
         view_style = session['view_style']) #active_page is for bolding the nav_bar links
 
-@app.route('/inventory/add-record', methods = ['POST', 'GET'])
+@routes.route('/inventory/add-record', methods = ['POST', 'GET'])
 @logged_in_user
 def inv_add_record_form():
     if request.method in ('POST'): #If the form has been submitted
         barcode = request.form['barcode']
-        cursor.execute('SELECT * FROM inventory WHERE barcode=%s;', (barcode,))
-        if cursor.fetchall() == []: #If no entries exist for that barcode already
-            date_purchased = get_form_value('date_purchased') #Field is non-mandatory, so special function is required
-            date_retired = get_form_value('date_retired') #Field is non-mandatory, so special function is required
-            serial = get_form_value('serial') #Field is non-mandatory, so special function is required
-            item_data = (barcode, serial, request.form['model'], 
-            request.form['category'], request.form['department'], 
-            date_purchased, date_retired) 
-            cursor.execute('''INSERT INTO inventory(barcode, serial, model,
-            category, department, date_purchased, date_retired)
-            VALUES (%s, %s, %s, %s, %s, %s, %s);''', item_data)
-            cursor.execute('SELECT * FROM inventory WHERE barcode=%s;', (barcode,)) #Gets a copy of the new entry
-            recordcopy=cursor.fetchone()
+        date_purchased = get_form_value('date_purchased') #Field is non-mandatory, so special function is required
+        date_retired = get_form_value('date_retired') #Field is non-mandatory, so special function is required
+        serial = get_form_value('serial') #Field is non-mandatory, so special function is required
+        item_data = (barcode, serial, request.form['model'], 
+        request.form['category'], request.form['department'], 
+        date_purchased, date_retired) 
+        cursor.execute('''INSERT INTO inventory(barcode, serial, model,
+        category, department, date_purchased, date_retired)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+        ON CONFLICT (barcode) DO NOTHING
+        RETURNING *;''', item_data) #Returns a copy of the new entry, or nothing if the barcode is already in use
+        recordcopy=cursor.fetchone()
+        if recordcopy != None: #If no entries existed for that barcode already
             create_log('Add', 'Inventory', recordcopy)
             conn.commit()
             return redirect(get_session_value('last_inv_page', '/inventory'))
         else:
-            return redirect(url_for('error', error_code=0))
+            return redirect(url_for('.error', error_code=0))
     else:
         devicetypelist = get_dropdown('devicetype') #Gets devicetype select list for the form
         devicedepartmentlist = get_dropdown('devicedepartment') #Gets devicedepartment select list for the form
@@ -312,7 +419,7 @@ def inv_add_record_form():
             active_page = 'inventory',
             view_style = session['view_style'])
 
-@app.route('/inventory/remove-record/<barcode>', methods = ['POST', 'GET'])
+@routes.route('/inventory/remove-record/<barcode>', methods = ['POST', 'GET'])
 @logged_in_user
 def inv_remove_record(barcode):
     if is_int(barcode): #Makes sure that the barcode field in the link is an integer
@@ -321,11 +428,11 @@ def inv_remove_record(barcode):
                 request.form['cancel'] #If cancel button was clicked
                 return redirect(get_session_value('last_inv_page', '/inventory'))
             except:    
-                cursor.execute('SELECT * FROM inventory WHERE barcode=%s;', (barcode,)) 
+                cursor.execute('DELETE FROM inventory WHERE barcode=%s RETURNING *;', (barcode,)) 
                 old_record = cursor.fetchone()
-                create_log('Remove', 'Inventory', old_record) #Makes a log of the record before deletion
-                cursor.execute('DELETE FROM inventory WHERE barcode=%s', (barcode,))
-                conn.commit()
+                if old_record != None:
+                    create_log('Remove', 'Inventory', old_record) #Makes a log of the deleted record
+                    conn.commit()
                 return redirect(get_session_value('last_inv_page', '/inventory'))
         else:
             cursor.execute('SELECT * FROM inventory WHERE barcode=%s;', (barcode,)) 
@@ -336,43 +443,44 @@ def inv_remove_record(barcode):
                 view_style = session['view_style'],
                 active_page = 'inventory')
             else:
-                return redirect(url_for('error', error_code=1))
+                return redirect(url_for('.error', error_code=1))
     else:
-        return redirect(url_for('error', error_code=1))
+        return redirect(url_for('.error', error_code=1))
 
-@app.route('/inventory/edit-record/<old_barcode>', methods = ['POST', 'GET'])
+@routes.route('/inventory/edit-record/<old_barcode>', methods = ['POST', 'GET'])
 @logged_in_user
 def inv_edit_record_form(old_barcode):
     if is_int(old_barcode): #Makes sure that the barcode field in the link is an integer
         if request.method in ('POST'): #If the form has been submitted
-            cursor.execute('SELECT * FROM inventory WHERE barcode=%s;', (old_barcode,))
+            date_purchased = get_form_value('date_purchased') #Field is non-mandatory, so special function is required
+            date_retired = get_form_value('date_retired') #Field is non-mandatory, so special function is required
+            serial = get_form_value('serial') #Field is non-mandatory, so special function is required
+            edit_item_data = (request.form['barcode'], serial, request.form['model'], 
+                request.form['category'], request.form['department'], 
+                date_purchased, date_retired)
+            try:
+                cursor.execute('''UPDATE inventory
+                    SET barcode = %s,
+                        serial = %s,
+                        model = %s,
+                        category = %s,
+                        department = %s,
+                        date_purchased = %s,
+                        date_retired = %s
+                    FROM (SELECT * FROM inventory WHERE barcode = %s FOR UPDATE) AS old_record
+                    WHERE inventory.barcode = old_record.barcode
+                    AND (old_record.barcode, old_record.serial, old_record.model, old_record.category, 
+                        old_record.department, old_record.date_purchased, old_record.date_retired) 
+                        IS DISTINCT FROM (%s, %s, %s, %s, %s, %s, %s)
+                    RETURNING old_record.*;''', (edit_item_data + (old_barcode,) + edit_item_data)) #Only updates if something was actually changed, and returns the record as it was before the edit
+            except errors.UniqueViolation: #If a record already exists with the new (edited) barcode
+                conn.rollback()
+                return redirect(url_for('.error', error_code=0))
             old_record = cursor.fetchone()
-            new_barcode = request.form['barcode']
-            cursor.execute('SELECT * FROM inventory WHERE barcode=%s AND NOT serial=%s;', (new_barcode, old_record[1]))
-            if cursor.fetchall() == []: #If a record exists with the new (edited) barcode that's not the old record (Meaning that the barcode hasn't changed). 
-                date_purchased = get_form_value('date_purchased') #Field is non-mandatory, so special function is required
-                date_retired = get_form_value('date_retired') #Field is non-mandatory, so special function is required
-                serial = get_form_value('serial') #Field is non-mandatory, so special function is required
-                edit_item_data = (request.form['barcode'], serial, request.form['model'], 
-                    request.form['category'], request.form['department'], 
-                    date_purchased, date_retired)
-                if validate_changed(edit_item_data, old_record) == True:
-                    create_log('Edit', 'Inventory', old_record) #Makes a log of the record before edit
-                    cursor.execute('''UPDATE INVENTORY
-                        SET barcode = %s,
-                            serial = %s,
-                            model = %s,
-                            category = %s,
-                            department = %s,
-                            date_purchased = %s,
-                            date_retired = %s
-                        WHERE barcode = %s;''', (edit_item_data + (old_barcode,)))
-                    conn.commit()
-                    return redirect(get_session_value('last_inv_page', '/inventory'))
-                else:
-                    return redirect(get_session_value('last_inv_page', '/inventory'))
-            else:
-                return redirect(url_for('error', error_code=0))
+            if old_record != None: #If the record was changed
+                create_log('Edit', 'Inventory', old_record) #Makes a log of the record before edit
+                conn.commit()
+            return redirect(get_session_value('last_inv_page', '/inventory'))
                 
         else:
             if len(old_barcode) < 6: #Protects from SQL numeric range injections
@@ -380,19 +488,9 @@ def inv_edit_record_form(old_barcode):
                 old_record = list(cursor.fetchone())
                 if old_record != None: #If a record exists with the given barcode
                     old_devicetype = old_record[3]
-                    cursor.execute('''SELECT devicetype FROM dropdowns
-                        WHERE NOT devicetype IS NULL
-                        AND NOT devicetype = %s
-                        ORDER BY devicetype;''', (old_devicetype,)) #I didn't use the get_dropdown function because I also exclude the current column values on these SQL statements
-                    devicetypelist = entries_to_list(cursor.fetchall())
-                    devicetypelist.insert(0, old_devicetype) #Places the current entry at the front of the list
+                    devicetypelist = [old_devicetype] + [option for option in get_dropdown('devicetype') if option != old_devicetype] #Places the current entry at the front of the list
                     old_devicedepartment = old_record[4]
-                    cursor.execute('''SELECT devicedepartment FROM dropdowns 
-                        WHERE NOT devicedepartment IS NULL 
-                        AND NOT devicedepartment = %s
-                        ORDER BY devicedepartment;''', (old_devicedepartment,)) #Gets devicedepartment select list for the form
-                    devicedepartmentlist = entries_to_list(cursor.fetchall())
-                    devicedepartmentlist.insert(0, old_devicedepartment) #Places the current entry at the front of the list
+                    devicedepartmentlist = [old_devicedepartment] + [option for option in get_dropdown('devicedepartment') if option != old_devicedepartment] #Places the current entry at the front of the list
                     if old_record[1] == None: #If Serial field is empty, sets the value to empty instead of having the default field text be "None"
                         old_record[1] = ''
                     return render_template('inventorytable/inv_edit_record_form.html', 
@@ -408,15 +506,15 @@ def inv_edit_record_form(old_barcode):
                         active_page = 'inventory',
                         view_style = session['view_style'])
                 else:
-                    return redirect(url_for('error', error_code=1))
+                    return redirect(url_for('.error', error_code=1))
     else:
-        return redirect(url_for('error', error_code=1))
+        return redirect(url_for('.error', error_code=1))
 
-@app.route('/inventory/search', methods = ['POST', 'GET'])
+@routes.route('/inventory/search', methods = ['POST', 'GET'])
 @logged_in_user
 def inv_search_form():
     if request.method in ('POST'): #If form submitted
-        return redirect(url_for('search_inventory', 
+        return redirect(url_for('.search_inventory', 
             search_category = request.form['search_category'], 
             criteria = request.form['criteria'])) #Redirects to search page with form data
     else:
@@ -425,10 +523,13 @@ def inv_search_form():
             active_page = 'inventory', 
             view_style = session['view_style']) #Renders form
 
-@app.route('/inventory/search/<search_category>/<criteria>', methods = ['POST', 'GET'])
+@routes.route('/inventory/search/<search_category>/<criteria>', methods = ['POST', 'GET'])
 @logged_in_user
 def search_inventory(search_category, criteria):
-    session['last_inv_page'] = '/inventory/search/{}/{}'.format(search_category, criteria) #Where to return to if an edit occurs while on this page
+    set_session_value('last_inv_page', '/inventory/search/{}/{}'.format(search_category, criteria)) #Where to return to if an edit occurs while on this page
+    not_modified = check_not_modified('inventory')
+    if not_modified != None:
+        return not_modified
     format_dict = {'barcode' : 'int', 
         'serial' : 'str', 
         'model' : 'str',
@@ -441,52 +542,44 @@ def search_inventory(search_category, criteria):
         'Model', 'Category', 'Department', 
         'Date Purchased', 'Date Retired', 
         'Last Hostname']
-    sortby = get_sortby('Barcode', '_')[0]
-    sortby_SQL = get_sortby('Barcode', '_')[1]
+    sortby = get_sortby(sortby_list, 'Barcode', '_')[0]
+    sortby_SQL = get_sortby(sortby_list, 'Barcode', '_')[1]
 
     if format_dict[search_category] == 'int':
         if is_int(criteria):
-            cursor.execute(sql.SQL('SELECT * FROM inventory WHERE barcode = %s ORDER BY {};')
-                .format(sql.Identifier(sortby_SQL)), (criteria,))
-            inventorytable = cursor.fetchall()
+            search_filter = sql.SQL('barcode = %s')
+            search_params = (criteria,)
             search_category = search_category.capitalize() #Sets search category for display on the webpage
         else:
-            return redirect(url_for('error', error_code=3))
+            return redirect(url_for('.error', error_code=3))
 
     elif format_dict[search_category] == 'str':
         wildcard_criteria = make_wildcard(criteria) #Adds wildcard characters so exact string value isn't required
-        cursor.execute(sql.SQL('SELECT * FROM inventory WHERE {} ILIKE %s ORDER BY {};')
-            .format(sql.Identifier(search_category), sql.Identifier(sortby_SQL)), (wildcard_criteria,))
-        inventorytable = cursor.fetchall()
+        search_filter = sql.SQL('{} ILIKE %s').format(sql.Identifier(search_category))
+        search_params = (wildcard_criteria,)
         search_category = search_category.capitalize() #Sets search category for display on the webpage
 
     elif format_dict[search_category] == 'date':
-        specificity_list = [None, 'year', 'month', 'day'] #Used to get the specificity of the user's input
-        validation_blocks = ['%Y', '-%m', '-%d'] #Used to create the guide for input validation
-        criteria_listform = criteria.split('-') #Replaces all separating characters with hyphens and splits each value into a list using those hyphens
-        specificity = specificity_list[len(criteria_listform)]
-        while len(criteria_listform) < 3: #Fills in the unspecified time values with zeroes
-            criteria_listform.append('01') #Fills in month and day with 01
-        criteria_formatted = '{0}-{1}-{2}'.format(*criteria_listform) #Takes the list and turns it back into a formatted date
-        validation_guide = '' #Initiializes validation_guide
-        for time_spot in range(specificity_list.index(specificity)): #Creates a formatting guide for datetime that is the length of the user's input
-            validation_guide = validation_guide + validation_blocks[time_spot]
-        try:  
-            datetime.strptime(criteria, validation_guide).date() #Validates that the input is in timestamp form
-        except:
-            return redirect(url_for('error', error_code=3))
-        cursor.execute(sql.SQL('SELECT * FROM inventory WHERE DATE_TRUNC(%s, {}) = %s ORDER BY {};')
-                .format(sql.Identifier(search_category), sql.Identifier(sortby_SQL)), (specificity, criteria_formatted))
-        inventorytable = cursor.fetchall()
+        start, end = get_date_range(criteria)
+        if start == None:
+            return redirect(url_for('.error', error_code=3))
+        search_filter = sql.SQL('{0} >= %s AND {0} < %s').format(sql.Identifier(search_category)) #A range on the bare column can use its index
+        search_params = (start, end)
         search_category = search_category.replace('_', ' ').capitalize()
 
-    if inventorytable != []: #If search yielded results
+    if is_export(): #Downloads the search results instead of showing them
+        return export_table('inventory', sortby_SQL, ['barcode'], search_filter, search_params, filename = 'inventory_search')
+    inventorytable, pagination = get_page('inventory', sortby_SQL, ['barcode'], search_filter, search_params, sortby = sortby)
+
+    if has_results(inventorytable): #If search yielded results
         sortby_list.remove(sortby)
         sortby_list.insert(0, sortby) #Removes the sortby value from its original place in the list and inserts it at the top
-        return render_template('inventorytable/inventorytable.html', 
+        return render_table('inventorytable/inventorytable.html', 
         inventorytable = inventorytable, 
+        pagination = pagination,
         search_category = search_category, 
         criteria = criteria, 
+        export_url = get_export_url(sortby = sortby),
         sortby_list = sortby_list, 
         searched_table = True,
         active_page = 'inventory', 
@@ -497,35 +590,40 @@ def search_inventory(search_category, criteria):
             if 'remove' in request.referrer: #Protects from error loop after deleting the last record in a search
                 return redirect('/inventory')
             elif 'transactions' in request.referrer: #If accessed from transactions page by "view item" link and no records exist
-                return redirect(url_for('error', error_code=10))
+                return redirect(url_for('.error', error_code=10))
             else:
-                return redirect(url_for('error', error_code=3))
+                return redirect(url_for('.error', error_code=3))
         except:
-            return redirect(url_for('error', error_code=3))
+            return redirect(url_for('.error', error_code=3))
 
-@app.route('/transactions/', methods = ['POST', 'GET'])
+@routes.route('/transactions/', methods = ['POST', 'GET'])
 @logged_in_user
 def trans_show_table():
-    session['last_trans_page'] = '/transactions' #Where to return to if an edit occurs while on this page
+    set_session_value('last_trans_page', '/transactions') #Where to return to if an edit occurs while on this page
+    not_modified = check_not_modified('transactions', 'inventory')
+    if not_modified != None:
+        return not_modified
     sortby_list = ['Transaction ID', 
         'Barcode', 'In/Out', 'Username', 
         'Assigned To', 'Hostname', 'Date']
-    sortby = get_sortby('Date', '')[0]
-    sortby_SQL = get_sortby('Date', '')[1]
-    cursor.execute(sql.SQL('SELECT * FROM transactions ORDER BY {}, transactionid;')
-        .format(sql.Identifier(sortby_SQL)))
-    transactionstable = cursor.fetchall()
+    sortby = get_sortby(sortby_list, 'Date', '')[0]
+    sortby_SQL = get_sortby(sortby_list, 'Date', '')[1]
+    if is_export():
+        return export_table('transactions', sortby_SQL, ['transactionid'], extra_columns = retired_column)
+    transactionstable, pagination = get_page('transactions', sortby_SQL, ['transactionid'], 
+        extra_columns = retired_column, sortby = sortby)
     sortby_list.remove(sortby)
     sortby_list.insert(0, sortby) #Removes the sortby value from its original place in the list and inserts it at the top
-    return render_template('transactionstable/transactionstable.html', 
+    return render_table('transactionstable/transactionstable.html', 
         transactionstable = transactionstable, 
+        pagination = pagination,
+        export_url = get_export_url(sortby = sortby),
         sortby_list=sortby_list, 
-        retired_dict = get_retired_dict(), 
         searched_table = False,
         active_page = 'transactions', 
         view_style = session['view_style'])
 
-@app.route('/transactions/add-record', methods = ['POST', 'GET'])
+@routes.route('/transactions/add-record', methods = ['POST', 'GET'])
 @logged_in_user
 def trans_add_record_form():
     if request.method in ('POST'): #If form has been submitted
@@ -538,47 +636,39 @@ def trans_add_record_form():
                 default_username = quick_add_list[3],
                 default_assignedto = quick_add_list[4],
                 default_hostname = quick_add_list[5],
-                hostnames_list = get_hostnames_list(),
-                hostnames_pattern = get_hostnames_pattern(),
                 last_trans_page = get_session_value('last_trans_page', '/transactions'),
                 active_page = 'transactions',
                 view_style = session['view_style'])
         except:
             barcode = request.form['barcode']
-            cursor.execute('''SELECT * FROM inventory WHERE barcode=%s;''', (barcode,))
-            if cursor.fetchall() != []: #If there is an inventory entry with the specified barcode
-                cursor.execute('''SELECT transactionid FROM transactions 
-                    ORDER BY transactionid DESC LIMIT 1;''')
-                prev_id = cursor.fetchone() #Gets the latest transactionid before the one to be added
-                try:
-                    transactionid = int(prev_id[0]) + 1 #The transactionid for the record to be added
-                except TypeError:
-                    transactionid = 1
-                username = get_form_value('username') #Field is non-mandatory, so special function is required
-                hostname = get_form_value('hostname')
-                transaction_data = (transactionid, barcode, request.form['inout'], 
-                    username, request.form['assignedto'], hostname,
-                    request.form['date']) 
-                cursor.execute('''INSERT INTO transactions(transactionid, barcode, inout, username,
+            username = get_form_value('username') #Field is non-mandatory, so special function is required
+            hostname = get_form_value('hostname')
+            transaction_data = (barcode, request.form['inout'], 
+                username, request.form['assignedto'], hostname,
+                request.form['date'], barcode) 
+            try:
+                cursor.execute('''INSERT INTO transactions(barcode, inout, username,
                 assignedto, hostname, date)
-                VALUES (%s, %s, %s, %s, %s, %s, %s);''', transaction_data)
-                cursor.execute('SELECT * FROM transactions WHERE transactionid=%s;', (transactionid,))
-                recordcopy=cursor.fetchone() 
+                SELECT %s, %s, %s, %s, %s, %s
+                WHERE EXISTS (SELECT 1 FROM inventory WHERE barcode=%s)
+                RETURNING *;''', transaction_data) #transactionid is assigned by the database, so concurrent adds never collide. Nothing is inserted if the barcode isn't in the inventory table
+            except errors.ForeignKeyViolation: #If the hostname isn't in the hostnames table
+                conn.rollback()
+                return redirect(url_for('.error', error_code=12))
+            recordcopy=cursor.fetchone() 
+            if recordcopy != None: #If there is an inventory entry with the specified barcode
                 create_log('Add', 'Transactions', recordcopy) #Makes a log of the new record
-                update_last_hostname(barcode)#updates the last_hostname field for the device in inventory.
                 conn.commit()
                 return redirect(get_session_value('last_trans_page', '/transactions'))
             else:
-                return redirect(url_for('error', error_code=1))
+                return redirect(url_for('.error', error_code=1))
     else:
         return render_template('transactionstable/trans_add_record_form.html',
-        hostnames_list = get_hostnames_list(),
-        hostnames_pattern = get_hostnames_pattern(),
         last_trans_page = get_session_value('last_trans_page', '/transactions'),
         active_page = 'transactions',
         view_style = session['view_style'])
 
-@app.route('/transactions/remove-record/<transactionid>', methods = ['POST', 'GET'])
+@routes.route('/transactions/remove-record/<transactionid>', methods = ['POST', 'GET'])
 @logged_in_user
 def trans_remove_record(transactionid):
     if is_int(transactionid):
@@ -587,12 +677,11 @@ def trans_remove_record(transactionid):
                 request.form['cancel']
                 return redirect(get_session_value('last_trans_page', '/transactions'))
             except:
-                cursor.execute('SELECT * FROM transactions WHERE transactionid=%s;', (transactionid,))
+                cursor.execute('DELETE FROM transactions WHERE transactionid=%s RETURNING *;', (transactionid,))
                 old_record = cursor.fetchone()
-                create_log('Remove', 'Transactions', old_record) #Makes a log of the record before deletion
-                cursor.execute('DELETE FROM transactions WHERE transactionid=%s;', (transactionid,))
-                update_last_hostname(old_record[1])#updates the last_hostname field for the device in inventory.
-                conn.commit()
+                if old_record != None:
+                    create_log('Remove', 'Transactions', old_record) #Makes a log of the deleted record
+                    conn.commit()
                 return redirect(get_session_value('last_trans_page', '/transactions'))
         else:
             cursor.execute('SELECT * FROM transactions WHERE transactionid=%s;', (transactionid,))
@@ -603,29 +692,24 @@ def trans_remove_record(transactionid):
                 view_style = session['view_style'],
                 active_page = 'transactions')
             else:
-                return redirect(url_for('error', error_code=5))
+                return redirect(url_for('.error', error_code=5))
     else:
-        return redirect(url_for('error', error_code=5))
+        return redirect(url_for('.error', error_code=5))
 
-@app.route('/transactions/edit-record/<transactionid>', methods = ['POST', 'GET'])
+@routes.route('/transactions/edit-record/<transactionid>', methods = ['POST', 'GET'])
 @logged_in_user
 def trans_edit_record_form(transactionid):
     if is_int(transactionid):
         if request.method in ('POST'): #If form has been submitted
             barcode = request.form['barcode']
-            cursor.execute('SELECT * FROM inventory WHERE barcode=%s;', (barcode,))
-            barcode_in_inventory = cursor.fetchall() 
-            cursor.execute('SELECT * FROM transactions WHERE barcode=%s;', (barcode,))
-            barcode_in_transactions = cursor.fetchall() #If given barcode is in inventory or transactions tables
-            if barcode_in_inventory != [] or barcode_in_transactions != []: #If a barcode entry is deleted from inventory, it can still be edited in transactions
-                cursor.execute('SELECT * FROM transactions WHERE transactionid=%s;', (transactionid,))
-                old_record = cursor.fetchone()
+            cursor.execute('''SELECT EXISTS (SELECT 1 FROM inventory WHERE barcode=%s) 
+                OR EXISTS (SELECT 1 FROM transactions WHERE barcode=%s);''', (barcode, barcode)) #If given barcode is in inventory or transactions tables
+            if cursor.fetchone()[0] == True: #If a barcode entry is deleted from inventory, it can still be edited in transactions
                 username = get_form_value('username') #Field is non-mandatory, so special function is required
                 hostname = get_form_value('hostname')
                 edit_trans_data = (barcode, request.form['inout'], username, 
                     request.form['assignedto'], hostname, request.form['date']) 
-                if validate_changed((transactionid,) + edit_trans_data, old_record) == True:
-                    create_log('Edit', 'Transactions', old_record) #Makes a log of the record before edit
+                try:
                     cursor.execute('''UPDATE transactions
                         SET barcode = %s,
                             inout = %s,
@@ -633,14 +717,22 @@ def trans_edit_record_form(transactionid):
                             assignedto = %s,
                             hostname = %s,
                             date = %s
-                        WHERE transactionid = %s;''', (edit_trans_data + (transactionid,)))
-                    update_last_hostname(barcode)#updates the last_hostname field for the device in inventory.
+                        FROM (SELECT * FROM transactions WHERE transactionid = %s FOR UPDATE) AS old_record
+                        WHERE transactions.transactionid = old_record.transactionid
+                        AND (old_record.barcode, old_record.inout, old_record.username, 
+                            old_record.assignedto, old_record.hostname, old_record.date) 
+                            IS DISTINCT FROM (%s, %s, %s, %s, %s, %s)
+                        RETURNING old_record.*;''', (edit_trans_data + (transactionid,) + edit_trans_data)) #Only updates if something was actually changed, and returns the record as it was before the edit
+                except errors.ForeignKeyViolation: #If the hostname isn't in the hostnames table
+                    conn.rollback()
+                    return redirect(url_for('.error', error_code=12))
+                old_record = cursor.fetchone()
+                if old_record != None: #If the record was changed
+                    create_log('Edit', 'Transactions', old_record) #Makes a log of the record before edit
                     conn.commit()
-                    return redirect(get_session_value('last_trans_page', '/transactions'))
-                else:
-                    return redirect(get_session_value('last_trans_page', '/transactions'))
+                return redirect(get_session_value('last_trans_page', '/transactions'))
             else:
-                return redirect(url_for('error', error_code=6))
+                return redirect(url_for('.error', error_code=6))
         else:
             if len(transactionid) < 6: #Protects from SQL numeric range injections
                 cursor.execute('SELECT * FROM transactions WHERE transactionid=%s;', (transactionid,))
@@ -668,23 +760,21 @@ def trans_edit_record_form(transactionid):
                         old_assignedto = old_record[4],
                         old_hostname = old_record[5],
                         old_date = old_record[6],
-                        hostnames_list = get_hostnames_list(),
-                        hostnames_pattern = get_hostnames_pattern(),
                         retired = retired,
                         last_trans_page = get_session_value('last_trans_page', '/transactions'),
                         active_page = 'transactions', 
                         view_style = session['view_style']) #Passes old record data into the default spaces in the form
                 else:
-                    return redirect(url_for('error', error_code=5))
+                    return redirect(url_for('.error', error_code=5))
             else: 
-                return redirect(url_for('error', error_code=5))
+                return redirect(url_for('.error', error_code=5))
     else:
-        return redirect(url_for('error', error_code=5))
+        return redirect(url_for('.error', error_code=5))
 
-@app.route('/transactions/search', methods = ['POST', 'GET'])
+@routes.route('/transactions/search', methods = ['POST', 'GET'])
 def trans_search_form():
     if request.method in ('POST'): #If form submitted
-        return redirect(url_for('search_transactions', 
+        return redirect(url_for('.search_transactions', 
             search_category = request.form['search_category'], 
             criteria = request.form['criteria'])) #Redirects to search page with form data
     else:
@@ -693,10 +783,13 @@ def trans_search_form():
             active_page = 'transactions', 
             view_style = session['view_style']) #Renders form
     
-@app.route('/transactions/search/<search_category>/<criteria>', methods = ['POST', 'GET'])
+@routes.route('/transactions/search/<search_category>/<criteria>', methods = ['POST', 'GET'])
 @logged_in_user
 def search_transactions(search_category, criteria):
-    session['last_trans_page'] = '/transactions/search/{}/{}'.format(search_category, criteria) #Where to return to if an edit occurs while on this page
+    set_session_value('last_trans_page', '/transactions/search/{}/{}'.format(search_category, criteria)) #Where to return to if an edit occurs while on this page
+    not_modified = check_not_modified('transactions', 'inventory')
+    if not_modified != None:
+        return not_modified
     sortby_list = ['Transaction ID', 
         'Barcode', 'In/Out', 'Username', 
         'Assigned To', 'Hostname', 'Date']
@@ -707,61 +800,54 @@ def search_transactions(search_category, criteria):
         'assignedto' : 'str', 
         'hostname' : 'str', 
         'date' : 'date'} #Returns the formatting style for SQL statements. Int and date are validated, str gets wildcard
-    sortby = get_sortby('Date', '')[0]
-    sortby_SQL = get_sortby('Date', '')[1]
+    sortby = get_sortby(sortby_list, 'Date', '')[0]
+    sortby_SQL = get_sortby(sortby_list, 'Date', '')[1]
 
     if format_dict[search_category] == 'int':
         if is_int(criteria):
             criteria = int(criteria) #Ensures that the barcode number provided is an integer
-            cursor.execute(sql.SQL('SELECT * FROM transactions WHERE {} = %s ORDER BY {}, transactionid;')
-                .format(sql.Identifier(search_category), sql.Identifier(sortby_SQL)), (criteria,))
-            transactionstable = cursor.fetchall()
+            search_filter = sql.SQL('{} = %s').format(sql.Identifier(search_category))
+            search_params = (criteria,)
             if search_category == 'transactionid': #Sets search category for display on the webpage
                 search_category = 'Transaction ID'
             else:
                 search_category = search_category.capitalize() 
         else:
-            return redirect(url_for('error', error_code=3))
+            return redirect(url_for('.error', error_code=3))
 
     elif format_dict[search_category] == 'str':
         wildcard_criteria = make_wildcard(criteria) #Adds wildcard characters so exact username isn't required
-        cursor.execute(sql.SQL('SELECT * FROM transactions WHERE {} ILIKE %s ORDER BY {}, transactionid;')
-            .format(sql.Identifier(search_category), sql.Identifier(sortby_SQL)), (wildcard_criteria,))
-        transactionstable = cursor.fetchall()
+        search_filter = sql.SQL('{} ILIKE %s').format(sql.Identifier(search_category))
+        search_params = (wildcard_criteria,)
         if search_category == 'assignedto': #Sets search category for display on the webpage
             search_category = '"Assigned To"'
         else:
             search_category = search_category.capitalize()
 
     elif format_dict[search_category] == 'date':
-        specificity_list = [None, 'year', 'month', 'day'] #Used to get the specificity of the user's input
-        validation_blocks = ['%Y', '-%m', '-%d'] #Used to create the guide for input validation
-        criteria_listform = criteria.split('-') #Replaces all separating characters with hyphens and splits each value into a list using those hyphens
-        specificity = specificity_list[len(criteria_listform)]
-        while len(criteria_listform) < 3: #Fills in the unspecified time values with zeroes
-            criteria_listform.append('01') #Fills in month and day with 01
-        criteria_formatted = '{0}-{1}-{2}'.format(*criteria_listform) #Takes the list and turns it back into a formatted date
-        validation_guide = '' #Initiializes validation_guide
-        for time_spot in range(specificity_list.index(specificity)): #Creates a formatting guide for datetime that is the length of the user's input
-            validation_guide = validation_guide + validation_blocks[time_spot]
-        try:  
-            datetime.strptime(criteria, validation_guide).date() #Validates that the input is in timestamp form
-        except:
-            return redirect(url_for('error', error_code=3))
-        cursor.execute(sql.SQL('SELECT * FROM transactions WHERE DATE_TRUNC(%s, {}) = %s ORDER BY {};')
-                .format(sql.Identifier(search_category), sql.Identifier(sortby_SQL)), (specificity, criteria_formatted))
-        transactionstable = cursor.fetchall()
+        start, end = get_date_range(criteria)
+        if start == None:
+            return redirect(url_for('.error', error_code=3))
+        search_filter = sql.SQL('{0} >= %s AND {0} < %s').format(sql.Identifier(search_category)) #A range on the bare column can use its index
+        search_params = (start, end)
         search_category = search_category.capitalize()
 
-    if transactionstable != []: #If search yielded results
+    if is_export(): #Downloads the search results instead of showing them
+        return export_table('transactions', sortby_SQL, ['transactionid'], search_filter, search_params, 
+            extra_columns = retired_column, filename = 'transactions_search')
+    transactionstable, pagination = get_page('transactions', sortby_SQL, ['transactionid'], search_filter, search_params, 
+        extra_columns = retired_column, sortby = sortby)
+
+    if has_results(transactionstable): #If search yielded results
         sortby_list.remove(sortby)
         sortby_list.insert(0, sortby) #Removes the sortby value from its original place in the list and inserts it at the top
-        return render_template('transactionstable/transactionstable.html', 
+        return render_table('transactionstable/transactionstable.html', 
             transactionstable = transactionstable, 
+            pagination = pagination,
             search_category = search_category, 
             criteria = criteria, 
+            export_url = get_export_url(sortby = sortby),
             sortby_list = sortby_list, 
-            retired_dict = get_retired_dict(),
             searched_table = True, 
             active_page = 'transactions', 
             view_style = session['view_style'])
@@ -771,94 +857,120 @@ def search_transactions(search_category, criteria):
             if 'remove' in request.referrer: #Protects from error loop after deleting the last record in a search
                 return redirect('/transactions')
             elif 'inventory' in request.referrer: #If accessed from inventory page by barcode history and no records exist
-                return redirect(url_for('error', error_code=4))
+                return redirect(url_for('.error', error_code=4))
             else:
-                return redirect(url_for('error', error_code=3))
+                return redirect(url_for('.error', error_code=3))
         except:
-            return redirect(url_for('error', error_code=3))
+            return redirect(url_for('.error', error_code=3))
 
-@app.route('/hostnames', methods = ['GET', 'POST'])
+@routes.route('/hostnames', methods = ['GET', 'POST'])
 @logged_in_user
 def show_hostnames():
-    session['last_hostnames_page'] = '/hostnames'#Where to return to if an edit occurs while on this page
+    set_session_value('last_hostnames_page', '/hostnames')#Where to return to if an edit occurs while on this page
+    not_modified = check_not_modified('hostnames')
+    if not_modified != None:
+        return not_modified
     sortby_list = ['Hostname', 'Description']
-    sortby = get_sortby('Hostname', '')[0]
-    sortby_SQL = get_sortby('Hostname', '')[1]
+    sortby = get_sortby(sortby_list, 'Hostname', '')[0]
+    sortby_SQL = get_sortby(sortby_list, 'Hostname', '')[1]
     try: #If active_only has been specified, set it to what it is, otherwise default to false
-        active_only = request.form['active_only']
+        active_only = request.values['active_only']
     except:
         active_only = False
     if active_only == 'True': #If filtering by only active hostnames, uses the correct query
-        cursor.execute(sql.SQL('SELECT * FROM hostnames WHERE active=true ORDER BY {};')
-            .format(sql.Identifier(sortby_SQL)))
+        if is_export():
+            return export_table('hostnames', sortby_SQL, ['hostname'], sql.SQL('active=true'))
+        hostnametable, pagination = get_page('hostnames', sortby_SQL, ['hostname'], 
+            sql.SQL('active=true'), sortby = sortby, active_only = active_only)
+        export_url = get_export_url(sortby = sortby, active_only = active_only)
     else:
-        cursor.execute(sql.SQL('SELECT * FROM hostnames ORDER BY {};')
-            .format(sql.Identifier(sortby_SQL)))
-    hostnametable = cursor.fetchall()
+        if is_export():
+            return export_table('hostnames', sortby_SQL, ['hostname'])
+        hostnametable, pagination = get_page('hostnames', sortby_SQL, ['hostname'], sortby = sortby)
+        export_url = get_export_url(sortby = sortby)
     sortby_list.remove(sortby)
     sortby_list.insert(0, sortby) #Removes the sortby value from its original place in the list and inserts it at the top
-    return render_template('hostnamestable/show_hostnames.html', 
+    return render_table('hostnamestable/show_hostnames.html', 
         hostnametable = hostnametable, 
+        pagination = pagination,
+        export_url = export_url,
         active_page = 'hostnames',
         sortby_list = sortby_list,
         active_only = active_only,
         searched_table = False,
         view_style = session['view_style'])
 
-@app.route('/hostnames/add', methods = ['GET', 'POST'])
+@routes.route('/hostnames/autocomplete')
+@logged_in_user
+def hostname_autocomplete(): #Returns the active hostnames starting with the prefix query value as a JSON list. Used by the hostname field on the transactions forms
+    prefix = request.args.get('prefix', '').strip()
+    try:
+        limit = max(1, min(int(request.args['limit']), 100))
+    except:
+        limit = config.getint('flask', 'autocomplete_limit', fallback=20)
+    if prefix == '':
+        return jsonify([])
+    cursor.execute('''SELECT hostname FROM hostnames
+        WHERE active AND lower(hostname) LIKE lower(%s) || '%%'
+        ORDER BY lower(hostname), hostname
+        LIMIT %s;''', (escape_like(prefix), limit)) #Matches the partial index on lower(hostname), so this reads only the matching rows
+    return jsonify([row[0] for row in cursor.fetchall()])
+
+@routes.route('/hostnames/add', methods = ['GET', 'POST'])
 @logged_in_user
 def add_hostname_form():
     if request.method in ('POST'): #If form has been submitted
         hostname = request.form['hostname']
-        cursor.execute('SELECT * FROM hostnames WHERE hostname=%s;', (hostname,))
-        if cursor.fetchall() == []: #If no entries exist for that hostname already
-            if get_form_value('active') == 'true':
-                active = 'true'
-            else:
-                active = 'false'
-            cursor.execute('''INSERT INTO hostnames(hostname, description, active)
-                VALUES (%s, %s, %s);''', (hostname, request.form['description'], active))
-            cursor.execute('SELECT * FROM hostnames WHERE hostname=%s;', (hostname,)) #Gets a copy of the new entry
-            recordcopy = cursor.fetchone()
+        if get_form_value('active') == 'true':
+            active = 'true'
+        else:
+            active = 'false'
+        cursor.execute('''INSERT INTO hostnames(hostname, description, active)
+            VALUES (%s, %s, %s)
+            ON CONFLICT (hostname) DO NOTHING
+            RETURNING *;''', (hostname, request.form['description'], active)) #Returns a copy of the new entry, or nothing if the hostname already exists
+        recordcopy = cursor.fetchone()
+        if recordcopy != None: #If no entries existed for that hostname already
             create_log('Add', 'Hostnames', recordcopy)
             conn.commit()
             return redirect(get_session_value('last_hostnames_page', '/hostnames'))
         else:
-            return redirect(url_for('error', error_code=11))
+            return redirect(url_for('.error', error_code=11))
     else:
         return render_template('hostnamestable/add_hostname_form.html', 
             last_hostnames_page = get_session_value('last_hostnames_page', '/hostnames'),
             active_page = 'hostnames', 
             view_style = session['view_style'])
 
-@app.route('/hostnames/edit/<old_hostname>', methods = ['POST', 'GET'])
+@routes.route('/hostnames/edit/<old_hostname>', methods = ['POST', 'GET'])
 @logged_in_user
 def hostname_edit_record_form(old_hostname):
     if request.method in ('POST'): #If form has been submitted
-        cursor.execute('SELECT * FROM hostnames WHERE hostname=%s;', (old_hostname,))
-        old_record = cursor.fetchone()
         new_hostname = request.form['hostname']
-        cursor.execute('SELECT * FROM hostnames WHERE hostname=%s AND NOT description=%s;', (new_hostname, old_record[1]))
-        if cursor.fetchall() == []: #If a record exists with the new (edited) hostname that's not the old record (Meaning that the hostname hasn't changed). 
-            if get_form_value('active') == 'true':
-                new_active = 'True'
-            else:
-                new_active = 'False'
-            edit_hostname_data = (new_hostname, request.form['description'], new_active)
-            if validate_changed(edit_hostname_data, old_record) == True:
-                create_log('Edit', 'Hostnames', old_record) #Makes a log of the record before edit 
-                cursor.execute('''UPDATE hostnames
-                    SET hostname = %s,
-                        description = %s,
-                        active = %s
-                    WHERE hostname = %s;''', 
-                    (edit_hostname_data + (old_hostname,)))
-                conn.commit()
-                return redirect(get_session_value('last_hostnames_page', '/hostnames'))
-            else:
-                return redirect(get_session_value('last_hostnames_page', '/hostnames'))
+        if get_form_value('active') == 'true':
+            new_active = 'True'
         else:
-            return redirect(url_for('error', error_code=11))
+            new_active = 'False'
+        edit_hostname_data = (new_hostname, request.form['description'], new_active)
+        try:
+            cursor.execute('''UPDATE hostnames
+                SET hostname = %s,
+                    description = %s,
+                    active = %s
+                FROM (SELECT * FROM hostnames WHERE hostname = %s FOR UPDATE) AS old_record
+                WHERE hostnames.hostname = old_record.hostname
+                AND (old_record.hostname, old_record.description, old_record.active) 
+                    IS DISTINCT FROM (%s, %s, %s)
+                RETURNING old_record.*;''', 
+                (edit_hostname_data + (old_hostname,) + edit_hostname_data)) #Only updates if something was actually changed, and returns the record as it was before the edit
+        except errors.UniqueViolation: #If a record already exists with the new (edited) hostname
+            conn.rollback()
+            return redirect(url_for('.error', error_code=11))
+        old_record = cursor.fetchone()
+        if old_record != None: #If the record was changed
+            create_log('Edit', 'Hostnames', old_record) #Makes a log of the record before edit 
+            conn.commit()
+        return redirect(get_session_value('last_hostnames_page', '/hostnames'))
     else:
         if len(old_hostname) < 20: #Protects from SQL range injections
             cursor.execute('SELECT * FROM hostnames WHERE hostname=%s;', (old_hostname,))
@@ -872,11 +984,11 @@ def hostname_edit_record_form(old_hostname):
                     active_page = 'hostnames', 
                     view_style = session['view_style']) #Passes old record data into the default spaces in the form
             else:
-                return redirect(url_for('error', error_code=12))
+                return redirect(url_for('.error', error_code=12))
         else: 
-            return redirect(url_for('error', error_code=12))
+            return redirect(url_for('.error', error_code=12))
 
-@app.route('/hostnames/remove/<old_hostname>', methods = ['POST', 'GET'])
+@routes.route('/hostnames/remove/<old_hostname>', methods = ['POST', 'GET'])
 @logged_in_user
 def hostname_remove_record_form(old_hostname):
     if request.method in ('POST'): #If form has been submitted
@@ -884,11 +996,11 @@ def hostname_remove_record_form(old_hostname):
             request.form['cancel'] #If the user hit the cancel button
             return redirect(get_session_value('last_hostnames_page', '/hostnames'))
         except:
-            cursor.execute('SELECT * FROM hostnames WHERE hostname=%s;', (old_hostname,))
+            cursor.execute('DELETE FROM hostnames WHERE hostname=%s RETURNING *;', (old_hostname,))
             old_record = cursor.fetchone()
-            create_log('Remove', 'Hostnames', old_record) #Makes a log of the record before deletion
-            cursor.execute('DELETE FROM hostnames WHERE hostname=%s;', (old_hostname,))
-            conn.commit()
+            if old_record != None:
+                create_log('Remove', 'Hostnames', old_record) #Makes a log of the deleted record
+                conn.commit()
             return redirect(get_session_value('last_hostnames_page', '/hostnames'))
 
     else:
@@ -901,15 +1013,15 @@ def hostname_remove_record_form(old_hostname):
                 view_style = session['view_style'],
                 active_page = 'hostnames')
             else:
-                return redirect(url_for('error', error_code=12))
+                return redirect(url_for('.error', error_code=12))
         else:
-            return redirect(url_for('error', error_code=12))
+            return redirect(url_for('.error', error_code=12))
 
-@app.route('/hostnames/search', methods = ['POST', 'GET'])
+@routes.route('/hostnames/search', methods = ['POST', 'GET'])
 @logged_in_user
 def hostnames_search_form():
     if request.method in ('POST'): #If form submitted
-        return redirect(url_for('search_hostnames', 
+        return redirect(url_for('.search_hostnames', 
             search_category = request.form['search_category'], 
             criteria = request.form['criteria'])) #Redirects to search page with form data
     else:
@@ -918,33 +1030,41 @@ def hostnames_search_form():
             active_page = 'hostnames', 
             view_style = session['view_style'])
 
-@app.route('/hostnames/search/<search_category>/<criteria>', methods = ['POST', 'GET'])
+@routes.route('/hostnames/search/<search_category>/<criteria>', methods = ['POST', 'GET'])
 @logged_in_user
 def search_hostnames(search_category, criteria):
-    session['last_hostnames_page'] = '/hostnames/search/{}/{}'.format(search_category, criteria) #Where to return to if an edit occurs while on this page
+    set_session_value('last_hostnames_page', '/hostnames/search/{}/{}'.format(search_category, criteria)) #Where to return to if an edit occurs while on this page
+    not_modified = check_not_modified('hostnames')
+    if not_modified != None:
+        return not_modified
     sortby_list = ['Hostname', 'Description']
-    sortby = get_sortby('Hostname', '')[0]
-    sortby_SQL = get_sortby('Hostname', '')[1] #This search function does not use the format_dict like the other table searches because the only possible formats are str
+    sortby = get_sortby(sortby_list, 'Hostname', '')[0]
+    sortby_SQL = get_sortby(sortby_list, 'Hostname', '')[1] #This search function does not use the format_dict like the other table searches because the only possible formats are str
     wildcard_criteria = make_wildcard(criteria) #Adds wildcard characters so exact username isn't required
     try: #If active_only has been specified, set it to what it is, otherwise default to false
-        active_only = request.form['active_only']
+        active_only = request.values['active_only']
     except:
         active_only = False
     if active_only == 'True': #If filtering by only active hostnames, uses the correct query
-        cursor.execute(sql.SQL('SELECT * FROM hostnames WHERE {} ILIKE %s AND active=true ORDER BY {};')
-        .format(sql.Identifier(search_category), sql.Identifier(sortby_SQL)), (wildcard_criteria,))
+        search_filter = sql.SQL('{} ILIKE %s AND active=true').format(sql.Identifier(search_category))
+        url_args = {'sortby' : sortby, 'active_only' : active_only}
     else:
-        cursor.execute(sql.SQL('SELECT * FROM hostnames WHERE {} ILIKE %s ORDER BY {};')
-        .format(sql.Identifier(search_category), sql.Identifier(sortby_SQL)), (wildcard_criteria,))
-    hostnametable = cursor.fetchall()
+        search_filter = sql.SQL('{} ILIKE %s').format(sql.Identifier(search_category))
+        url_args = {'sortby' : sortby}
+    export_url = get_export_url(**url_args)
+    if is_export(): #Downloads the search results instead of showing them
+        return export_table('hostnames', sortby_SQL, ['hostname'], search_filter, (wildcard_criteria,), filename = 'hostnames_search')
+    hostnametable, pagination = get_page('hostnames', sortby_SQL, ['hostname'], search_filter, (wildcard_criteria,), **url_args)
     search_category = search_category.capitalize()
-    if hostnametable != []: #If search yielded results
+    if has_results(hostnametable): #If search yielded results
         sortby_list.remove(sortby)
         sortby_list.insert(0, sortby) #Removes the sortby value from its original place in the list and inserts it at the top
-        return render_template('hostnamestable/show_hostnames.html', 
+        return render_table('hostnamestable/show_hostnames.html', 
             hostnametable = hostnametable, 
+            pagination = pagination,
             search_category = search_category, 
             criteria = criteria, 
+            export_url = export_url,
             sortby_list = sortby_list, 
             active_only = active_only,
             searched_table = True, 
@@ -955,39 +1075,95 @@ def search_hostnames(search_category, criteria):
             if 'remove' in request.referrer: #Protects from error loop after deleting the last record in a search
                 return redirect('/hostnames')
             else:
-                return redirect(url_for('error', error_code=3))
+                return redirect(url_for('.error', error_code=3))
         except:
-            return redirect(url_for('error', error_code=3))
+            return redirect(url_for('.error', error_code=3))
+
+@routes.route('/assets/<path:path>')
+def send_asset(path): #Fingerprinted static files built by python assets.py build. No login needed, like /static/
+    return assets.send_asset(path)
+
+@routes.route('/search')
+@logged_in_user
+def global_search(): #Searches inventory, transactions, hostnames and, for admins, logs for the words in the q query value
+    terms = request.args.get('q', '').strip()
+    results = []
+    if terms != '':
+        results = globalsearch.search(cursor, terms, 
+            include_logs = get_session_value('loggedin', 'invalid') == 'admin', 
+            results_per_source = config.getint('flask', 'search_results_per_table', fallback=10), 
+            candidate_limit = config.getint('flask', 'search_candidate_limit', fallback=1000))
+    return render_template('global_search.html', 
+        terms = terms, 
+        results = results, 
+        search_sources = globalsearch.search_sources, 
+        candidate_limit = config.getint('flask', 'search_candidate_limit', fallback=1000), 
+        active_page = None, 
+        view_style = session['view_style'])
 
-@app.route('/admin-tools')
+@routes.route('/admin-tools')
 @logged_in_admin
 def admin_tools():
     return render_template('admin/admin_tools.html', active_page = 'admin_tools',
         view_style = session['view_style'])
 
-@app.route('/admin-tools/logs/', methods = ['POST', 'GET'])
+@routes.route('/admin-tools/import', methods = ['POST', 'GET'])
+@logged_in_admin
+def import_form():
+    if request.method in ('POST'): #If form has been submitted
+        import_table = request.form['import_table']
+        csv_file = request.files['csv_file']
+        if import_table not in importer.import_tables:
+            return redirect(url_for('.error', error_code=13))
+        try:
+            imported_count, rejected_count, rejected_rows = importer.import_csv(conn, import_table, 
+                csv_file.stream, str(session['username']), csv_file.filename)
+        except (errors.DataError, errors.BadCopyFileFormat): #If the file isn't valid CSV or has the wrong number of columns
+            conn.rollback()
+            return redirect(url_for('.error', error_code=13))
+        conn.commit()
+        return render_template('admin/import_form.html',
+            import_table = import_table,
+            imported_count = imported_count,
+            rejected_count = rejected_count,
+            rejected_rows = rejected_rows,
+            import_columns = importer.import_tables,
+            active_page = 'admin_tools',
+            view_style = session['view_style'])
+    else:
+        return render_template('admin/import_form.html',
+            import_columns = importer.import_tables,
+            active_page = 'admin_tools',
+            view_style = session['view_style'])
+
+@routes.route('/admin-tools/logs/', methods = ['POST', 'GET'])
 @logged_in_admin
 def show_logs():
+    not_modified = check_not_modified('logs')
+    if not_modified != None:
+        return not_modified
     sortby_list = ['Username', 'Action Type', 'Database', 'Timestamp']
-    sortby = get_sortby('Timestamp', '')[0]
-    sortby_SQL = get_sortby('Timestamp', '')[1]
-    cursor.execute(sql.SQL('SELECT * FROM logs ORDER BY {};')
-        .format(sql.Identifier(sortby_SQL)))
-    logtable = cursor.fetchall()
+    sortby = get_sortby(sortby_list, 'Timestamp', '')[0]
+    sortby_SQL = get_sortby(sortby_list, 'Timestamp', '')[1]
+    if is_export():
+        return export_table('logs', sortby_SQL, ['timestamp', 'ctid'])
+    logtable, pagination = get_page('logs', sortby_SQL, ['timestamp', 'ctid'], sortby = sortby) #logs has no primary key. Rows with the same timestamp are told apart by their physical row id, which never changes because logs are never updated
     sortby_list.remove(sortby)
     sortby_list.insert(0, sortby) #Removes the sortby value from its original place in the list and inserts it at the top
-    return render_template('admin/show_logs.html', 
+    return render_table('admin/show_logs.html', 
         logtable = logtable, 
+        pagination = pagination,
+        export_url = get_export_url(sortby = sortby),
         sortby_list = sortby_list, 
         searched_table = False,
         active_page = 'admin_tools', 
         view_style = session['view_style'])
 
-@app.route('/admin-tools/logs/search', methods = ['POST', 'GET'])
+@routes.route('/admin-tools/logs/search', methods = ['POST', 'GET'])
 @logged_in_admin
 def logs_search_form():
     if request.method in ('POST'): #If form submitted
-        return redirect(url_for('search_logs', 
+        return redirect(url_for('.search_logs', 
             search_category = request.form['search_category'], 
             criteria = request.form['criteria'])) #Redirects to search page with form data
     else:
@@ -995,13 +1171,16 @@ def logs_search_form():
             active_page = 'admin_tools', 
             view_style = session['view_style']) #Renders form
 
-@app.route('/admin-tools/logs/search/<search_category>/<criteria>', methods = ['POST', 'GET'])
+@routes.route('/admin-tools/logs/search/<search_category>/<criteria>', methods = ['POST', 'GET'])
 @logged_in_admin
 def search_logs(search_category, criteria):
+    not_modified = check_not_modified('logs')
+    if not_modified != None:
+        return not_modified
     sortby_list = ['Username', 'Action Type', 
         'Database', 'Timestamp']
-    sortby = get_sortby('Timestamp', '')[0]
-    sortby_SQL = get_sortby('Timestamp', '')[1]
+    sortby = get_sortby(sortby_list, 'Timestamp', '')[0]
+    sortby_SQL = get_sortby(sortby_list, 'Timestamp', '')[1]
     format_dict = {
         'username' : 'str', 
         'actiontype' : 'str', 
@@ -1011,46 +1190,34 @@ def search_logs(search_category, criteria):
 
     if format_dict[search_category] == 'str':
         wildcard_criteria = make_wildcard(criteria) #Adds wildcard characters so exact username isn't required
-        cursor.execute(sql.SQL('SELECT * FROM logs WHERE {} ILIKE %s ORDER BY {}, timestamp;')
-            .format(sql.Identifier(search_category), sql.Identifier(sortby_SQL)), (wildcard_criteria,))
-        logtable = cursor.fetchall()
+        search_filter = sql.SQL('{} ILIKE %s').format(sql.Identifier(search_category))
+        search_params = (wildcard_criteria,)
         if search_category == 'assignedto': #Sets search category for display on the webpage
             search_category = '"Assigned To"'
         else:
             search_category = search_category.capitalize()
 
     elif format_dict[search_category] == 'timestamp':
-        specificity_list = [None, 'year', 'month', 'day', 
-            'hour', 'minute', 'second'] #Used to get the specificity of the user's input
-        validation_blocks = ['%Y', '-%m', '-%d', ' %H', ':%M', ':%S'] #Used to create the guide for input validation
-        criteria_listform = criteria.replace(' ', '-').replace(':', '-').split('-') #Replaces all separating characters with hyphens and splits each value into a list using those hyphens
-        specificity = specificity_list[len(criteria_listform)]
-        while len(criteria_listform) < 6: #Fills in the unspecified time values with zeroes
-            if len(criteria_listform) < 3:
-                criteria_listform.append('01') #Fills in month and day with 01, because the values cannot be 00
-            else:
-                criteria_listform.append('00')
-        criteria_formatted = '{0}-{1}-{2} {3}:{4}:{5}'.format(*criteria_listform) #Takes the list and turns it back into a formatted date
-        validation_guide = '' #Initiializes validation_guide
-        for time_spot in range(specificity_list.index(specificity)): #Creates a formatting guide for datetime that is the length of the user's input
-            validation_guide = validation_guide + validation_blocks[time_spot]
-        try:  
-            datetime.strptime(criteria, validation_guide).date() #Validates that the input is in timestamp form
-        except:
-            return redirect(url_for('error', error_code=3))
-        cursor.execute(sql.SQL('SELECT * FROM logs WHERE DATE_TRUNC(%s, timestamp)=%s ORDER BY {}, timestamp;')
-            .format(sql.Identifier(sortby_SQL)), 
-            (specificity, criteria_formatted)) #Searches the database, truncating on specificity provided by user
-        logtable = cursor.fetchall()
+        start, end = get_date_range(criteria, include_time=True)
+        if start == None:
+            return redirect(url_for('.error', error_code=3))
+        search_filter = sql.SQL('timestamp >= %s AND timestamp < %s') #A range on the bare column lets PostgreSQL skip the logs partitions and index entries outside it
+        search_params = (start, end)
         search_category = search_category.capitalize()
 
-    if logtable != []: #If search yielded results
+    if is_export(): #Downloads the search results instead of showing them
+        return export_table('logs', sortby_SQL, ['timestamp', 'ctid'], search_filter, search_params, filename = 'logs_search')
+    logtable, pagination = get_page('logs', sortby_SQL, ['timestamp', 'ctid'], search_filter, search_params, sortby = sortby)
+
+    if has_results(logtable): #If search yielded results
         sortby_list.remove(sortby)
         sortby_list.insert(0, sortby) #Removes the sortby value from its original place in the list and inserts it at the top
-        return render_template('admin/show_logs.html', 
+        return render_table('admin/show_logs.html', 
             logtable = logtable, 
+            pagination = pagination,
             search_category = search_category, 
             criteria = criteria, 
+            export_url = get_export_url(sortby = sortby),
             sortby_list = sortby_list, 
             searched_table = True,
             active_page = 'admin_tools', 
@@ -1061,13 +1228,13 @@ def search_logs(search_category, criteria):
             if 'remove' in request.referrer: #Protects from error loop after deleting the last record in a search
                 return redirect('/transactions')
             elif 'inventory' in request.referrer: #If accessed from inventory page by barcode history and no records exist
-                return redirect(url_for('error', error_code=4))
+                return redirect(url_for('.error', error_code=4))
             else:
-                return redirect(url_for('error', error_code=3))
+                return redirect(url_for('.error', error_code=3))
         except:
-            return redirect(url_for('error', error_code=3))
+            return redirect(url_for('.error', error_code=3))
 
-@app.route('/admin-tools/dropdowns', methods = ['POST', 'GET'])
+@routes.route('/admin-tools/dropdowns', methods = ['POST', 'GET'])
 @logged_in_admin
 def show_dropdowns():
     cursor.execute('''SELECT * FROM dropdowns WHERE 
@@ -1093,7 +1260,7 @@ def show_dropdowns():
         active_page = 'admin_tools',
         view_style = session['view_style'])
 
-@app.route('/admin-tools/dropdowns/add', methods = ['POST', 'GET'])
+@routes.route('/admin-tools/dropdowns/add', methods = ['POST', 'GET'])
 @logged_in_admin
 def add_dropdown_form():
     if request.method in ('POST'): #If form has been submitted
@@ -1120,15 +1287,16 @@ def add_dropdown_form():
                     .format(sql.Identifier(edit_dropdown), 
                     sql.Identifier(opposing_dropdown)), (newoption,)) #Sets only one empty dropdown field to the new option value.
             conn.commit()
+            lookups.invalidate() #Shows the change on this process's forms straight away
             return redirect('/admin-tools/dropdowns')
         else:
-            return redirect(url_for('error', error_code=7))
+            return redirect(url_for('.error', error_code=7))
     else:
         return render_template('admin/add_dropdown_form.html', 
             active_page = 'admin_tools',
             view_style = session['view_style'])
 
-@app.route('/admin-tools/dropdowns/remove', methods = ['POST', 'GET'])
+@routes.route('/admin-tools/dropdowns/remove', methods = ['POST', 'GET'])
 @logged_in_admin
 def remove_dropdown_form():
     if request.method in ('POST'): #If form has been submitted
@@ -1143,15 +1311,16 @@ def remove_dropdown_form():
                 devicetype IS NULL 
                 AND devicedepartment IS NULL;''') #Removes any dead rows that might be "None, None"
             conn.commit()
+            lookups.invalidate()
             return redirect('/admin-tools/dropdowns')
         else:
-            return redirect(url_for('error', error_code=9))
+            return redirect(url_for('.error', error_code=9))
     else:
         return render_template('admin/remove_dropdown_form.html',
             active_page = 'admin_tools', 
             view_style = session['view_style'])
 
-@app.route('/admin-tools/dropdowns/remove/<edit_dropdown>/<old_dropdown>', methods = ['POST', 'GET'])
+@routes.route('/admin-tools/dropdowns/remove/<edit_dropdown>/<old_dropdown>', methods = ['POST', 'GET'])
 @logged_in_admin
 def dropdown_remove_record_form(edit_dropdown, old_dropdown):
     if request.method in ('POST'): #If form has been submitted
@@ -1168,9 +1337,10 @@ def dropdown_remove_record_form(edit_dropdown, old_dropdown):
                     devicetype IS NULL 
                     AND devicedepartment IS NULL;''') #Removes any dead rows that might be "None, None"
                 conn.commit()
+                lookups.invalidate()
                 return redirect('/admin-tools/dropdowns')
             else:
-                return redirect(url_for('error', error_code=9))
+                return redirect(url_for('.error', error_code=9))
     else:
         if len(old_dropdown) < 40:
             cursor.execute(sql.SQL('SELECT * FROM dropdowns WHERE {} = %s;').format(sql.Identifier(edit_dropdown)), (old_dropdown,))
@@ -1181,11 +1351,11 @@ def dropdown_remove_record_form(edit_dropdown, old_dropdown):
                 view_style = session['view_style'],
                 active_page = 'admin_tools')
             else:
-                return redirect(url_for('error', error_code=9))
+                return redirect(url_for('.error', error_code=9))
         else:
-            return redirect(url_for('error', error_code=9))
+            return redirect(url_for('.error', error_code=9))
 
-@app.route('/error/<error_code>')
+@routes.route('/error/<error_code>')
 @logged_in_user
 def error(error_code): #Takes error code and outputs a message based on error_dict dictionary
     if request.referrer == None: #Sets the navbar link to bold depending on the category of the page that led to the error.
@@ -1213,7 +1383,7 @@ def error(error_code): #Takes error code and outputs a message based on error_di
     except:
         return redirect('/inventory')
 
-@app.route('/toggle-view')
+@routes.route('/toggle-view')
 def toggle_view(): #Changes the view between light_style and dark_style when visited and redirects to the last page visited
     try:
         if session['view_style'] == 'light_style':
@@ -1227,7 +1397,28 @@ def toggle_view(): #Changes the view between light_style and dark_style when vis
     except:
         return redirect('/login') #If page is visited by link, sends to login
 
+def create_app(): #Builds the Flask app. Database connections are not opened here, so this is safe to call before a prefork server forks its workers
+    app = Flask(__name__)
+    app.config["SESSION_PERMANENT"] = False
+    app.permanent_session_lifetime = timedelta(seconds=config.getint('flask', 'session_lifetime', fallback=2678400)) #How long an unused session is kept on the server
+    app.secret_key = config.get('flask', 'secret_key')
+    session_type = config.get('flask', 'session_type', fallback='filesystem')
+    if session_type == 'filesystem':
+        app.config["SESSION_TYPE"] = "filesystem"
+        app.config["SESSION_FILE_DIR"] = config.get('flask', 'session_file_dir')
+        Session(app)
+    else:
+        app.session_interface = sessionstore.StoreSessionInterface(sessionstore.create_store(session_type))
+    app.jinja_env.globals['asset_url'] = assets.asset_url
+    app.register_blueprint(routes)
+    app.register_blueprint(api.api)
+    app.teardown_appcontext(database.release_db_conn)
+    app.teardown_appcontext(auditlog.release_pending_logs) #Teardown functions run in reverse order, so this runs before the connection is returned
+    if config.getboolean('flask', 'compression', fallback=True):
+        app.wsgi_app = compression.CompressionMiddleware(app.wsgi_app)
+    return app
+
 if __name__ == '__main__':
-    Session(app)
-    app.run()
-    conn.close()
\ No newline at end of file
+    create_app().run(threaded=True)
+    auditlog.stop_writer()
+    database.close_pool()
\ No newline at end of file
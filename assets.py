@@ -0,0 +1,146 @@
+import argparse
+import base64
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+import urllib.request
+from flask import request, send_from_directory
+
+#Self hosted, fingerprinted static assets. Build with: python assets.py build
+#The pinned Bootstrap and Bootstrap Icons files are committed in static/vendor. The build copies every file under static/ into static/dist
+#with a hash of its contents in the name, rewriting the url() references inside stylesheets to match, and writes gzip (and, if the brotli package is
+#installed, brotli) copies next to each one. Templates link assets with asset_url(), and /assets/ serves them with a one year immutable cache lifetime.
+#Until the build has been run, asset_url() falls back to the plain /static/ file. Pages never load anything from another server.
+
+static_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+dist_dir = os.path.join(static_dir, 'dist')
+manifest_path = os.path.join(dist_dir, 'manifest.json')
+
+vendor_files = {'vendor/bootstrap/bootstrap.min.css' : ('https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/css/bootstrap.min.css',
+        'sha384-1BmE4kWBq78iYhFldvKuhfTAU6auU8tT94WrHftjDbrCEXSU1oBoqyl2QvZ6jIW3'),
+    'vendor/bootstrap-icons/bootstrap-icons.min.css' : ('https://cdn.jsdelivr.net/npm/bootstrap-icons@1.11.3/font/bootstrap-icons.min.css',
+        'sha384-XGjxtQfXaH2tnPFa9x+ruJTuLE3Aa6LhHSWRr1XeTyhezb4abCG4ccI5AkVDxqC+'),
+    'vendor/bootstrap-icons/fonts/bootstrap-icons.woff2' : ('https://cdn.jsdelivr.net/npm/bootstrap-icons@1.11.3/font/fonts/bootstrap-icons.woff2',
+        'sha384-QV+/zNG6sFIQ/qAWRxaR4sjpF37wr046d3pTS5QlogmJfbmyeiWip4YIIGmdK4pa'),
+    'vendor/bootstrap-icons/fonts/bootstrap-icons.woff' : ('https://cdn.jsdelivr.net/npm/bootstrap-icons@1.11.3/font/fonts/bootstrap-icons.woff',
+        'sha384-jiOBsoZ7OEMAq7BXRR05+D5H/5Lna7TAlXVGHhkfH68p5P1eKJTeI4KCIOfBzG/O')} #Path under static/: (pinned download URL, subresource integrity hash it must match). The files are committed in static/vendor, so the URLs are only used to restore a deleted file
+
+compressible_types = ('.css', '.js', '.svg', '.json', '.txt') #Fonts and images are already compressed
+
+css_url_pattern = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+
+cache_max_age = 31536000 #One year. Safe because a changed file gets a new name
+
+manifest = None
+
+try:
+    import brotli
+except ImportError: #Optional. Without it only gzip copies are built
+    brotli = None
+
+def get_manifest(): #Source path: fingerprinted path, read once per process
+    global manifest
+    if manifest == None:
+        try:
+            with open(manifest_path) as manifest_file:
+                manifest = json.load(manifest_file)
+        except FileNotFoundError: #Not built yet
+            manifest = {}
+    return manifest
+
+def asset_url(path): #URL for a file under static/. Registered as a template global
+    fingerprinted_path = get_manifest().get(path)
+    if fingerprinted_path != None:
+        return '/assets/' + fingerprinted_path
+    return '/static/' + path
+
+def send_asset(path): #Serves a fingerprinted file, using a precompressed copy if the browser accepts one
+    mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    for encoding, extension in (('br', '.br'), ('gzip', '.gz')):
+        if encoding in request.accept_encodings and os.path.isfile(os.path.join(dist_dir, path + extension)):
+            response = send_from_directory(dist_dir, path + extension, mimetype=mimetype, max_age=cache_max_age)
+            response.content_encoding = encoding
+            break
+    else:
+        response = send_from_directory(dist_dir, path, max_age=cache_max_age)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    response.vary.add('Accept-Encoding')
+    return response
+
+def download_vendor_files(): #Fetches any vendor file missing from static/vendor, checking it against its integrity hash. Nothing is downloaded when they are all present, so the build works without internet access
+    for path, (url, integrity) in vendor_files.items():
+        target_path = os.path.join(static_dir, path)
+        if os.path.isfile(target_path):
+            continue
+        print('Downloading {}'.format(url))
+        with urllib.request.urlopen(url, timeout=30) as download:
+            content = download.read()
+        algorithm, expected_digest = integrity.split('-', 1)
+        if base64.b64encode(hashlib.new(algorithm, content).digest()).decode() != expected_digest:
+            raise ValueError('{} does not match its integrity hash.'.format(url))
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        with open(target_path, 'wb') as target_file:
+            target_file.write(content)
+
+def fingerprint(path, content): #Inserts the first 12 hex digits of the content's SHA-256 before the extension, e.g. styles.3f2a9c1d0b7e.css
+    root, extension = posixpath.splitext(path)
+    return '{}.{}{}'.format(root, hashlib.sha256(content).hexdigest()[:12], extension)
+
+def rewrite_css_urls(path, content, fingerprinted_paths): #Points relative url() references in a stylesheet at the fingerprinted copies of the files they name
+    def replace_url(match):
+        url = match.group(2)
+        if url.startswith(('data:', 'http:', 'https:', '//', '#')):
+            return match.group(0)
+        referenced_path = posixpath.normpath(posixpath.join(posixpath.dirname(path), re.split(r'[?#]', url)[0]))
+        if referenced_path not in fingerprinted_paths:
+            return match.group(0)
+        return 'url("{}")'.format(posixpath.relpath(fingerprinted_paths[referenced_path], posixpath.dirname(path) or '.'))
+    return css_url_pattern.sub(replace_url, content.decode('utf-8')).encode('utf-8')
+
+def write_asset(path, content): #Writes a fingerprinted file and its compressed copies into static/dist
+    target_path = os.path.join(dist_dir, path)
+    os.makedirs(os.path.dirname(target_path), exist_ok=True)
+    with open(target_path, 'wb') as target_file:
+        target_file.write(content)
+    if path.endswith(compressible_types):
+        with open(target_path + '.gz', 'wb') as gzip_file:
+            gzip_file.write(gzip.compress(content, compresslevel=9, mtime=0)) #mtime=0 keeps rebuilds byte for byte identical
+        if brotli != None:
+            with open(target_path + '.br', 'wb') as brotli_file:
+                brotli_file.write(brotli.compress(content, quality=11))
+
+def build(): #Rebuilds static/dist and its manifest
+    download_vendor_files()
+    source_files = {}
+    for directory_path, directory_names, file_names in os.walk(static_dir):
+        if os.path.abspath(directory_path) == dist_dir: #Skips the build output
+            directory_names.clear()
+            continue
+        for file_name in file_names:
+            full_path = os.path.join(directory_path, file_name)
+            with open(full_path, 'rb') as source_file:
+                source_files[os.path.relpath(full_path, static_dir).replace(os.sep, '/')] = source_file.read()
+    fingerprinted_paths = {} #Files from earlier builds are left in place, so pages already rendered with their names keep working
+    for path in sorted(source_files, key=lambda path: path.endswith('.css')): #Stylesheets last, so the files they reference already have their new names
+        content = source_files[path]
+        if path.endswith('.css'):
+            content = rewrite_css_urls(path, content, fingerprinted_paths)
+        fingerprinted_paths[path] = fingerprint(path, content)
+        write_asset(fingerprinted_paths[path], content)
+    with open(manifest_path + '.tmp', 'w') as manifest_file:
+        json.dump(fingerprinted_paths, manifest_file, indent=1, sort_keys=True)
+    os.replace(manifest_path + '.tmp', manifest_path) #Running app processes never see a half written manifest
+    print('Built {} assets into {}.'.format(len(fingerprinted_paths), dist_dir))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Static asset build.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('build', help='Build the fingerprinted, precompressed copies in static/dist, downloading any missing vendor file.')
+    args = parser.parse_args()
+    if args.command == 'build':
+        build()
@@ -0,0 +1,146 @@
+import atexit
+import configparser
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+import psycopg2
+from psycopg2 import extras
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+from flask import g
+import database
+
+#Audit log (logs table) writer.
+#In the default sync mode each log row is inserted in the same transaction as the change it records, as before.
+#In async mode the rows are held until the request's transaction has committed, then put on a bounded queue. A background thread
+#per process writes the queue to the logs table in multi-row INSERTs on its own connection, and writes whatever is left when the process exits.
+
+config = configparser.ConfigParser()
+config.read('inventory.conf')
+
+insert_query = 'INSERT INTO logs(username, actiontype, database, timestamp, recordcopy) VALUES %s;'
+
+writer = None
+writer_lock = threading.Lock()
+
+def is_async(): #Tests if log rows are written by the background writer
+    return config.get('logs', 'durability', fallback='sync') == 'async'
+
+class LogWriter:
+    def __init__(self):
+        self.records = queue.Queue(maxsize=config.getint('logs', 'queue_size', fallback=10000))
+        self.batch_size = config.getint('logs', 'batch_size', fallback=500)
+        self.flush_interval = config.getfloat('logs', 'flush_interval', fallback=1)
+        self.stopping = threading.Event()
+        self.db_conn = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def put(self, record): #Queues a log row. Returns False if the queue stayed full for put_timeout seconds
+        try:
+            self.records.put(record, timeout=config.getfloat('logs', 'put_timeout', fallback=5))
+            return True
+        except queue.Full:
+            return False
+
+    def next_batch(self): #Waits up to flush_interval for the first row, then takes whatever else is already queued, up to batch_size rows
+        try:
+            batch = [self.records.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.records.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def write_batch(self, batch): #Inserts a batch, reconnecting and retrying until it succeeds so no rows are lost while the database is unreachable
+        while True:
+            try:
+                if self.db_conn == None or self.db_conn.closed:
+                    self.db_conn = database.connect()
+                with self.db_conn.cursor() as log_cursor:
+                    extras.execute_values(log_cursor, insert_query, batch, page_size=self.batch_size)
+                self.db_conn.commit()
+                return
+            except (psycopg2.OperationalError, psycopg2.InterfaceError): #Connection problem. Falls through to reconnect and retry
+                pass
+            except psycopg2.Error: #A row the database won't accept. Writes the batch one row at a time so only that row is skipped
+                self.db_conn.rollback()
+                for record in batch:
+                    try:
+                        with self.db_conn.cursor() as log_cursor:
+                            extras.execute_values(log_cursor, insert_query, [record])
+                        self.db_conn.commit()
+                    except psycopg2.Error:
+                        self.db_conn.rollback()
+                return
+            try:
+                self.db_conn.close()
+            except:
+                pass
+            self.db_conn = None
+            if self.stopping.is_set(): #Gives up at shutdown rather than hanging the exit
+                return
+            time.sleep(self.flush_interval)
+
+    def run(self):
+        while not (self.stopping.is_set() and self.records.empty()):
+            batch = self.next_batch()
+            if batch != []:
+                self.write_batch(batch)
+        if self.db_conn != None:
+            self.db_conn.close()
+
+    def stop(self): #Writes the rows still on the queue and stops the thread
+        self.stopping.set()
+        self.thread.join(config.getfloat('logs', 'shutdown_timeout', fallback=30))
+
+def get_writer(): #Starts this process's writer on first use
+    global writer
+    if writer == None:
+        with writer_lock:
+            if writer == None:
+                writer = LogWriter()
+    return writer
+
+def stop_writer(): #Called when the process exits. Flushes the queue
+    global writer
+    with writer_lock:
+        if writer != None:
+            writer.stop()
+            writer = None
+
+atexit.register(stop_writer)
+
+def reset_writer_after_fork(): #A forked child doesn't inherit the parent's thread, so it starts its own writer on first use
+    global writer, writer_lock
+    writer = None
+    writer_lock = threading.Lock()
+
+os.register_at_fork(after_in_child=reset_writer_after_fork)
+
+def create_partitions(cursor): #Creates the monthly logs partitions for this month and the next partition_months_ahead months, if they don't exist yet. Returns how many were created
+    cursor.execute('''SELECT create_logs_partitions(LOCALTIMESTAMP::DATE,
+        (date_trunc('month', LOCALTIMESTAMP) + make_interval(months => %s))::DATE);''', 
+        (config.getint('logs', 'partition_months_ahead', fallback=3),))
+    return cursor.fetchone()[0]
+
+def defer(record): #Holds a log row until the current request's transaction commits. The timestamp is taken now, when the change is made
+    g.setdefault('pending_logs', []).append(record[:3] + (datetime.now(timezone.utc),) + record[3:])
+
+def release_pending_logs(exception=None): #Registered as an app teardown function, running before the connection goes back to the pool. Queues the request's log rows if its changes were committed, and drops them if they were rolled back
+    pending_logs = g.pop('pending_logs', [])
+    if pending_logs == []:
+        return
+    db_conn = g.get('db_conn')
+    if db_conn == None or db_conn.closed or db_conn.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+        return
+    log_writer = get_writer()
+    for record in pending_logs:
+        if not log_writer.put(record): #The writer has fallen too far behind. Writes the row directly instead of losing it
+            with db_conn.cursor() as log_cursor:
+                extras.execute_values(log_cursor, insert_query, [record])
+            db_conn.commit()
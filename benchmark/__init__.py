@@ -0,0 +1,22 @@
+import configparser
+import database
+import sessionstore
+
+#Load and latency benchmark. Run from the project folder:
+#python -m benchmark seed    Fills the benchmark database with synthetic inventory, transactions, hostnames, logs and dropdowns
+#python -m benchmark run     Times the listing, search, add/edit and login routes and writes the results as JSON
+#python -m benchmark compare Shows the change in latency and throughput between two result files, e.g. from two commits
+#Everything runs against the database named in the [benchmark] section, never the app's own database.
+
+config = configparser.ConfigParser()
+config.read('inventory.conf')
+
+def get_database_name():
+    return config.get('benchmark', 'database_name', fallback='inventory_benchmark')
+
+def use_benchmark_database(): #Points every connection this process opens (pooled, unpooled and the session store's) at the benchmark database. Must run before the first connection is opened
+    database_name = get_database_name()
+    if database_name == database.config.get('postgres', 'database_name'):
+        raise ValueError('The benchmark database_name must not be the app database, since seeding replaces its contents.')
+    for module_config in (database.config, sessionstore.config):
+        module_config.set('postgres', 'database_name', database_name)
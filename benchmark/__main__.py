@@ -0,0 +1,38 @@
+import argparse
+import json
+import benchmark
+from benchmark import config, run, seed
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='python -m benchmark', description='Load and latency benchmark.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    seed_parser = subparsers.add_parser('seed', help='Create the benchmark database and fill it with synthetic data.')
+    for table, default_count in seed.default_row_counts.items():
+        seed_parser.add_argument('--' + table, type=int, help='Rows to generate (default {}).'.format(config.getint('benchmark', table + '_rows', fallback=default_count)))
+    seed_parser.add_argument('--batch-size', type=int, default=config.getint('benchmark', 'batch_size', fallback=50000), help='Rows inserted per committed statement.')
+    seed_parser.add_argument('--seed', type=float, default=config.getfloat('benchmark', 'random_seed', fallback=0.5), help='setseed value, between -1 and 1.')
+    run_parser = subparsers.add_parser('run', help='Time the app routes against the benchmark database and print the results as JSON.')
+    run_parser.add_argument('--scenario', action='append', dest='scenario_names', help='Run only this scenario. Can be repeated.')
+    run_parser.add_argument('--requests', type=int, help='Timed requests per scenario.')
+    run_parser.add_argument('--concurrency', type=int, help='Clients sending requests at the same time.')
+    run_parser.add_argument('--warmup', type=int, help='Untimed requests each client sends before a scenario.')
+    run_parser.add_argument('--url', help='Base URL of a running server to send requests to, instead of the in-process test client.')
+    run_parser.add_argument('--server-pid', type=int, action='append', default=[], help='Server process to report the peak memory of. Can be repeated.')
+    run_parser.add_argument('--output', help='File to write the JSON results to.')
+    compare_parser = subparsers.add_parser('compare', help='Compare two result files.')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    args = parser.parse_args()
+    if args.command == 'compare':
+        with open(args.baseline) as baseline_file, open(args.current) as current_file:
+            run.compare(json.load(baseline_file), json.load(current_file))
+    else:
+        benchmark.use_benchmark_database()
+        if args.command == 'seed':
+            seed.seed(seed.get_row_counts({table : getattr(args, table) for table in seed.default_row_counts}), args.batch_size, args.seed)
+        else:
+            results = run.run(args.scenario_names, args.requests, args.concurrency, args.warmup, args.url, args.server_pid)
+            if args.output != None:
+                with open(args.output, 'w') as output_file:
+                    json.dump(results, output_file, indent=1)
+            print(json.dumps(results, indent=1))
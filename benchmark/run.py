@@ -0,0 +1,260 @@
+import http.cookiejar
+import itertools
+import json
+import math
+import platform
+import random
+import resource
+import subprocess
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import date, datetime, timedelta, timezone
+from psycopg2 import sql
+import database
+from benchmark import config, get_database_name
+from benchmark.seed import departments, device_models, first_date, first_initials, hostname_prefixes, it_staff, last_names
+
+#Drives the app's routes and measures them. By default requests go through the Flask test client in this process, one client per
+#concurrent worker thread, which times the app and database without a web server. With --url they go over HTTP to a running server
+#(e.g. gunicorn -c gunicorn.conf.py with the [benchmark] database set as its database_name) so the server's own workers are measured.
+#Each scenario runs on its own for a fixed number of requests. Latency percentiles are taken over every timed request,
+#and throughput is timed requests divided by the scenario's wall clock time.
+
+class TestClientSession: #Runs requests through the Flask test client. Keeps its own session cookie
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, form_data=None): #Returns (status code, Location header). The whole body is read, including streamed ones
+        response = self.client.open(path, method=method, data=form_data, headers={'Accept-Encoding' : 'gzip'})
+        response.get_data()
+        response.close()
+        return response.status_code, response.headers.get('Location')
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, request, response_file, code, message, headers, new_url):
+        return None
+
+class HTTPSession: #Runs requests against a live server over HTTP. Keeps its own session cookie
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), NoRedirect())
+
+    def request(self, method, path, form_data=None):
+        encoded_data = urllib.parse.urlencode(form_data).encode() if form_data != None else None
+        http_request = urllib.request.Request(self.base_url + path, data=encoded_data, method=method, headers={'Accept-Encoding' : 'gzip'})
+        try:
+            with self.opener.open(http_request, timeout=120) as response:
+                response.read()
+                return response.status, response.headers.get('Location')
+        except urllib.error.HTTPError as http_error: #Also raised for the redirects NoRedirect declines to follow
+            http_error.read()
+            return http_error.code, http_error.headers.get('Location')
+
+def is_error(path, status_code, location): #Routes report most failures by redirecting to an error page, or to the login page if the session was lost. A failed login shows the login page again
+    if path == '/login/':
+        return status_code != 302 or location == None or location.rstrip('/').endswith('/login')
+    return status_code >= 400 or (location != None and ('/error/' in location or location.rstrip('/').endswith('/login')))
+
+def login_form():
+    return {'username' : config.get('benchmark', 'username', fallback='admin'), 'password' : config.get('benchmark', 'password', fallback='admin')}
+
+class Workload: #Builds the request for each scenario from the seeded row counts. Every worker thread has its own random generator
+    def __init__(self, row_counts):
+        self.row_counts = row_counts
+        self.new_barcodes = itertools.count(row_counts['inventory'] + 1000001) #Barcodes for added records, clear of the seeded ones
+        self.models = [model for models in device_models.values() for model in models]
+
+    def existing_barcode(self, rng): #Edit forms only accept barcodes and transaction ids under 6 digits
+        return rng.randint(1, max(1, min(self.row_counts['inventory'], 99999)))
+
+    def existing_transactionid(self, rng):
+        return rng.randint(1, max(1, min(self.row_counts['transactions'], 99999)))
+
+    def existing_hostname(self, rng):
+        number = rng.randint(1, max(1, self.row_counts['hostnames']))
+        return '{}-{:06d}'.format(hostname_prefixes[number % len(hostname_prefixes)], number)
+
+    def inventory_form(self, rng, barcode):
+        category = rng.choice(list(device_models))
+        return {'barcode' : barcode, 'serial' : 'BENCH{:08d}'.format(rng.randint(0, 99999999)), 'model' : rng.choice(device_models[category]),
+            'category' : category, 'department' : rng.choice(departments), 'date_purchased' : '2023-04-01', 'date_retired' : ''}
+
+    def transaction_form(self, rng):
+        return {'barcode' : self.existing_barcode(rng), 'inout' : rng.choice(['In', 'Out']), 'username' : rng.choice(it_staff),
+            'assignedto' : 'j' + rng.choice(last_names), 'hostname' : self.existing_hostname(rng) if self.row_counts['hostnames'] > 0 else '',
+            'date' : '2024-{:02d}-{:02d}'.format(rng.randint(1, 12), rng.randint(1, 28))}
+
+    def inventory_edit(self, rng):
+        barcode = self.existing_barcode(rng)
+        return 'POST', '/inventory/edit-record/{}'.format(barcode), self.inventory_form(rng, barcode)
+
+    def transactions_deep_page(self, rng): #A page of transactions sorted by date, which needs the transaction id as a tie-breaker. Seeded dates are spread evenly from first_date to today, so the cursor date is picked at least 10000 rows in
+        depth = rng.uniform(min(10000 / max(1, self.row_counts['transactions']), 1), 1)
+        first_day = date.fromisoformat(first_date)
+        cursor_date = first_day + timedelta(days=int(depth * (date.today() - first_day).days))
+        return 'GET', '/transactions/?sortby=Date&after=' + urllib.parse.quote(json.dumps([cursor_date.isoformat(), self.existing_transactionid(rng)])), None
+
+    def scenarios(self): #Scenario name: function(rng) returning (method, path, form data). Logging in again keeps the client logged in, so login can run alongside the rest
+        return {'login' : lambda rng: ('POST', '/login/', login_form()),
+            'inventory_list' : lambda rng: ('GET', '/inventory/', None),
+            'inventory_list_deep_page' : lambda rng: ('GET', '/inventory/?after=' + urllib.parse.quote(json.dumps([self.existing_barcode(rng)])), None),
+            'transactions_list' : lambda rng: ('GET', '/transactions/', None),
+            'transactions_list_deep_page' : self.transactions_deep_page,
+            'hostnames_list' : lambda rng: ('GET', '/hostnames', None),
+            'logs_list' : lambda rng: ('GET', '/admin-tools/logs/', None),
+            'inventory_search_barcode' : lambda rng: ('GET', '/inventory/search/barcode/{}'.format(self.existing_barcode(rng)), None),
+            'inventory_search_model' : lambda rng: ('GET', '/inventory/search/model/' + urllib.parse.quote(rng.choice(self.models)), None),
+            'transactions_search_assignedto' : lambda rng: ('GET', '/transactions/search/assignedto/' + rng.choice(first_initials) + rng.choice(last_names), None),
+            'transactions_search_date' : lambda rng: ('GET', '/transactions/search/date/{}-{:02d}-{:02d}'.format(rng.randint(2015, 2024), rng.randint(1, 12), rng.randint(1, 28)), None),
+            'hostnames_search' : lambda rng: ('GET', '/hostnames/search/hostname/' + self.existing_hostname(rng)[-4:], None),
+            'logs_search_username' : lambda rng: ('GET', '/admin-tools/logs/search/username/' + rng.choice(it_staff), None),
+            'global_search' : lambda rng: ('GET', '/search?q=' + urllib.parse.quote(rng.choice([rng.choice(self.models), rng.choice(last_names), self.existing_hostname(rng)])), None),
+            'inventory_add' : lambda rng: ('POST', '/inventory/add-record', self.inventory_form(rng, next(self.new_barcodes))),
+            'inventory_edit' : self.inventory_edit,
+            'transactions_add' : lambda rng: ('POST', '/transactions/add-record', self.transaction_form(rng)),
+            'transactions_edit' : lambda rng: ('POST', '/transactions/edit-record/{}'.format(self.existing_transactionid(rng)), self.transaction_form(rng))}
+
+def login(client): #Every client logs in once before the timed requests, loading the login page first as a browser would
+    client.request('GET', '/login/')
+    status_code, location = client.request('POST', '/login/', login_form())
+    if is_error('/login/', status_code, location):
+        raise ValueError('The benchmark login failed. Set username and password in the [benchmark] section.')
+
+def percentile(sorted_values, fraction): #Nearest rank percentile of an already sorted list: the smallest value with at least fraction of the values at or below it
+    if sorted_values == []:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, max(0, math.ceil(fraction * len(sorted_values)) - 1))]
+
+def summarize(latencies, errors, elapsed):
+    latencies.sort()
+    return {'requests' : len(latencies),
+        'errors' : errors,
+        'p50_ms' : round(percentile(latencies, 0.50) * 1000, 2) if latencies != [] else None,
+        'p95_ms' : round(percentile(latencies, 0.95) * 1000, 2) if latencies != [] else None,
+        'p99_ms' : round(percentile(latencies, 0.99) * 1000, 2) if latencies != [] else None,
+        'max_ms' : round(latencies[-1] * 1000, 2) if latencies != [] else None,
+        'mean_ms' : round(sum(latencies) / len(latencies) * 1000, 2) if latencies != [] else None,
+        'throughput_rps' : round(len(latencies) / elapsed, 2) if elapsed > 0 else None,
+        'process_peak_rss_kb' : get_peak_rss_kb()} #The process's high water mark so far, not this scenario's own. It can only grow, so it also covers every scenario run before this one
+
+def get_peak_rss_kb(): #High water mark of this process's resident memory since it started. On Linux ru_maxrss is in kilobytes
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def get_server_peak_rss_kb(pid): #VmHWM of a server process, for --url runs. Linux only
+    try:
+        with open('/proc/{}/status'.format(pid)) as status_file:
+            for line in status_file:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+def run_scenario(clients, request_for, request_count, warmup_count, random_seed): #Splits request_count requests across one thread per client. Returns the summary
+    latencies = []
+    errors = [0]
+    results_lock = threading.Lock()
+    start_barrier = threading.Barrier(len(clients) + 1)
+
+    def worker(client_number, client):
+        rng = random.Random('{}-{}'.format(random_seed, client_number)) #Same requests on every run with the same seed and concurrency
+        worker_count = request_count // len(clients) + (1 if client_number < request_count % len(clients) else 0)
+        for request_number in range(warmup_count):
+            client.request(*request_for(rng))
+        start_barrier.wait()
+        worker_latencies = []
+        worker_errors = 0
+        for request_number in range(worker_count):
+            method, path, form_data = request_for(rng)
+            started = time.perf_counter()
+            try:
+                status_code, location = client.request(method, path, form_data)
+                failed = is_error(path, status_code, location)
+            except Exception:
+                failed = True
+            worker_latencies.append(time.perf_counter() - started)
+            worker_errors += failed
+        with results_lock:
+            latencies.extend(worker_latencies)
+            errors[0] += worker_errors
+
+    threads = [threading.Thread(target=worker, args=(client_number, client)) for client_number, client in enumerate(clients)]
+    for thread in threads:
+        thread.start()
+    start_barrier.wait() #Timing starts once every worker has warmed up
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    return summarize(latencies, errors[0], time.perf_counter() - started)
+
+def get_row_counts(): #Rows in each table of the benchmark database, recorded with the results
+    conn = database.connect()
+    cursor = conn.cursor()
+    row_counts = {}
+    for table in ('inventory', 'transactions', 'hostnames', 'logs', 'dropdowns'):
+        cursor.execute(sql.SQL('SELECT count(*) FROM {};').format(sql.Identifier(table)))
+        row_counts[table] = cursor.fetchone()[0]
+    conn.close()
+    return row_counts
+
+def get_commit(): #Commit the results were measured on, so result files from different commits can be told apart
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], capture_output=True, text=True, check=True).stdout.strip() != ''
+        return commit + ('-dirty' if dirty else '')
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(scenario_names=None, request_count=None, concurrency=None, warmup_count=None, base_url=None, server_pids=(), random_seed=None): #Runs the scenarios and returns the results
+    request_count = request_count or config.getint('benchmark', 'requests', fallback=200)
+    concurrency = concurrency or config.getint('benchmark', 'concurrency', fallback=4)
+    warmup_count = warmup_count if warmup_count != None else config.getint('benchmark', 'warmup_requests', fallback=5)
+    random_seed = random_seed if random_seed != None else config.getfloat('benchmark', 'random_seed', fallback=0.5)
+    row_counts = get_row_counts()
+    workload = Workload(row_counts)
+    scenarios = workload.scenarios()
+    if scenario_names == None:
+        scenario_names = list(scenarios)
+    unknown_names = [name for name in scenario_names if name not in scenarios]
+    if unknown_names != []:
+        raise ValueError('Unknown scenarios: {}. Choose from: {}'.format(', '.join(unknown_names), ', '.join(scenarios)))
+    if base_url == None:
+        from app import create_app #Imported here so --url runs don't build the app in the load generator
+        app = create_app()
+        clients = [TestClientSession(app) for client_number in range(concurrency)]
+    else:
+        clients = [HTTPSession(base_url) for client_number in range(concurrency)]
+    for client in clients:
+        login(client)
+    results = {'commit' : get_commit(),
+        'started_at' : datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python' : platform.python_version(),
+        'target' : base_url or 'test_client',
+        'database' : get_database_name(),
+        'row_counts' : row_counts,
+        'settings' : {'requests' : request_count, 'concurrency' : concurrency, 'warmup_requests' : warmup_count, 'seed' : random_seed},
+        'scenarios' : {}}
+    for name in scenario_names:
+        print('Running {}'.format(name))
+        results['scenarios'][name] = run_scenario(clients, scenarios[name], request_count, warmup_count, random_seed)
+    results['process_peak_rss_kb'] = get_peak_rss_kb() #In a test client run this includes the app. In a --url run it is only the load generator, and the server's is under server_peak_rss_kb
+    if server_pids:
+        results['server_peak_rss_kb'] = {str(pid) : get_server_peak_rss_kb(pid) for pid in server_pids}
+    return results
+
+def compare(baseline, current): #Prints the change in p50, p95, p99 and throughput for each scenario in both result files
+    print('{:<32} {:>16} {:>16} {:>16} {:>16}'.format('scenario', 'p50 ms', 'p95 ms', 'p99 ms', 'req/s'))
+    for name, current_summary in current['scenarios'].items():
+        baseline_summary = baseline['scenarios'].get(name)
+        if baseline_summary == None:
+            continue
+        columns = []
+        for measure in ('p50_ms', 'p95_ms', 'p99_ms', 'throughput_rps'):
+            if baseline_summary[measure] in (None, 0) or current_summary[measure] == None:
+                columns.append('n/a')
+            else:
+                columns.append('{} ({:+.0f}%)'.format(current_summary[measure], (current_summary[measure] / baseline_summary[measure] - 1) * 100))
+        print('{:<32} {:>16} {:>16} {:>16} {:>16}'.format(name, *columns))
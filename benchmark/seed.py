@@ -0,0 +1,127 @@
+import time
+from psycopg2 import sql
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+import database
+import migrations
+from benchmark import config, get_database_name
+
+#Synthetic data for the benchmark database. Rows are generated inside PostgreSQL with generate_series and random(), seeded with setseed,
+#so the same settings always produce the same data. Each table is inserted in batches of batch_size rows with its triggers enabled,
+#so search_documents, last_hostname and the change versions end up as they would after real use.
+
+device_models = {'Laptop' : ['Latitude 5420', 'Latitude 7430', 'ThinkPad T14', 'ThinkPad X1 Carbon', 'EliteBook 840', 'MacBook Air', 'MacBook Pro 14'],
+    'Desktop' : ['OptiPlex 7090', 'OptiPlex 5000', 'ThinkCentre M70q', 'EliteDesk 800', 'iMac 24'],
+    'Monitor' : ['P2422H', 'U2723QE', 'ThinkVision T24i', 'E24 G5'],
+    'Tablet' : ['iPad 10th Gen', 'iPad Air', 'Galaxy Tab S8', 'Surface Pro 9'],
+    'Phone' : ['iPhone 14', 'iPhone SE', 'Galaxy S23', 'Pixel 7'],
+    'Printer' : ['LaserJet Pro M404', 'Color LaserJet M479', 'WorkForce WF-7840'],
+    'Docking Station' : ['WD19TB', 'ThinkPad Universal USB-C Dock', 'USB-C Dock G5'],
+    'Projector' : ['PowerLite 2250U', 'VPL-PHZ61']} #Category: models. Categories become the devicetype dropdown
+
+departments = ['Accounting', 'Customer Support', 'Engineering', 'Facilities', 'Finance', 'Human Resources', 'IT', 'Legal', 'Marketing', 'Operations', 'Research', 'Sales']
+
+hostname_prefixes = ['ACC', 'CS', 'ENG', 'FAC', 'FIN', 'HR', 'IT', 'LEG', 'MKT', 'OPS', 'RND', 'SAL'] #Hostnames look like ENG-004217
+
+first_initials = list('abcdefghijklmnoprstw')
+
+last_names = ['adams', 'baker', 'brown', 'clark', 'davis', 'evans', 'garcia', 'green', 'hall', 'harris', 'jackson', 'johnson', 'jones', 'king', 'lee',
+    'lewis', 'lopez', 'martin', 'miller', 'moore', 'nguyen', 'patel', 'robinson', 'smith', 'taylor', 'thomas', 'walker', 'white', 'wilson', 'young'] #Assigned-to names are an initial and a last name, e.g. jsmith
+
+it_staff = ['akhan', 'bwright', 'cmorales', 'dchen', 'eokafor', 'fmueller'] #Usernames that record transactions and appear in logs
+
+first_date = '2015-01-01' #Purchases and transactions are spread from here to today
+
+logs_months = 24 #Log timestamps are spread over this many months up to now
+
+default_row_counts = {'inventory' : 100000, 'transactions' : 2000000, 'hostnames' : 20000, 'logs' : 5000000}
+
+def get_row_counts(overrides): #Rows to generate per table: command line value, then the [benchmark] section, then the default
+    return {table : overrides.get(table) if overrides.get(table) != None else config.getint('benchmark', table + '_rows', fallback=default_count)
+        for table, default_count in default_row_counts.items()}
+
+def hostname_expression(number_sql): #The generated hostname for a number from 1 to the hostname count. Used by both the hostnames and transactions inserts, so every transaction hostname exists
+    return sql.SQL("(%(hostname_prefixes)s::TEXT[])[1 + ({0}) %% cardinality(%(hostname_prefixes)s::TEXT[])] || '-' || lpad(({0})::TEXT, 6, '0')").format(number_sql)
+
+def random_item(array_name): #A random element of one of the text array parameters
+    return sql.SQL('(%({0})s::TEXT[])[1 + floor(random() * cardinality(%({0})s::TEXT[]))::INT]').format(sql.SQL(array_name))
+
+def random_person():
+    return sql.SQL('{} || {}').format(random_item('first_initials'), random_item('last_names'))
+
+def random_date():
+    return sql.SQL("(DATE '{}' + floor(random() * (CURRENT_DATE - DATE '{}' + 1))::INT)").format(sql.SQL(first_date), sql.SQL(first_date))
+
+table_inserts = {'hostnames' : sql.SQL('''INSERT INTO hostnames(hostname, description, active)
+        SELECT {hostname}, {category} || ' in ' || {department}, random() < 0.85
+        FROM generate_series(%(first_row)s, %(last_row)s) AS number;''').format(
+            hostname=hostname_expression(sql.SQL('number')), category=random_item('categories'), department=random_item('departments')),
+    'inventory' : sql.SQL('''INSERT INTO inventory(barcode, serial, model, category, department, date_purchased, date_retired)
+        SELECT number, CASE WHEN random() < 0.97 THEN upper(substr(md5(random()::TEXT), 1, 12)) END,
+            (%(models)s::TEXT[])[model_index], (%(model_categories)s::TEXT[])[model_index], {department}, date_purchased,
+            CASE WHEN random() < 0.15 THEN LEAST(date_purchased + (365 + floor(random() * 1825))::INT, CURRENT_DATE) END
+        FROM (SELECT number, 1 + floor(random() * cardinality(%(models)s::TEXT[]))::INT AS model_index, {date} AS date_purchased
+            FROM generate_series(%(first_row)s, %(last_row)s) AS number) AS generated;''').format(
+            department=random_item('departments'), date=random_date()),
+    'transactions' : sql.SQL('''INSERT INTO transactions(barcode, inout, username, assignedto, hostname, date)
+        SELECT 1 + floor(random() * %(inventory_rows)s)::INT, CASE WHEN random() < 0.5 THEN 'Out' ELSE 'In' END,
+            CASE WHEN random() < 0.9 THEN {staff} END, {person},
+            CASE WHEN random() < 0.7 AND %(hostnames_rows)s > 0 THEN {hostname} END, {date}
+        FROM (SELECT 1 + floor(random() * %(hostnames_rows)s)::INT AS hostname_number
+            FROM generate_series(%(first_row)s, %(last_row)s) AS number) AS generated;''').format(
+            staff=random_item('it_staff'), person=random_person(), hostname=hostname_expression(sql.SQL('hostname_number')), date=random_date()),
+    'logs' : sql.SQL('''INSERT INTO logs(username, actiontype, database, timestamp, recordcopy)
+        SELECT {staff}, (ARRAY['Add', 'Add', 'Edit', 'Edit', 'Edit', 'Remove', 'Import'])[1 + floor(random() * 7)::INT],
+            (ARRAY['Inventory', 'Transactions', 'Transactions', 'Transactions', 'Hostnames', 'Dropdowns'])[1 + floor(random() * 6)::INT],
+            LOCALTIMESTAMP - random() * make_interval(months => %(logs_months)s),
+            '(' || concat_ws(',', 1 + floor(random() * GREATEST(%(inventory_rows)s, 1))::INT, upper(substr(md5(random()::TEXT), 1, 12)),
+                {model}, {department}, {date}) || ')'
+        FROM generate_series(%(first_row)s, %(last_row)s) AS number;''').format(
+            staff=random_item('it_staff'), model=random_item('models'), department=random_item('departments'), date=random_date())} #Table: batch insert of rows first_row to last_row. Hostnames go first, since transactions reference them
+
+def create_database(): #Creates the benchmark database if it doesn't exist yet, then brings its schema up to date
+    admin_conn = database.connect(database='postgres')
+    admin_conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+    admin_cursor = admin_conn.cursor()
+    admin_cursor.execute('SELECT 1 FROM pg_database WHERE datname = %s;', (get_database_name(),))
+    if admin_cursor.fetchone() == None:
+        print('Creating database {}'.format(get_database_name()))
+        admin_cursor.execute(sql.SQL('CREATE DATABASE {}').format(sql.Identifier(get_database_name())))
+    admin_conn.close()
+    migrations.migrate()
+
+def seed(row_counts, batch_size, random_seed): #Replaces the benchmark database's rows with freshly generated ones. Returns the seconds each table took
+    create_database()
+    conn = database.connect()
+    cursor = conn.cursor()
+    cursor.execute('TRUNCATE transactions, inventory, hostnames, logs, dropdowns RESTART IDENTITY;')
+    categories = list(device_models)
+    cursor.execute('INSERT INTO dropdowns(devicetype, devicedepartment) SELECT * FROM unnest(%s::TEXT[], %s::TEXT[]);', (categories, departments)) #Fills both lists, padding the shorter one with NULLs as the dropdowns page does
+    cursor.execute('''SELECT create_logs_partitions((LOCALTIMESTAMP - make_interval(months => %s))::DATE,
+        (date_trunc('month', LOCALTIMESTAMP) + make_interval(months => %s))::DATE);''',
+        (logs_months, config.getint('logs', 'partition_months_ahead', fallback=3))) #So the generated logs land in monthly partitions instead of logs_default
+    conn.commit()
+    query_params = {'categories' : categories,
+        'models' : [model for category in categories for model in device_models[category]],
+        'model_categories' : [category for category in categories for model in device_models[category]],
+        'departments' : departments,
+        'hostname_prefixes' : hostname_prefixes,
+        'first_initials' : first_initials,
+        'last_names' : last_names,
+        'it_staff' : it_staff,
+        'logs_months' : logs_months,
+        'inventory_rows' : row_counts['inventory'],
+        'hostnames_rows' : row_counts['hostnames']}
+    timings = {}
+    for table in ('hostnames', 'inventory', 'transactions', 'logs'):
+        started = time.perf_counter()
+        cursor.execute('SELECT setseed(%s);', (random_seed,)) #Reseeded per table, so changing one table's row count doesn't change the others' data
+        for first_row in range(1, row_counts[table] + 1, batch_size):
+            cursor.execute(table_inserts[table], dict(query_params, first_row=first_row, last_row=min(first_row + batch_size - 1, row_counts[table])))
+            conn.commit()
+            print('{}: {} of {} rows'.format(table, min(first_row + batch_size - 1, row_counts[table]), row_counts[table]), end='\r')
+        timings[table] = round(time.perf_counter() - started, 2)
+        print('{}: {} rows in {} seconds'.format(table, row_counts[table], timings[table]))
+    conn.autocommit = True
+    cursor.execute('VACUUM ANALYZE;') #Fresh statistics and visibility maps, so the first timed queries get the same plans as later runs
+    conn.close()
+    return timings
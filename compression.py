@@ -0,0 +1,105 @@
+import configparser
+import zlib
+
+#WSGI middleware that compresses text responses (pages, CSV exports, JSON) for browsers that accept it.
+#Brotli is used if the brotli package is installed and the browser accepts it, otherwise gzip. Responses with a known length under
+#compression_min_size are sent as they are. Streamed responses (full listings and exports) have no length and are compressed piece by piece,
+#each piece flushed so the browser can show the rows as they arrive.
+
+config = configparser.ConfigParser()
+config.read('inventory.conf')
+
+compressible_types = ('text/html', 'text/css', 'text/csv', 'text/plain', 'application/json', 'application/javascript', 'text/javascript')
+
+try:
+    import brotli
+except ImportError: #Optional. Without it responses are only gzipped
+    brotli = None
+
+def choose_encoding(accept_encoding): #Picks br or gzip from the Accept-Encoding header, or None if the browser accepts neither
+    accepted = {}
+    for part in accept_encoding.lower().split(','):
+        name, _, parameters = part.strip().partition(';')
+        quality = 1.0
+        if parameters.strip().startswith('q='):
+            try:
+                quality = float(parameters.strip()[2:])
+            except ValueError:
+                pass
+        accepted[name.strip()] = quality
+    for encoding in (('br',) if brotli != None else ()) + ('gzip',):
+        if accepted.get(encoding, accepted.get('*', 0)) > 0:
+            return encoding
+    return None
+
+class GzipCompressor:
+    def __init__(self, level):
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, 31) #wbits 31 writes the gzip header and trailer
+
+    def compress(self, data):
+        return self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self.compressor.flush()
+
+class BrotliCompressor:
+    def __init__(self, level):
+        self.compressor = brotli.Compressor(quality=min(level, 11))
+
+    def compress(self, data):
+        return self.compressor.process(data) + self.compressor.flush()
+
+    def finish(self):
+        return self.compressor.finish()
+
+compressors = {'gzip' : GzipCompressor, 'br' : BrotliCompressor}
+
+class CompressionMiddleware:
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+        self.min_size = config.getint('flask', 'compression_min_size', fallback=1024)
+        self.level = config.getint('flask', 'compression_level', fallback=6)
+
+    def __call__(self, environ, start_response):
+        encoding = choose_encoding(environ.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding == None or environ.get('REQUEST_METHOD') == 'HEAD':
+            return self.wsgi_app(environ, start_response)
+        chosen = {}
+
+        def compressing_start_response(status, headers, exc_info=None):
+            header_values = {name.lower() : value for name, value in headers}
+            content_type = header_values.get('content-type', '').split(';')[0].strip().lower()
+            content_length = header_values.get('content-length')
+            if (status.startswith('200') and content_type in compressible_types
+                and 'content-encoding' not in header_values and 'content-range' not in header_values
+                and (content_length == None or int(content_length) >= self.min_size)):
+                headers = [(name, value) for name, value in headers if name.lower() not in ('content-length', 'etag')]
+                headers.append(('Content-Encoding', encoding))
+                if 'etag' in header_values: #The compressed body is different bytes, so only a weak ETag still describes it
+                    etag = header_values['etag']
+                    headers.append(('ETag', etag if etag.startswith('W/') else 'W/' + etag))
+                chosen['compressor'] = compressors[encoding](self.level)
+            if content_type in compressible_types:
+                vary = header_values.get('vary')
+                if vary == None:
+                    headers.append(('Vary', 'Accept-Encoding'))
+                elif 'accept-encoding' not in vary.lower():
+                    headers = [(name, value) for name, value in headers if name.lower() != 'vary'] + [('Vary', vary + ', Accept-Encoding')]
+            return start_response(status, headers, exc_info)
+
+        body = self.wsgi_app(environ, compressing_start_response)
+        if 'compressor' not in chosen:
+            return body
+        return self.compress_body(body, chosen['compressor'])
+
+    def compress_body(self, body, compressor): #Compresses the body as the app produces it. Closes the app's iterable when done, as WSGI requires
+        try:
+            for chunk in body:
+                if chunk:
+                    compressed_chunk = compressor.compress(chunk)
+                    if compressed_chunk:
+                        yield compressed_chunk
+            yield compressor.finish()
+        finally:
+            if hasattr(body, 'close'):
+                body.close()
@@ -0,0 +1,148 @@
+import configparser
+import os
+import threading
+import time
+import psycopg2
+from psycopg2 import pool
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_UNKNOWN
+from flask import g
+
+#Connection pool shared by every request handled in this process
+
+config = configparser.ConfigParser()
+config.read('inventory.conf')
+
+connection_pool = None
+pool_lock = threading.Lock() #Stops two threads from building the pool at the same time
+last_used = {} #id(connection): time the connection was last returned to the pool. Used to decide when a health check is due
+
+def connect(database=None): #Opens a single unpooled connection. Used by scripts that run outside of a request (init.py and the CLI tools)
+    return psycopg2.connect(database=database or config.get('postgres', 'database_name'),
+        user=config.get('postgres', 'user'),
+        password=config.get('postgres', 'password'),
+        host=config.get('postgres', 'host_ip'),
+        port=config.get('postgres', 'host_port'))
+
+class BlockingConnectionPool(pool.ThreadedConnectionPool): #ThreadedConnectionPool raises PoolError as soon as every connection is checked out. This waits for one to be returned instead
+    def __init__(self, minconn, maxconn, timeout, *args, **kwargs):
+        self.checkout_slots = threading.BoundedSemaphore(maxconn)
+        self.timeout = timeout
+        super().__init__(minconn, maxconn, *args, **kwargs)
+
+    def getconn(self, key=None):
+        if not self.checkout_slots.acquire(timeout=self.timeout): #Waits up to pool_timeout seconds for a free connection
+            raise pool.PoolError('Timed out waiting for a database connection.')
+        try:
+            return super().getconn(key)
+        except:
+            self.checkout_slots.release()
+            raise
+
+    def putconn(self, conn=None, key=None, close=False):
+        try:
+            super().putconn(conn, key, close)
+        finally:
+            self.checkout_slots.release()
+
+    def _putconn(self, conn, key=None, close=False): #Runs with the pool's lock held. psycopg2 closes a returned connection whenever minconn are already idle, so a worker busier than minconn would reconnect on most requests. This keeps every returned connection open, up to maxconn, and only closes broken ones
+        if self.closed:
+            raise pool.PoolError('connection pool is closed')
+        if key == None:
+            key = self._rused.get(id(conn))
+            if key == None:
+                raise pool.PoolError('trying to put unkeyed connection')
+        if close or conn.closed or conn.info.transaction_status == TRANSACTION_STATUS_UNKNOWN:
+            conn.close()
+        else:
+            if conn.info.transaction_status != TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+            self._pool.append(conn)
+        del self._used[key]
+        del self._rused[id(conn)]
+
+def get_pool(): #Builds the pool on first use using the sizes given in inventory.conf
+    global connection_pool
+    if connection_pool == None:
+        with pool_lock:
+            if connection_pool == None:
+                connection_pool = BlockingConnectionPool(config.getint('postgres', 'pool_min_connections', fallback=1),
+                    config.getint('postgres', 'pool_max_connections', fallback=10),
+                    config.getfloat('postgres', 'pool_timeout', fallback=30),
+                    database=config.get('postgres', 'database_name'),
+                    user=config.get('postgres', 'user'),
+                    password=config.get('postgres', 'password'),
+                    host=config.get('postgres', 'host_ip'),
+                    port=config.get('postgres', 'host_port'))
+    return connection_pool
+
+def reset_pool_after_fork(): #Runs in a newly forked child process. The child must never use the parent's sockets, so the inherited pool is dropped without closing it and a new one is built on first use
+    global connection_pool, pool_lock
+    connection_pool = None
+    pool_lock = threading.Lock()
+    last_used.clear()
+
+os.register_at_fork(after_in_child=reset_pool_after_fork)
+
+def close_pool(): #Closes every pooled connection. Called when the app shuts down
+    global connection_pool
+    with pool_lock:
+        if connection_pool != None:
+            connection_pool.closeall()
+            connection_pool = None
+            last_used.clear()
+
+def connection_is_healthy(db_conn): #Tests if a pooled connection can still be used
+    if db_conn.closed or db_conn.get_transaction_status() == TRANSACTION_STATUS_UNKNOWN: #Connection was closed or the socket to the server is gone
+        return False
+    idle_seconds = time.monotonic() - last_used.get(id(db_conn), 0)
+    if idle_seconds < config.getfloat('postgres', 'pool_health_check_interval', fallback=30): #Recently used connections are trusted without a round trip
+        return True
+    try:
+        with db_conn.cursor() as health_cursor:
+            health_cursor.execute('SELECT 1;')
+        db_conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+def checkout_connection(): #Takes a connection out of the pool, replacing any dead connections it finds along the way
+    connection_pool = get_pool()
+    for attempt in range(config.getint('postgres', 'pool_max_connections', fallback=10) + 1):
+        db_conn = connection_pool.getconn()
+        if connection_is_healthy(db_conn):
+            return db_conn
+        last_used.pop(id(db_conn), None)
+        connection_pool.putconn(db_conn, close=True) #Discards the dead connection. The pool opens a fresh one on the next getconn
+    raise pool.PoolError('Could not get a working database connection.')
+
+def return_connection(db_conn): #Puts a connection back in the pool. Anything left uncommitted is rolled back so the next request starts clean
+    connection_pool = get_pool()
+    try:
+        if not db_conn.closed and db_conn.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+            db_conn.rollback()
+    except psycopg2.Error:
+        pass
+    if db_conn.closed or db_conn.get_transaction_status() == TRANSACTION_STATUS_UNKNOWN:
+        last_used.pop(id(db_conn), None)
+        connection_pool.putconn(db_conn, close=True)
+    else:
+        last_used[id(db_conn)] = time.monotonic()
+        connection_pool.putconn(db_conn)
+
+def get_db_conn(): #Returns the connection checked out for the current request, checking one out on first use
+    if 'db_conn' not in g:
+        g.db_conn = checkout_connection()
+    return g.db_conn
+
+def get_db_cursor(): #Returns the cursor for the current request
+    if 'db_cursor' not in g:
+        g.db_cursor = get_db_conn().cursor()
+    return g.db_cursor
+
+def release_db_conn(exception=None): #Registered as an app teardown function. Returns the request's connection to the pool
+    db_cursor = g.pop('db_cursor', None)
+    if db_cursor != None and not db_cursor.closed:
+        db_cursor.close()
+    db_conn = g.pop('db_conn', None)
+    if db_conn != None:
+        return_connection(db_conn)
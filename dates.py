@@ -0,0 +1,31 @@
+from datetime import datetime, timedelta
+
+#Date parsing shared by the search pages and the JSON API
+
+def get_date_range(criteria, include_time=False): #Turns a searched date (2021, 2021-06 or 2021-06-15, plus hours, minutes and seconds if include_time) or a range of them (2021-01..2021-06) into the [start, end) range it covers. Returns (None, None) if the criteria isn't a valid date
+    if '..' in criteria:
+        first, last = criteria.split('..', 1)
+        start = get_date_range(first.strip(), include_time)[0]
+        end = get_date_range(last.strip(), include_time)[1]
+        if start == None or end == None or start >= end:
+            return None, None
+        return start, end
+    validation_blocks = ['%Y', '-%m', '-%d', ' %H', ':%M', ':%S'] #Used to create the guide for input validation
+    if not include_time:
+        validation_blocks = validation_blocks[:3]
+    criteria_listform = criteria.replace(' ', '-').replace(':', '-').split('-') #Replaces all separating characters with hyphens and splits each value into a list using those hyphens
+    if len(criteria_listform) > len(validation_blocks):
+        return None, None
+    try:
+        start = datetime.strptime(criteria, ''.join(validation_blocks[:len(criteria_listform)])) #Validates the input and fills in the unspecified values
+        if len(criteria_listform) == 1: #Year
+            end = start.replace(year=start.year + 1)
+        elif len(criteria_listform) == 2: #Month
+            end = (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+        else: #Day, hour, minute or second
+            end = start + [timedelta(days=1), timedelta(hours=1), timedelta(minutes=1), timedelta(seconds=1)][len(criteria_listform) - 3]
+    except:
+        return None, None
+    if not include_time:
+        return start.date(), end.date()
+    return start, end
@@ -0,0 +1,125 @@
+import configparser
+import threading
+import time
+from ldap3 import Server, Connection, NONE, NTLM, SIMPLE, SYNC, RESTARTABLE, MOCK_SYNC
+from ldap3.core.exceptions import LDAPException, LDAPBindError
+from ldap3.utils.conv import escape_filter_chars
+
+#LDAP login checks.
+#Each login binds as the user once to check the password. The person and admin group lookups then go through one service connection per process
+#that stays bound between logins (if service_user is set), instead of on a new connection for every login.
+#The admin group's members are cached as a set of DNs for admin_cache_seconds. A login that isn't in the cached set re-reads the group early
+#(at most once every admin_refresh_interval seconds), so someone just added to the group doesn't have to wait for the cache to expire.
+
+config = configparser.ConfigParser()
+config.read('inventory.conf')
+
+client_strategies = {'SYNC' : SYNC, 'RESTARTABLE' : RESTARTABLE, 'MOCK_SYNC' : MOCK_SYNC} #RESTARTABLE reconnects by itself if the server drops the connection. MOCK_SYNC answers from an in-memory directory, for trying logins offline
+
+authentication_methods = {'NTLM' : NTLM, 'SIMPLE' : SIMPLE}
+
+server = None
+service_conn = None
+service_lock = threading.Lock() #An ldap3 connection can only run one operation at a time
+admin_members = frozenset() #Lower case DNs of the admin group's members
+admin_members_read = None #time.monotonic() of the last group read. None forces a read
+mock_directory_loaded = False
+
+def get_strategy():
+    return client_strategies[config.get('ldap', 'client_strategy', fallback='RESTARTABLE')]
+
+def get_server(): #Created once per process. get_info=NONE skips reading the server's schema on every bind
+    global server
+    if server == None:
+        server = Server(config.get('ldap', 'ldap_server_ip'), port=config.getint('ldap', 'ldap_server_port'), use_ssl=True,
+            get_info=NONE, connect_timeout=config.getint('ldap', 'connect_timeout', fallback=5))
+    return server
+
+def load_mock_directory(ldap_conn): #Fills the in-memory directory, which ldap3 keeps on the shared Server, from mock_directory_file. Entries already there are left as they are
+    global mock_directory_loaded
+    if not mock_directory_loaded and config.get('ldap', 'mock_directory_file', fallback='') != '':
+        ldap_conn.strategy.entries_from_json(config.get('ldap', 'mock_directory_file'))
+    mock_directory_loaded = True
+
+def bind(user, password, client_strategy): #Opens a connection bound as user. Raises LDAPBindError if the credentials are wrong
+    ldap_conn = Connection(get_server(), user=user, password=password,
+        authentication=authentication_methods[config.get('ldap', 'authentication', fallback='NTLM')],
+        client_strategy=client_strategy)
+    if client_strategy == MOCK_SYNC:
+        load_mock_directory(ldap_conn)
+    if not ldap_conn.bind(): #Bound explicitly rather than with auto_bind, which the mock strategy skips
+        ldap_conn.unbind()
+        raise LDAPBindError(ldap_conn.last_error)
+    return ldap_conn
+
+def get_service_connection(): #Returns the shared service connection, binding it on first use. Must be called with service_lock held
+    global service_conn
+    if service_conn == None or service_conn.closed:
+        service_conn = bind(config.get('ldap', 'service_user'), config.get('ldap', 'service_password'), get_strategy())
+    return service_conn
+
+def close_service_connection(): #Drops the shared connection after an error so the next login binds a fresh one
+    global service_conn
+    try:
+        service_conn.unbind()
+    except:
+        pass
+    service_conn = None
+
+def get_user_dir():
+    return config.get('ldap', 'ldap_user_dir').replace('"', '')
+
+def find_user_dn(lookup_conn, username): #Returns the DN of the person with the given sAMAccountName, or None
+    lookup_conn.search(get_user_dir(), '(&(objectcategory=person)(sAMAccountName={}))'.format(escape_filter_chars(username)),
+        attributes=[])
+    if lookup_conn.entries == []:
+        return None
+    return lookup_conn.entries[0].entry_dn
+
+def read_admin_members(lookup_conn): #Reads the admin group's member DNs into the cache
+    global admin_members, admin_members_read
+    lookup_conn.search(get_user_dir(), '(&(objectcategory=group)(CN={}))'.format(escape_filter_chars(config.get('ldap', 'admin_group_cn'))),
+        attributes=['member'])
+    members = set()
+    for entry in lookup_conn.entries:
+        members.update(member.lower() for member in entry.entry_attributes_as_dict.get('member', []))
+    admin_members = frozenset(members)
+    admin_members_read = time.monotonic()
+
+def is_admin(lookup_conn, user_dn): #Checks the cached admin group membership, re-reading the group if the cache has expired or, for a user not in it, if the refresh interval has passed
+    user_dn = user_dn.lower()
+    cache_age = None if admin_members_read == None else time.monotonic() - admin_members_read
+    if cache_age == None or cache_age >= config.getfloat('ldap', 'admin_cache_seconds', fallback=300) or (
+        user_dn not in admin_members and cache_age >= config.getfloat('ldap', 'admin_refresh_interval', fallback=30)):
+        read_admin_members(lookup_conn)
+    return user_dn in admin_members
+
+def get_role(lookup_conn, username):
+    user_dn = find_user_dn(lookup_conn, username)
+    if user_dn != None and is_admin(lookup_conn, user_dn):
+        return 'admin'
+    return 'user'
+
+def authenticate(username, password): #Returns 'admin', 'user' or 'invalid' for the given credentials
+    if username == '' or password == '': #An empty password would be an unauthenticated bind, which many servers accept
+        return 'invalid'
+    client_strategy = MOCK_SYNC if get_strategy() == MOCK_SYNC else SYNC #The user's own bind is only used once, so it doesn't need to reconnect
+    try:
+        user_conn = bind(config.get('ldap', 'bind_user_format', fallback='local\\{}').format(username), password, client_strategy)
+    except LDAPException:
+        return 'invalid'
+    try:
+        if config.get('ldap', 'service_user', fallback='') == '': #No service account. Looks the user up on their own connection
+            return get_role(user_conn, username)
+        user_conn.unbind()
+        with service_lock:
+            try:
+                return get_role(get_service_connection(), username)
+            except LDAPException:
+                close_service_connection()
+                raise
+    except LDAPException:
+        return 'invalid'
+    finally:
+        if not user_conn.closed:
+            user_conn.unbind()
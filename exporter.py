@@ -0,0 +1,76 @@
+import queue
+import threading
+from psycopg2 import sql
+
+#Streams CSV exports straight from PostgreSQL with COPY (query) TO STDOUT.
+#psycopg2 can only write COPY output to a file object, so the COPY runs in a background thread that writes into a small queue,
+#and the request's response generator sends each chunk on to the browser as it arrives. At most a few chunks are held in memory at once.
+
+class ExportCancelled(Exception): #Raised inside the COPY thread when the browser stops reading the export
+    pass
+
+class QueueWriter: #File object given to copy_expert. Collects the rows PostgreSQL sends into chunks of about chunk_size bytes and puts them on the queue
+    def __init__(self, chunks, chunk_size, cancelled):
+        self.chunks = chunks
+        self.chunk_size = chunk_size
+        self.cancelled = cancelled
+        self.buffer = []
+        self.buffered_bytes = 0
+
+    def write(self, data): #Called by copy_expert once for every row
+        self.buffer.append(data)
+        self.buffered_bytes += len(data)
+        if self.buffered_bytes >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if self.buffer != []:
+            self.put(b''.join(self.buffer))
+            self.buffer = []
+            self.buffered_bytes = 0
+
+    def put(self, item): #Waits for room on the queue, giving up if the export was cancelled
+        while True:
+            try:
+                self.chunks.put(item, timeout=1)
+                return
+            except queue.Full:
+                if self.cancelled.is_set():
+                    raise ExportCancelled()
+
+def copy_csv(db_conn, query, query_params=(), chunk_size=65536, queue_chunks=8): #Yields the result of a SELECT as CSV (with a header row), in chunks of about chunk_size bytes
+    with db_conn.cursor() as mogrify_cursor:
+        bound_query = mogrify_cursor.mogrify(query, query_params).decode() #COPY can't take query parameters, so they are bound client side first
+    copy_query = sql.SQL('COPY ({}) TO STDOUT WITH (FORMAT csv, HEADER true);').format(sql.SQL(bound_query)).as_string(db_conn)
+    chunks = queue.Queue(maxsize=queue_chunks)
+    cancelled = threading.Event()
+    writer = QueueWriter(chunks, chunk_size, cancelled)
+    finished = object() #Put on the queue after the last chunk
+
+    def run_copy():
+        try:
+            with db_conn.cursor() as copy_cursor:
+                copy_cursor.copy_expert(copy_query, writer)
+            writer.flush()
+            writer.put(finished)
+        except ExportCancelled:
+            db_conn.close() #The COPY was abandoned part way through, so the connection can't be reused. The pool replaces it
+        except Exception as copy_error:
+            try:
+                writer.put(copy_error) #Raised again in the response generator
+            except ExportCancelled:
+                pass
+
+    copy_thread = threading.Thread(target=run_copy, daemon=True)
+    copy_thread.start()
+    try:
+        while True:
+            chunk = chunks.get()
+            if chunk is finished:
+                return
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield chunk
+    finally:
+        cancelled.set()
+        copy_thread.join()
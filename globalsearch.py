@@ -0,0 +1,36 @@
+from urllib.parse import quote
+from psycopg2 import sql
+
+#Global full text search across inventory, transactions, hostnames and logs.
+#Inventory, transactions and hostnames are searched through search_documents, which triggers keep current (see migration 9). Logs are searched through a GIN
+#expression index on recordcopy. Every table's best matches are ranked and returned together by one query, so a search is a single round trip.
+
+search_sources = {'inventory' : {'label' : 'Inventory', 'link' : '/inventory/search/barcode/{}'},
+    'transactions' : {'label' : 'Transactions', 'link' : '/transactions/search/transactionid/{}'},
+    'hostnames' : {'label' : 'Hostnames', 'link' : '/hostnames/edit/{}'},
+    'logs' : {'label' : 'Logs', 'link' : '/admin-tools/logs/search/timestamp/{}'}} #Source: heading for its results and the page each result links to. Results are shown in this order
+
+search_query = sql.SQL('''WITH query AS (
+    SELECT to_tsquery('simple', string_agg(quote_literal(lexeme) || ':*', ' & ')) AS terms
+    FROM unnest(tsvector_to_array(to_tsvector('simple', %(terms)s))) AS lexeme),
+candidates AS ({}
+    UNION ALL
+    (SELECT 'logs', to_char(timestamp, 'YYYY-MM-DD HH24:MI:SS') AS record_key, concat_ws(' ', username, actiontype, database, recordcopy),
+        ts_rank(to_tsvector('simple', COALESCE(recordcopy, '')), query.terms) AS rank
+    FROM logs, query WHERE %(include_logs)s AND to_tsvector('simple', COALESCE(recordcopy, '')) @@ query.terms
+    ORDER BY rank DESC, record_key LIMIT %(candidate_limit)s)),
+ranked AS (SELECT source, record_key, summary, count(*) OVER (PARTITION BY source) AS matches,
+    row_number() OVER (PARTITION BY source ORDER BY rank DESC, record_key) AS position
+    FROM candidates)
+SELECT source, record_key, summary, matches FROM ranked WHERE position <= %(results_per_source)s ORDER BY source, position;''').format(
+    sql.SQL('\n    UNION ALL\n').join(sql.SQL('''(SELECT source, record_key, summary, ts_rank(search_vector, query.terms) AS rank FROM search_documents, query
+    WHERE source = {} AND search_vector @@ query.terms ORDER BY rank DESC, record_key LIMIT %(candidate_limit)s)''').format(sql.Literal(source))
+    for source in ('inventory', 'transactions', 'hostnames'))) #Each word of the search matches as a prefix, so a partial serial or hostname is found. Every source is ranked in its own branch and then capped at candidate_limit, so the cap only drops its lowest ranked matches and keeps the rows counted and windowed small
+
+def search(cursor, terms, include_logs=False, results_per_source=10, candidate_limit=1000): #Returns [(source, results, match count)] for every source with matches, in search_sources order. results are (record key, summary, link) pairs, best first. A match count of candidate_limit means at least that many
+    cursor.execute(search_query, {'terms' : terms, 'include_logs' : include_logs,
+        'results_per_source' : results_per_source, 'candidate_limit' : candidate_limit})
+    grouped = {}
+    for source, record_key, summary, matches in cursor.fetchall():
+        grouped.setdefault(source, ([], matches))[0].append((record_key, summary, search_sources[source]['link'].format(quote(record_key, safe=''))))
+    return [(source, grouped[source][0], grouped[source][1]) for source in search_sources if source in grouped]
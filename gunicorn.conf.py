@@ -0,0 +1,37 @@
+import multiprocessing
+import configparser
+import database
+import auditlog
+
+#Multi-worker launch configuration. Start with: gunicorn -c gunicorn.conf.py
+
+config = configparser.ConfigParser()
+config.read('inventory.conf')
+
+wsgi_app = 'wsgi:app'
+
+bind = config.get('gunicorn', 'bind', fallback='0.0.0.0:8000')
+
+workers = config.getint('gunicorn', 'workers', fallback=multiprocessing.cpu_count() * 2 + 1) #One process per core plus spare workers for requests waiting on the database
+
+worker_class = 'gthread'
+
+threads = config.getint('gunicorn', 'threads', fallback=4) #Threads per worker. Keep this at or below pool_max_connections
+
+preload_app = True #The app is imported once in the master and forked. Safe because create_app opens no database connections
+
+def on_starting(server): #Runs once in the master before the workers start. Makes sure the logs partitions for the coming months exist
+    try:
+        conn = database.connect()
+        auditlog.create_partitions(conn.cursor())
+        conn.commit()
+        conn.close()
+    except Exception as partition_error: #Rows still go to the default partition, and python maintenance.py rotate-logs moves them later
+        server.log.warning('Could not create logs partitions: {}'.format(partition_error))
+
+def post_worker_init(worker): #Opens this worker's own connection pool after the fork
+    database.get_pool()
+
+def worker_exit(server, worker):
+    auditlog.stop_writer() #Writes any queued audit log rows before the worker's connections close
+    database.close_pool()
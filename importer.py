@@ -0,0 +1,73 @@
+from psycopg2 import sql
+
+#Bulk CSV import for the inventory, transactions and hostnames tables.
+#The file is streamed into a temporary staging table with COPY, checked with set-based queries against the dropdowns, hostnames and inventory tables,
+#then the valid rows are merged into the real table with one INSERT. One summary entry is written to logs for the whole run.
+
+import_tables = {
+    'inventory' : {'columns' : ['barcode', 'serial', 'model', 'category', 'department', 'date_purchased', 'date_retired'],
+        'checks' : [("staged.barcode IS NULL OR staged.barcode !~ '^[0-9]{1,9}$'", 'Barcode must be a whole number.'),
+            ('row_number() OVER (PARTITION BY staged.barcode ORDER BY staged.line_number) > 1', 'Barcode appears more than once in the file.'),
+            ('EXISTS (SELECT 1 FROM inventory WHERE inventory.barcode = staged.barcode::INT)', 'Barcode is already in the inventory table.'),
+            ('staged.model IS NULL', 'Model is required.'),
+            ('NOT EXISTS (SELECT 1 FROM dropdowns WHERE dropdowns.devicetype = staged.category)', 'Category is not in the Device Types dropdown list.'),
+            ('NOT EXISTS (SELECT 1 FROM dropdowns WHERE dropdowns.devicedepartment = staged.department)', 'Department is not in the Device Departments dropdown list.'),
+            ('NOT is_valid_date(staged.date_purchased)', 'Date Purchased must be a date (YYYY-MM-DD).'),
+            ('NOT is_valid_date(staged.date_retired)', 'Date Retired must be a date (YYYY-MM-DD).')],
+        'merge' : '''INSERT INTO inventory(barcode, serial, model, category, department, date_purchased, date_retired)
+            SELECT barcode::INT, serial, model, category, department, date_purchased::DATE, date_retired::DATE
+            FROM import_staging WHERE reject_reason IS NULL ORDER BY line_number
+            ON CONFLICT (barcode) DO NOTHING;''',
+        'log_database' : 'Inventory'},
+    'transactions' : {'columns' : ['barcode', 'inout', 'username', 'assignedto', 'hostname', 'date'],
+        'checks' : [("staged.barcode IS NULL OR staged.barcode !~ '^[0-9]{1,9}$'", 'Barcode must be a whole number.'),
+            ('NOT EXISTS (SELECT 1 FROM inventory WHERE inventory.barcode = staged.barcode::INT)', 'Barcode is not in the inventory table.'),
+            ("staged.inout IS NULL OR staged.inout NOT IN ('In', 'Out')", 'In/Out must be In or Out.'),
+            ('staged.assignedto IS NULL', 'Assigned To is required.'),
+            ('staged.hostname IS NOT NULL AND NOT EXISTS (SELECT 1 FROM hostnames WHERE hostnames.hostname = staged.hostname)', 'Hostname is not in the hostnames table.'),
+            ('staged.date IS NULL OR NOT is_valid_date(staged.date)', 'Date must be a date (YYYY-MM-DD).')],
+        'merge' : '''INSERT INTO transactions(barcode, inout, username, assignedto, hostname, date)
+            SELECT barcode::INT, inout, username, assignedto, hostname, date::DATE
+            FROM import_staging WHERE reject_reason IS NULL ORDER BY line_number;''',
+        'log_database' : 'Transactions'},
+    'hostnames' : {'columns' : ['hostname', 'description', 'active'],
+        'checks' : [('staged.hostname IS NULL', 'Hostname is required.'),
+            ('length(staged.hostname) > 20', 'Hostname must be 20 characters or fewer.'),
+            ('row_number() OVER (PARTITION BY staged.hostname ORDER BY staged.line_number) > 1', 'Hostname appears more than once in the file.'),
+            ('EXISTS (SELECT 1 FROM hostnames WHERE hostnames.hostname = staged.hostname)', 'Hostname is already in the hostnames table.'),
+            ('staged.description IS NULL', 'Description is required.'),
+            ("staged.active IS NOT NULL AND lower(staged.active) NOT IN ('true', 'false', 't', 'f', 'yes', 'no', 'y', 'n', '1', '0')", 'Active must be true or false.')],
+        'merge' : '''INSERT INTO hostnames(hostname, description, active)
+            SELECT hostname, description, COALESCE(active::BOOL, true)
+            FROM import_staging WHERE reject_reason IS NULL ORDER BY line_number
+            ON CONFLICT (hostname) DO NOTHING;''',
+        'log_database' : 'Hostnames'}} #Table: staging columns in CSV order, validation checks as (condition, reason) in the order they are tested, the set-based merge statement and the name written to logs
+
+def import_csv(conn, table, csv_file, username, filename='', report_limit=100): #Imports a CSV file (with a header row) into a table. Returns the number of rows imported, the number rejected and up to report_limit (line number, reason) pairs for the rejected rows
+    import_table = import_tables[table]
+    cursor = conn.cursor()
+    column_identifiers = sql.SQL(', ').join(map(sql.Identifier, import_table['columns']))
+    cursor.execute(sql.SQL('''CREATE TEMPORARY TABLE import_staging (
+        line_number SERIAL,
+        {},
+        reject_reason TEXT
+        ) ON COMMIT DROP;''').format(sql.SQL(', ').join(sql.SQL('{} TEXT').format(sql.Identifier(column)) for column in import_table['columns']))) #Every column is text so a badly formatted value is reported instead of failing the whole COPY
+    cursor.copy_expert(sql.SQL('COPY import_staging ({}) FROM STDIN WITH (FORMAT csv, HEADER true);')
+        .format(column_identifiers).as_string(cursor), csv_file)
+    cursor.execute('ANALYZE import_staging;') #Gives the planner row counts for the checks below
+    reason_cases = sql.SQL(' ').join(sql.SQL('WHEN {} THEN %s').format(sql.SQL(condition)) for condition, reason in import_table['checks'])
+    cursor.execute(sql.SQL('''UPDATE import_staging SET reject_reason = checked.reason
+        FROM (SELECT staged.line_number, CASE {} END AS reason FROM import_staging AS staged) AS checked
+        WHERE import_staging.line_number = checked.line_number
+        AND checked.reason IS NOT NULL;''').format(reason_cases), [reason for condition, reason in import_table['checks']])
+    rejected_count = cursor.rowcount
+    cursor.execute('''SELECT line_number + 1, reject_reason FROM import_staging
+        WHERE reject_reason IS NOT NULL ORDER BY line_number LIMIT %s;''', (report_limit,)) #line_number + 1 accounts for the header row
+    rejected_rows = cursor.fetchall()
+    cursor.execute(import_table['merge'])
+    imported_count = cursor.rowcount
+    cursor.execute('''INSERT INTO logs(username, actiontype, database, timestamp, recordcopy)
+        VALUES (%s, 'Import', %s, CURRENT_TIMESTAMP, %s);''', (username, import_table['log_database'],
+        'Imported {} rows from {}. Rejected {} rows.'.format(imported_count, filename or 'CSV file', rejected_count)))
+    cursor.close()
+    return imported_count, rejected_count, rejected_rows
@@ -0,0 +1,46 @@
+import configparser
+import threading
+import time
+
+#Per process cache for the dropdown lists used by the inventory add and edit forms (device types and device departments).
+#Each list is tagged with the version of the table it was read from. The lookup_versions table holds the current versions and is bumped by
+#triggers on every write to dropdowns, so a cached list is reloaded after any process changes the table.
+#The versions are read at most once every lookup_cache_check_interval seconds, so most form renders run no queries at all.
+
+config = configparser.ConfigParser()
+config.read('inventory.conf')
+
+lookup_queries = {'devicetype' : ('dropdowns', 'SELECT devicetype FROM dropdowns WHERE NOT devicetype IS NULL ORDER BY devicetype;'),
+    'devicedepartment' : ('dropdowns', 'SELECT devicedepartment FROM dropdowns WHERE NOT devicedepartment IS NULL ORDER BY devicedepartment;')} #Lookup name: (table the version is tracked on, query for the list)
+
+cache_lock = threading.Lock()
+cached_lists = {} #Lookup name: (table version it was read at, list of values)
+table_versions = {} #Table: version last read from lookup_versions
+last_checked = 0 #time.monotonic() of the last version read. 0 forces a read
+
+def invalidate(): #Makes the next lookup re-read the versions. Called after this process writes to dropdowns, so its own changes show up straight away
+    global last_checked
+    with cache_lock:
+        last_checked = 0
+
+def refresh_versions(cursor): #Re-reads the table versions if the check interval has passed
+    global last_checked
+    if time.monotonic() - last_checked < config.getfloat('flask', 'lookup_cache_check_interval', fallback=1):
+        return
+    cursor.execute('SELECT name, sum(version)::BIGINT FROM lookup_versions GROUP BY name;') #Each table's version is spread over several rows
+    with cache_lock:
+        table_versions.update(cursor.fetchall())
+        last_checked = time.monotonic()
+
+def get_lookup(cursor, name): #Returns the list of values for a lookup, reading it from the database only if the table has changed since it was cached
+    table, query = lookup_queries[name]
+    refresh_versions(cursor)
+    version = table_versions.get(table)
+    cached = cached_lists.get(name)
+    if cached != None and cached[0] == version:
+        return cached[1]
+    cursor.execute(query)
+    values = [row[0] for row in cursor.fetchall()]
+    with cache_lock:
+        cached_lists[name] = (version, values)
+    return values
@@ -0,0 +1,151 @@
+import argparse
+import configparser
+import getpass
+import gzip
+import os
+import secrets
+import time
+from psycopg2 import sql
+import api
+import auditlog
+import database
+import importer
+import sessionstore
+
+#Database maintenance commands. Run with: python maintenance.py <command>
+
+config = configparser.ConfigParser()
+config.read('inventory.conf')
+
+def reconcile_last_hostname(): #Recomputes inventory.last_hostname for every device in one statement. Use after bulk changes made with triggers disabled, or to check for drift
+    conn = database.connect()
+    cursor = conn.cursor()
+    cursor.execute('SELECT reconcile_last_hostname();')
+    updated_rows = cursor.fetchone()[0]
+    conn.commit()
+    conn.close()
+    print('Updated last_hostname on {} devices.'.format(updated_rows))
+
+def import_csv(table, filename, username): #Imports a CSV file from the command line. Valid rows are committed and rejected rows are listed
+    conn = database.connect()
+    with open(filename, 'rb') as csv_file:
+        imported_count, rejected_count, rejected_rows = importer.import_csv(conn, table, csv_file, username, filename, report_limit=None)
+    conn.commit()
+    conn.close()
+    for line_number, reason in rejected_rows:
+        print('Line {}: {}'.format(line_number, reason))
+    print('Imported {} rows into {}. Rejected {} rows.'.format(imported_count, table, rejected_count))
+
+def archive_log_partition(conn, cursor, partition_name): #Detaches one monthly logs partition, writes it to a gzipped CSV file in archive_dir and drops it. Nothing is dropped unless the file was written
+    archive_dir = config.get('logs', 'archive_dir', fallback='log_archive')
+    os.makedirs(archive_dir, exist_ok=True)
+    archive_path = os.path.join(archive_dir, partition_name + '.csv.gz')
+    cursor.execute("SELECT 1 FROM pg_inherits WHERE inhrelid = %s::regclass AND inhparent = 'logs'::regclass;", (partition_name,))
+    if cursor.fetchone() != None: #Not yet detached by an earlier run that stopped part way
+        try:
+            cursor.execute('SET LOCAL lock_timeout = %s;', (config.get('migrations', 'lock_timeout', fallback='5s'),)) #Gives up rather than queueing every log read and write behind the lock
+            cursor.execute(sql.SQL('ALTER TABLE logs DETACH PARTITION {};').format(sql.Identifier(partition_name))) #Locks logs against all access until it commits, so it is committed on its own straight away. CONCURRENTLY can't be used while logs has a default partition
+            cursor.execute("SELECT bump_table_version('logs');") #Detaching fires no triggers. Makes cached logs pages reload
+            conn.commit()
+        except:
+            conn.rollback()
+            raise
+    try: #The detached table is no longer part of logs, so copying and dropping it doesn't hold up the app
+        with open(archive_path + '.tmp', 'wb') as archive_file:
+            with gzip.GzipFile(fileobj=archive_file, mode='wb') as compressed_file:
+                cursor.copy_expert(sql.SQL('COPY {} TO STDOUT WITH (FORMAT csv, HEADER true);')
+                    .format(sql.Identifier(partition_name)).as_string(conn), compressed_file)
+            archive_file.flush()
+            os.fsync(archive_file.fileno())
+        os.replace(archive_path + '.tmp', archive_path)
+        cursor.execute(sql.SQL('DROP TABLE {};').format(sql.Identifier(partition_name)))
+        conn.commit()
+    except:
+        conn.rollback()
+        if os.path.exists(archive_path + '.tmp'):
+            os.remove(archive_path + '.tmp')
+        raise
+    print('Archived {} to {}.'.format(partition_name, archive_path))
+
+def rotate_logs(): #Creates the upcoming monthly logs partitions, then archives the months older than retention_months. Run daily, e.g. from cron
+    conn = database.connect()
+    cursor = conn.cursor()
+    created_count = auditlog.create_partitions(cursor)
+    conn.commit()
+    print('Created {} logs partitions.'.format(created_count))
+    retention_months = config.getint('logs', 'retention_months', fallback=0)
+    if retention_months > 0: #0 keeps every month
+        cursor.execute('''SELECT partition.relname FROM pg_class AS partition
+            WHERE partition.relkind = 'r' AND pg_table_is_visible(partition.oid)
+            AND partition.relname ~ '^logs_[0-9]{4}_[0-9]{2}$'
+            AND to_date(substr(partition.relname, 6), 'YYYY_MM') < date_trunc('month', LOCALTIMESTAMP) - make_interval(months => %s)
+            ORDER BY partition.relname;''', (retention_months,)) #Monthly partitions that ended before the retention window, including any an earlier run detached but didn't get to archive
+        old_partitions = [row[0] for row in cursor.fetchall()]
+        conn.commit()
+        for partition_name in old_partitions:
+            archive_log_partition(conn, cursor, partition_name)
+    conn.close()
+
+def sweep_sessions(): #Deletes expired sessions from the store set by session_type. For the filesystem store, deletes session files not written for longer than session_lifetime
+    session_type = config.get('flask', 'session_type', fallback='filesystem')
+    if session_type == 'filesystem':
+        session_file_dir = config.get('flask', 'session_file_dir')
+        oldest_allowed = time.time() - config.getint('flask', 'session_lifetime', fallback=2678400)
+        deleted = 0
+        for entry in os.scandir(session_file_dir) if os.path.isdir(session_file_dir) else []:
+            if entry.is_file() and entry.stat().st_mtime < oldest_allowed:
+                try:
+                    os.remove(entry.path)
+                    deleted += 1
+                except FileNotFoundError: #Removed by the app at the same time
+                    pass
+    else:
+        deleted = sessionstore.create_store(session_type).sweep()
+    print('Deleted {} expired sessions.'.format(deleted))
+
+def create_api_token(name, role): #Creates a JSON API token and prints it. Only its hash is stored, so it can't be shown again
+    token = secrets.token_urlsafe(32)
+    conn = database.connect()
+    cursor = conn.cursor()
+    cursor.execute('INSERT INTO api_tokens(token_hash, name, role) VALUES (%s, %s, %s);', (api.hash_token(token), name, role))
+    conn.commit()
+    conn.close()
+    print('Created {} token {}: {}'.format(role, name, token))
+
+def revoke_api_token(name):
+    conn = database.connect()
+    cursor = conn.cursor()
+    cursor.execute('UPDATE api_tokens SET revoked = TRUE WHERE name = %s;', (name,))
+    revoked_count = cursor.rowcount
+    conn.commit()
+    conn.close()
+    print('Revoked token {}.'.format(name) if revoked_count > 0 else 'No token named {}.'.format(name))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Inventory database maintenance.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('reconcile-last-hostname', help='Recompute inventory.last_hostname for every device.')
+    import_parser = subparsers.add_parser('import', help='Import a CSV file with a header row into a table.')
+    import_parser.add_argument('table', choices=sorted(importer.import_tables))
+    import_parser.add_argument('filename')
+    import_parser.add_argument('--username', default=getpass.getuser(), help='Name recorded in the import log entry.')
+    subparsers.add_parser('rotate-logs', help='Create upcoming logs partitions and archive the ones past the retention period.')
+    subparsers.add_parser('sweep-sessions', help='Delete expired sessions.')
+    token_parser = subparsers.add_parser('create-api-token', help='Create a JSON API token and print it.')
+    token_parser.add_argument('name', help='Name to identify the token by, e.g. the station or job using it.')
+    token_parser.add_argument('--admin', action='store_const', const='admin', default='user', dest='role', help='Allow the token to read the logs.')
+    revoke_parser = subparsers.add_parser('revoke-api-token', help='Revoke a JSON API token.')
+    revoke_parser.add_argument('name')
+    args = parser.parse_args()
+    if args.command == 'reconcile-last-hostname':
+        reconcile_last_hostname()
+    elif args.command == 'import':
+        import_csv(args.table, args.filename, args.username)
+    elif args.command == 'rotate-logs':
+        rotate_logs()
+    elif args.command == 'sweep-sessions':
+        sweep_sessions()
+    elif args.command == 'create-api-token':
+        create_api_token(args.name, args.role)
+    elif args.command == 'revoke-api-token':
+        revoke_api_token(args.name)
@@ -0,0 +1,551 @@
+import argparse
+import configparser
+from psycopg2 import sql
+import database
+
+#Versioned schema migrations. Run with: python migrations.py migrate
+#Each migration is applied once, in order, and recorded in the schema_migrations table.
+#Online migrations run outside of a transaction so they can use CREATE INDEX CONCURRENTLY and batched backfills without locking busy tables.
+
+config = configparser.ConfigParser()
+config.read('inventory.conf')
+
+migration_lock_id = 4817 #pg_advisory_lock key that stops two migration runs at the same time
+version_shards = 16 #Rows each table's change version is spread over. Writers on different connections bump different rows
+
+btree_indexes = {'inventory' : [('serial', 'barcode'), ('model', 'barcode'), ('category', 'barcode'),
+        ('department', 'barcode'), ('date_purchased', 'barcode'), ('date_retired', 'barcode'),
+        ('last_hostname', 'barcode')],
+    'transactions' : [('barcode', 'date'), ('barcode', 'transactionid'), ('inout', 'transactionid'),
+        ('username', 'transactionid'), ('assignedto', 'transactionid'), ('hostname', 'transactionid'),
+        ('date', 'transactionid')],
+    'hostnames' : [('description', 'hostname'), ('active', 'hostname')],
+    'logs' : [('username', 'timestamp'), ('actiontype', 'timestamp'),
+        ('database', 'timestamp'), ('timestamp',)]} #Table: column lists for B-tree indexes. Each covers a filter or join column followed by the tie-breaker the table pages are sorted with
+
+trigram_indexes = {'inventory' : ['serial', 'model', 'category', 'department', 'last_hostname'],
+    'transactions' : ['username', 'assignedto', 'hostname'],
+    'hostnames' : ['hostname', 'description'],
+    'logs' : ['username', 'actiontype', 'database', 'recordcopy']} #Table: text columns searched with ILIKE '%criteria%'. A pg_trgm GIN index lets those searches skip the sequential scan
+
+search_documents = {'inventory' : ('barcode::TEXT', "concat_ws(' ', serial, model, category, department, last_hostname)",
+        "setweight(to_tsvector('simple', concat_ws(' ', barcode, serial)), 'A') || setweight(to_tsvector('simple', concat_ws(' ', model, category, department, last_hostname)), 'B')"),
+    'transactions' : ('transactionid::TEXT', "concat_ws(' ', barcode, inout, username, assignedto, hostname, date)",
+        "setweight(to_tsvector('simple', concat_ws(' ', transactionid, barcode, hostname)), 'A') || setweight(to_tsvector('simple', concat_ws(' ', inout, username, assignedto, date)), 'B')"),
+    'hostnames' : ('hostname', 'description',
+        "setweight(to_tsvector('simple', hostname), 'A') || setweight(to_tsvector('simple', COALESCE(description, '')), 'B')")} #Table: (record key, summary shown in results, weighted search vector) for the rows kept in search_documents. Identifying columns rank above descriptive ones
+
+def index_name(table, columns, suffix): #Builds a predictable index name, e.g. transactions_barcode_date_idx
+    return '{}_{}_{}'.format(table, '_'.join(columns), suffix)
+
+def create_index_concurrently(cursor, name, table, definition): #Builds an index without blocking writes to the table. Must run in an online migration
+    cursor.execute('''SELECT pg_index.indisvalid FROM pg_index
+        JOIN pg_class ON pg_class.oid = pg_index.indexrelid
+        WHERE pg_class.relname = %s;''', (name,))
+    existing = cursor.fetchone()
+    if existing != None and existing[0] == True: #Index already built
+        return
+    if existing != None: #An earlier CONCURRENTLY build failed part way and left an invalid index behind
+        cursor.execute(sql.SQL('DROP INDEX CONCURRENTLY {};').format(sql.Identifier(name)))
+    cursor.execute(sql.SQL('CREATE INDEX CONCURRENTLY {} ON {} {};')
+        .format(sql.Identifier(name), sql.Identifier(table), definition))
+
+def backfill(conn, cursor, table, statement, query_params=None, batch_pages=None): #Runs statement over a large table a range of pages at a time, committing after each range so no lock is held for long. Must run in an online migration
+    #statement reads only the rows with ctid >= %(batch_start)s::tid AND ctid < %(batch_end)s::tid. Rows written while it runs can land in pages already done, so a trigger created beforehand has to cover those
+    if batch_pages == None:
+        batch_pages = config.getint('migrations', 'backfill_batch_pages', fallback=200)
+    cursor.execute("SELECT pg_relation_size(%s) / current_setting('block_size')::INT;", (table,))
+    page_count = cursor.fetchone()[0]
+    for first_page in range(0, page_count, batch_pages):
+        cursor.execute(statement, dict(query_params or {}, batch_start='({},0)'.format(first_page), batch_end='({},0)'.format(first_page + batch_pages)))
+        if not conn.autocommit:
+            conn.commit()
+
+def migration_001_baseline_tables(conn, cursor): #The original schema created by init.py. Existing databases already have these tables and are left as they are
+    cursor.execute('''CREATE TABLE IF NOT EXISTS inventory (
+    barcode INT PRIMARY KEY,
+    serial TEXT,
+    model TEXT,
+    category TEXT,
+    department TEXT,
+    date_purchased DATE,
+    date_retired DATE,
+    last_hostname TEXT
+    );''')
+
+    cursor.execute('''CREATE TABLE IF NOT EXISTS transactions (
+    transactionid INT PRIMARY KEY,
+    barcode INT,
+    inout TEXT,
+    username TEXT,
+    assignedto TEXT,
+    hostname TEXT,
+    date DATE
+    );''')
+
+    cursor.execute('''CREATE TABLE IF NOT EXISTS hostnames (
+    hostname TEXT PRIMARY KEY,
+    description TEXT,
+    active BOOL
+    );''')
+
+    cursor.execute('''CREATE TABLE IF NOT EXISTS logs (
+    username TEXT,
+    actiontype TEXT,
+    database TEXT,
+    timestamp TIMESTAMP,
+    recordcopy TEXT
+    );''')
+
+    cursor.execute('''CREATE TABLE IF NOT EXISTS dropdowns (
+    devicetype TEXT,
+    devicedepartment TEXT
+    );''')
+
+    cursor.execute('''SELECT 1 FROM pg_constraint WHERE conname = 'fk_hostnames';''')
+    if cursor.fetchone() == None:
+        cursor.execute('''ALTER TABLE transactions
+        ADD CONSTRAINT fk_hostnames
+        FOREIGN KEY (hostname)
+        REFERENCES hostnames (hostname)
+        ON DELETE SET NULL
+        ON UPDATE CASCADE;''')
+
+def migration_002_search_and_sort_indexes(conn, cursor): #B-tree indexes for filter, join and sort columns and trigram indexes for the ILIKE searches
+    cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm;') #Provides the trigram operator classes. Ships with the postgresql-contrib package
+    for table, index_list in btree_indexes.items():
+        for columns in index_list:
+            create_index_concurrently(cursor, index_name(table, columns, 'idx'), table,
+                sql.SQL('({})').format(sql.SQL(', ').join(map(sql.Identifier, columns))))
+    for table, columns in trigram_indexes.items():
+        for column in columns:
+            create_index_concurrently(cursor, index_name(table, [column], 'trgm_idx'), table,
+                sql.SQL('USING GIN ({} gin_trgm_ops)').format(sql.Identifier(column)))
+
+def migration_003_last_hostname_triggers(conn, cursor): #Keeps inventory.last_hostname current inside the database whenever transactions are added, edited or removed
+    cursor.execute('''CREATE OR REPLACE FUNCTION reconcile_last_hostname(device_barcodes INT[] DEFAULT NULL) RETURNS BIGINT AS $$
+    DECLARE
+        updated_rows BIGINT;
+    BEGIN
+        UPDATE inventory SET last_hostname = newest.hostname
+        FROM (SELECT device.barcode, latest.hostname FROM inventory AS device
+            LEFT JOIN LATERAL (SELECT hostname FROM transactions
+                WHERE transactions.barcode = device.barcode
+                ORDER BY date DESC, transactionid DESC LIMIT 1) AS latest ON TRUE
+            WHERE device_barcodes IS NULL OR device.barcode = ANY(device_barcodes)) AS newest
+        WHERE inventory.barcode = newest.barcode
+        AND inventory.last_hostname IS DISTINCT FROM newest.hostname;
+        GET DIAGNOSTICS updated_rows = ROW_COUNT;
+        RETURN updated_rows;
+    END
+    $$ LANGUAGE plpgsql SET plan_cache_mode = force_custom_plan;''') #Sets last_hostname to the hostname of each device's newest transaction. NULL device_barcodes reconciles every device. Custom plans let the barcode list use the primary key
+
+    cursor.execute('''CREATE OR REPLACE FUNCTION transactions_refresh_last_hostname() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            PERFORM reconcile_last_hostname(ARRAY(SELECT DISTINCT barcode FROM new_rows));
+        ELSIF TG_OP = 'UPDATE' THEN
+            PERFORM reconcile_last_hostname(ARRAY(SELECT barcode FROM new_rows UNION SELECT barcode FROM old_rows));
+        ELSE
+            PERFORM reconcile_last_hostname(ARRAY(SELECT DISTINCT barcode FROM old_rows));
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql;''') #Statement level, so a bulk insert reconciles every device it touched in one statement
+
+    cursor.execute('DROP TRIGGER IF EXISTS transactions_last_hostname_insert ON transactions;')
+    cursor.execute('''CREATE TRIGGER transactions_last_hostname_insert AFTER INSERT ON transactions
+        REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION transactions_refresh_last_hostname();''')
+    cursor.execute('DROP TRIGGER IF EXISTS transactions_last_hostname_update ON transactions;')
+    cursor.execute('''CREATE TRIGGER transactions_last_hostname_update AFTER UPDATE ON transactions
+        REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION transactions_refresh_last_hostname();''')
+    cursor.execute('DROP TRIGGER IF EXISTS transactions_last_hostname_delete ON transactions;')
+    cursor.execute('''CREATE TRIGGER transactions_last_hostname_delete AFTER DELETE ON transactions
+        REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION transactions_refresh_last_hostname();''')
+
+    cursor.execute('SELECT reconcile_last_hostname();') #Fixes any values that drifted while edits and deletes weren't tracked
+
+def migration_004_transactionid_identity(conn, cursor): #Makes the database assign transactionid instead of the app looking up the current maximum and adding one
+    cursor.execute('''SELECT attidentity FROM pg_attribute
+        WHERE attrelid = 'transactions'::regclass AND attname = 'transactionid';''')
+    if cursor.fetchone()[0] == '':
+        cursor.execute('ALTER TABLE transactions ALTER COLUMN transactionid ADD GENERATED BY DEFAULT AS IDENTITY;')
+    cursor.execute('LOCK TABLE transactions IN SHARE ROW EXCLUSIVE MODE;') #Holds off inserts until the sequence has caught up with the existing ids
+    cursor.execute('''SELECT setval(pg_get_serial_sequence('transactions', 'transactionid'),
+        COALESCE(MAX(transactionid), 0) + 1, false) FROM transactions;''')
+
+def migration_005_is_valid_date(conn, cursor): #Used by the CSV importer to reject badly formatted dates without failing the whole import
+    cursor.execute('''CREATE OR REPLACE FUNCTION is_valid_date(value TEXT) RETURNS BOOLEAN AS $$
+    BEGIN
+        IF value IS NULL THEN
+            RETURN true;
+        END IF;
+        PERFORM value::DATE;
+        RETURN true;
+    EXCEPTION WHEN others THEN
+        RETURN false;
+    END
+    $$ LANGUAGE plpgsql IMMUTABLE;''')
+
+def migration_006_lookup_versions(conn, cursor): #Version counters for the cached dropdown and hostname lists. Every write to those tables bumps its counter, so each app process can tell when its cached copy is out of date
+    cursor.execute('''CREATE TABLE IF NOT EXISTS lookup_versions (
+        name TEXT PRIMARY KEY,
+        version BIGINT NOT NULL DEFAULT 0
+        );''')
+    cursor.execute('''INSERT INTO lookup_versions(name) VALUES ('dropdowns'), ('hostnames')
+        ON CONFLICT (name) DO NOTHING;''')
+
+    cursor.execute('''CREATE OR REPLACE FUNCTION bump_lookup_version() RETURNS trigger AS $$
+    BEGIN
+        UPDATE lookup_versions SET version = version + 1 WHERE name = TG_TABLE_NAME;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql;''') #Statement level, so an import or bulk edit bumps the counter once
+
+    for table in ('dropdowns', 'hostnames'):
+        cursor.execute(sql.SQL('DROP TRIGGER IF EXISTS {} ON {};').format(sql.Identifier(table + '_lookup_version'), sql.Identifier(table)))
+        cursor.execute(sql.SQL('''CREATE TRIGGER {} AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {}
+            FOR EACH STATEMENT EXECUTE FUNCTION bump_lookup_version();''').format(sql.Identifier(table + '_lookup_version'), sql.Identifier(table)))
+
+def migration_007_hostname_prefix_index(conn, cursor): #Serves the hostname autocomplete, a case insensitive prefix search over active hostnames
+    create_index_concurrently(cursor, 'hostnames_active_prefix_idx', 'hostnames',
+        sql.SQL('(lower(hostname) text_pattern_ops) WHERE active')) #text_pattern_ops lets LIKE 'prefix%' use the index whatever the database collation
+
+def migration_008_partition_logs(conn, cursor): #Rebuilds logs as a table partitioned by month, so date searches only read the months they cover and old months can be archived and dropped whole
+    cursor.execute('''CREATE OR REPLACE FUNCTION create_logs_partition(month_start DATE) RETURNS BOOLEAN AS $$
+    DECLARE
+        partition_name TEXT := 'logs_' || to_char(month_start, 'YYYY_MM');
+        month_end DATE := month_start + INTERVAL '1 month';
+    BEGIN
+        PERFORM pg_advisory_xact_lock(hashtext('create_logs_partition'));
+        IF to_regclass(partition_name) IS NOT NULL THEN
+            RETURN false;
+        END IF;
+        EXECUTE format('CREATE TABLE %I (LIKE logs INCLUDING DEFAULTS)', partition_name);
+        EXECUTE format('WITH moved AS (DELETE FROM logs_default WHERE timestamp >= %L AND timestamp < %L RETURNING *)
+            INSERT INTO %I SELECT * FROM moved', month_start, month_end, partition_name);
+        EXECUTE format('ALTER TABLE logs ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)', partition_name, month_start, month_end);
+        RETURN true;
+    END
+    $$ LANGUAGE plpgsql;''') #Creates the partition for one month. Rows that landed in logs_default because the partition didn't exist yet are moved into it
+
+    cursor.execute('''CREATE OR REPLACE FUNCTION create_logs_partitions(first_month DATE, last_month DATE) RETURNS INT AS $$
+    DECLARE
+        month_start DATE := date_trunc('month', first_month);
+        created INT := 0;
+    BEGIN
+        WHILE month_start <= last_month LOOP
+            IF create_logs_partition(month_start) THEN
+                created := created + 1;
+            END IF;
+            month_start := month_start + INTERVAL '1 month';
+        END LOOP;
+        RETURN created;
+    END
+    $$ LANGUAGE plpgsql;''') #Creates any missing monthly partitions from first_month through last_month
+
+    cursor.execute("SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'logs'::regclass;")
+    if cursor.fetchone() != None: #Swapped by an earlier run that stopped before the migration was recorded
+        return
+
+    cursor.execute('''CREATE TABLE IF NOT EXISTS logs_partitioned (
+    username TEXT,
+    actiontype TEXT,
+    database TEXT,
+    timestamp TIMESTAMP,
+    recordcopy TEXT
+    ) PARTITION BY RANGE (timestamp);''') #Filled next to the live table, then renamed to logs
+    cursor.execute('CREATE TABLE IF NOT EXISTS logs_default PARTITION OF logs_partitioned DEFAULT;') #Catches rows with no timestamp or for a month whose partition hasn't been created
+    cursor.execute('''SELECT to_char(month_start, 'YYYY_MM'), month_start::DATE, (month_start + INTERVAL '1 month')::DATE
+        FROM generate_series(date_trunc('month', COALESCE((SELECT MIN(timestamp) FROM logs), LOCALTIMESTAMP)),
+            date_trunc('month', LOCALTIMESTAMP) + make_interval(months => %s), INTERVAL '1 month') AS month_start;''',
+        (config.getint('logs', 'partition_months_ahead', fallback=3),))
+    for month_name, month_start, month_end in cursor.fetchall():
+        cursor.execute(sql.SQL('CREATE TABLE IF NOT EXISTS {} PARTITION OF logs_partitioned FOR VALUES FROM (%s) TO (%s);')
+            .format(sql.Identifier('logs_' + month_name)), (month_start, month_end))
+
+    for columns in btree_indexes['logs']: #Indexes on a partitioned table are created on every partition, including ones added later. Built while the partitions are empty and renamed at the swap
+        cursor.execute(sql.SQL('CREATE INDEX IF NOT EXISTS {} ON logs_partitioned ({});').format(sql.Identifier(index_name('logs_partitioned', columns, 'idx')),
+            sql.SQL(', ').join(map(sql.Identifier, columns))))
+    cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm';")
+    trigram_columns = trigram_indexes['logs'] if cursor.fetchone() != None else []
+    for column in trigram_columns:
+        cursor.execute(sql.SQL('CREATE INDEX IF NOT EXISTS {} ON logs_partitioned USING GIN ({} gin_trgm_ops);').format(
+            sql.Identifier(index_name('logs_partitioned', [column], 'trgm_idx')), sql.Identifier(column)))
+
+    cursor.execute('ALTER TABLE logs ADD COLUMN IF NOT EXISTS copied BOOLEAN;') #Marks rows the trigger below has copied. A nullable column without a default is added without rewriting the table
+    cursor.execute('''CREATE OR REPLACE FUNCTION logs_copy_to_partitioned() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO logs_partitioned VALUES (NEW.username, NEW.actiontype, NEW.database, NEW.timestamp, NEW.recordcopy);
+        NEW.copied := true;
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql;''')
+    cursor.execute('DROP TRIGGER IF EXISTS logs_copy_to_partitioned ON logs;')
+    cursor.execute('''CREATE TRIGGER logs_copy_to_partitioned BEFORE INSERT ON logs
+        FOR EACH ROW EXECUTE FUNCTION logs_copy_to_partitioned();''') #Copies rows logged from now on. Creating it waits for inserts already running, so every row it misses is committed before the copy below starts
+    backfill(conn, cursor, 'logs', '''INSERT INTO logs_partitioned
+        SELECT username, actiontype, database, timestamp, recordcopy FROM logs
+        WHERE ctid >= %(batch_start)s::tid AND ctid < %(batch_end)s::tid AND copied IS NULL;''') #Copies the existing rows in committed batches while logging carries on
+
+    conn.autocommit = False #Swaps the tables in one short transaction. If the lock isn't granted within lock_timeout the migration stops, and running it again resumes here
+    try:
+        cursor.execute('LOCK TABLE logs IN ACCESS EXCLUSIVE MODE;')
+        cursor.execute('DROP TABLE logs;')
+        cursor.execute('ALTER TABLE logs_partitioned RENAME TO logs;')
+        for columns in btree_indexes['logs']:
+            cursor.execute(sql.SQL('ALTER INDEX {} RENAME TO {};').format(sql.Identifier(index_name('logs_partitioned', columns, 'idx')),
+                sql.Identifier(index_name('logs', columns, 'idx'))))
+        for column in trigram_columns:
+            cursor.execute(sql.SQL('ALTER INDEX {} RENAME TO {};').format(sql.Identifier(index_name('logs_partitioned', [column], 'trgm_idx')),
+                sql.Identifier(index_name('logs', [column], 'trgm_idx'))))
+        conn.commit()
+    except:
+        conn.rollback()
+        raise
+    finally:
+        conn.autocommit = True
+    cursor.execute('DROP FUNCTION logs_copy_to_partitioned();')
+    cursor.execute('ANALYZE logs;')
+
+def migration_009_global_search(conn, cursor): #Full text search across the asset tables. Row changes are copied into search_documents by statement level triggers, and logs are searched through an expression index
+    cursor.execute('''CREATE TABLE IF NOT EXISTS search_documents (
+    source TEXT NOT NULL,
+    record_key TEXT NOT NULL,
+    summary TEXT NOT NULL,
+    search_vector TSVECTOR NOT NULL,
+    PRIMARY KEY (source, record_key)
+    );''') #A separate table rather than a column on each table, so SELECT * listings and exports are unchanged
+
+    for table, (key, summary, vector) in search_documents.items():
+        function_name = sql.Identifier(table + '_refresh_search_documents')
+        cursor.execute(sql.SQL('''CREATE OR REPLACE FUNCTION {0}() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'TRUNCATE' THEN
+                DELETE FROM search_documents WHERE source = {1};
+                RETURN NULL;
+            END IF;
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                DELETE FROM search_documents WHERE source = {1} AND record_key IN (SELECT {2} FROM old_rows);
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                INSERT INTO search_documents(source, record_key, summary, search_vector)
+                SELECT {1}, {2}, {3}, {4} FROM new_rows
+                ON CONFLICT (source, record_key) DO UPDATE SET summary = EXCLUDED.summary, search_vector = EXCLUDED.search_vector;
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql;''').format(function_name, sql.Literal(table), sql.SQL(key), sql.SQL(summary), sql.SQL(vector))) #Statement level, so an import rewrites its documents in one statement. Upserts, since the backfill below may have written the row's document first
+
+        for operation, transition_tables in (('insert', 'NEW TABLE AS new_rows'), ('update', 'OLD TABLE AS old_rows NEW TABLE AS new_rows'),
+            ('delete', 'OLD TABLE AS old_rows')):
+            trigger_name = sql.Identifier('{}_search_documents_{}'.format(table, operation))
+            cursor.execute(sql.SQL('DROP TRIGGER IF EXISTS {} ON {};').format(trigger_name, sql.Identifier(table)))
+            cursor.execute(sql.SQL('''CREATE TRIGGER {} AFTER {} ON {} REFERENCING {}
+                FOR EACH STATEMENT EXECUTE FUNCTION {}();''').format(trigger_name, sql.SQL(operation.upper()),
+                sql.Identifier(table), sql.SQL(transition_tables), function_name))
+        trigger_name = sql.Identifier(table + '_search_documents_truncate')
+        cursor.execute(sql.SQL('DROP TRIGGER IF EXISTS {} ON {};').format(trigger_name, sql.Identifier(table)))
+        cursor.execute(sql.SQL('CREATE TRIGGER {} AFTER TRUNCATE ON {} FOR EACH STATEMENT EXECUTE FUNCTION {}();')
+            .format(trigger_name, sql.Identifier(table), function_name))
+
+        #The triggers are committed before the backfill starts, so rows changed from here on keep their documents up to date themselves
+        backfill(conn, cursor, table, sql.SQL('''INSERT INTO search_documents(source, record_key, summary, search_vector)
+            SELECT %(source)s, {}, {}, {} FROM {}
+            WHERE ctid >= %(batch_start)s::tid AND ctid < %(batch_end)s::tid
+            ON CONFLICT (source, record_key) DO NOTHING;''').format(sql.SQL(key), sql.SQL(summary), sql.SQL(vector), sql.Identifier(table)),
+            {'source' : table}) #Documents for the rows already in the table. A document the triggers have written is newer, so it is kept
+        cursor.execute(sql.SQL('''DELETE FROM search_documents WHERE source = %s
+            AND NOT EXISTS (SELECT 1 FROM {} WHERE {} = search_documents.record_key);''').format(sql.Identifier(table), sql.SQL(key)), (table,)) #A row deleted while the backfill was reading it can leave its document behind
+        create_index_concurrently(cursor, table + '_search_vector_idx', 'search_documents',
+            sql.SQL('USING GIN (search_vector) WHERE source = {}').format(sql.Literal(table))) #One index per table so each table's matches are found without reading the others'
+
+    logs_search_definition = sql.SQL("USING GIN (to_tsvector('simple', COALESCE(recordcopy, '')))")
+    cursor.execute(sql.SQL('CREATE INDEX IF NOT EXISTS logs_recordcopy_search_idx ON ONLY logs {};').format(logs_search_definition)) #Only the parent's entry, so nothing is built or locked yet. Monthly partitions created later get their own index automatically, so it is archived and dropped with its month
+    cursor.execute('''SELECT pg_class.relname FROM pg_inherits
+        JOIN pg_class ON pg_class.oid = pg_inherits.inhrelid
+        WHERE pg_inherits.inhparent = 'logs'::regclass ORDER BY pg_class.relname;''')
+    for partition_name, in cursor.fetchall(): #Builds each partition's index without blocking logging, then attaches it. The parent index becomes valid once every partition's is attached
+        partition_index_name = partition_name + '_recordcopy_search_idx'
+        create_index_concurrently(cursor, partition_index_name, partition_name, logs_search_definition)
+        cursor.execute(sql.SQL('ALTER INDEX logs_recordcopy_search_idx ATTACH PARTITION {};').format(sql.Identifier(partition_index_name)))
+    cursor.execute('ANALYZE search_documents;')
+
+def migration_010_sessions(conn, cursor): #Session store used when session_type = postgres. Lets every app host share sessions
+    cursor.execute('''CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    expires_at TIMESTAMPTZ NOT NULL
+    );''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS sessions_expires_at_idx ON sessions (expires_at);') #Lets the sweep find expired sessions without reading every row
+
+def migration_011_table_versions(conn, cursor): #Extends the version counters to inventory, transactions and logs, and records when each was last changed. The table pages use them as ETags
+    cursor.execute('ALTER TABLE lookup_versions ADD COLUMN IF NOT EXISTS changed_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP;')
+    cursor.execute('''INSERT INTO lookup_versions(name) VALUES ('inventory'), ('transactions'), ('logs')
+        ON CONFLICT (name) DO NOTHING;''')
+
+    cursor.execute('''CREATE OR REPLACE FUNCTION bump_table_version(table_name TEXT) RETURNS VOID AS $$
+        UPDATE lookup_versions SET version = version + 1, changed_at = clock_timestamp() WHERE name = table_name;
+    $$ LANGUAGE sql;''') #Also called directly for changes no trigger sees, such as dropping an archived logs partition
+
+    cursor.execute('''CREATE OR REPLACE FUNCTION bump_lookup_version() RETURNS trigger AS $$
+    BEGIN
+        PERFORM bump_table_version(TG_TABLE_NAME);
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql;''')
+
+    for table in ('inventory', 'transactions', 'logs'): #A statement trigger on the partitioned logs table fires for rows inserted through it, whichever partition they land in
+        cursor.execute(sql.SQL('DROP TRIGGER IF EXISTS {} ON {};').format(sql.Identifier(table + '_lookup_version'), sql.Identifier(table)))
+        cursor.execute(sql.SQL('''CREATE TRIGGER {} AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {}
+            FOR EACH STATEMENT EXECUTE FUNCTION bump_lookup_version();''').format(sql.Identifier(table + '_lookup_version'), sql.Identifier(table)))
+
+def migration_012_api_tokens(conn, cursor): #Tokens for the JSON API. Only a SHA-256 hash of each token is kept, so the table can't be used to call the API
+    cursor.execute('''CREATE TABLE IF NOT EXISTS api_tokens (
+    token_hash TEXT PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    role TEXT NOT NULL CHECK (role IN ('user', 'admin')),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    revoked BOOLEAN NOT NULL DEFAULT FALSE
+    );''')
+
+def migration_013_table_version_shards(conn, cursor): #Spreads each table's version counter over several rows and skips statements that changed nothing, so concurrent writers no longer queue on one row lock
+    cursor.execute('ALTER TABLE lookup_versions ADD COLUMN IF NOT EXISTS shard INT NOT NULL DEFAULT 0;')
+    cursor.execute('ALTER TABLE lookup_versions DROP CONSTRAINT lookup_versions_pkey;')
+    cursor.execute('ALTER TABLE lookup_versions ADD PRIMARY KEY (name, shard);') #A table's version is the sum of its rows' versions, which goes up with every committed bump
+
+    cursor.execute(sql.SQL('''CREATE OR REPLACE FUNCTION bump_table_version(table_name TEXT) RETURNS VOID AS $$
+        INSERT INTO lookup_versions(name, shard, version, changed_at) VALUES (table_name, pg_backend_pid() % {}, 1, clock_timestamp())
+        ON CONFLICT (name, shard) DO UPDATE SET version = lookup_versions.version + 1, changed_at = clock_timestamp();
+    $$ LANGUAGE sql;''').format(sql.Literal(version_shards))) #Each connection bumps its own row, so writers on different connections don't wait for each other's commits
+
+    cursor.execute('''CREATE OR REPLACE FUNCTION bump_lookup_version() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'TRUNCATE' THEN
+            PERFORM bump_table_version(TG_TABLE_NAME);
+        ELSIF TG_OP = 'DELETE' THEN
+            IF EXISTS (SELECT 1 FROM old_rows) THEN
+                PERFORM bump_table_version(TG_TABLE_NAME);
+            END IF;
+        ELSIF EXISTS (SELECT 1 FROM new_rows) THEN
+            PERFORM bump_table_version(TG_TABLE_NAME);
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql;''') #Statements that matched no rows, such as a last_hostname reconcile with nothing to change, leave the version alone
+
+    for table in ('dropdowns', 'hostnames', 'inventory', 'transactions', 'logs'):
+        cursor.execute(sql.SQL('DROP TRIGGER IF EXISTS {} ON {};').format(sql.Identifier(table + '_lookup_version'), sql.Identifier(table)))
+        for operation, transition_tables in (('insert', 'REFERENCING NEW TABLE AS new_rows'), ('update', 'REFERENCING NEW TABLE AS new_rows'),
+            ('delete', 'REFERENCING OLD TABLE AS old_rows'), ('truncate', '')):
+            trigger_name = sql.Identifier('{}_lookup_version_{}'.format(table, operation))
+            cursor.execute(sql.SQL('DROP TRIGGER IF EXISTS {} ON {};').format(trigger_name, sql.Identifier(table)))
+            cursor.execute(sql.SQL('''CREATE TRIGGER {} AFTER {} ON {} {}
+                FOR EACH STATEMENT EXECUTE FUNCTION bump_lookup_version();''').format(trigger_name, sql.SQL(operation.upper()),
+                sql.Identifier(table), sql.SQL(transition_tables)))
+
+def migration_014_iso_date_validation(conn, cursor): #Makes is_valid_date accept only YYYY-MM-DD, parsed field by field. A ::DATE cast follows the session's DateStyle, which an IMMUTABLE function must not depend on
+    cursor.execute('''CREATE OR REPLACE FUNCTION is_valid_date(value TEXT) RETURNS BOOLEAN AS $$
+    BEGIN
+        IF value IS NULL THEN
+            RETURN true;
+        END IF;
+        IF value !~ '^[0-9]{4}-[0-9]{2}-[0-9]{2}$' THEN
+            RETURN false;
+        END IF;
+        PERFORM make_date(substr(value, 1, 4)::INT, substr(value, 6, 2)::INT, substr(value, 9, 2)::INT);
+        RETURN true;
+    EXCEPTION WHEN others THEN
+        RETURN false;
+    END
+    $$ LANGUAGE plpgsql IMMUTABLE;''') #The importer's ::DATE casts read a YYYY-MM-DD value the same way under every DateStyle
+
+migrations = [(1, 'baseline tables', migration_001_baseline_tables, False),
+    (2, 'search and sort indexes', migration_002_search_and_sort_indexes, True),
+    (3, 'last hostname triggers', migration_003_last_hostname_triggers, False),
+    (4, 'transactionid identity', migration_004_transactionid_identity, False),
+    (5, 'date validation function', migration_005_is_valid_date, False),
+    (6, 'lookup list versions', migration_006_lookup_versions, False),
+    (7, 'hostname prefix index', migration_007_hostname_prefix_index, True),
+    (8, 'partition logs by month', migration_008_partition_logs, True),
+    (9, 'global search', migration_009_global_search, True),
+    (10, 'sessions table', migration_010_sessions, False),
+    (11, 'table change versions', migration_011_table_versions, False),
+    (12, 'api tokens', migration_012_api_tokens, False),
+    (13, 'table version shards', migration_013_table_version_shards, False),
+    (14, 'ISO date validation', migration_014_iso_date_validation, False)] #(version, name, function, online). Online migrations run in autocommit mode. Append new migrations to the end, never reorder or edit applied ones
+
+def create_version_table(conn, cursor):
+    cursor.execute('''CREATE TABLE IF NOT EXISTS schema_migrations (
+    version INT PRIMARY KEY,
+    name TEXT,
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );''')
+    conn.commit()
+
+def get_applied_versions(cursor):
+    cursor.execute('SELECT version FROM schema_migrations;')
+    return set(entry[0] for entry in cursor.fetchall())
+
+def migrate(target_version=None): #Applies every migration that hasn't been applied yet, up to target_version if given
+    conn = database.connect()
+    cursor = conn.cursor()
+    create_version_table(conn, cursor)
+    conn.autocommit = True
+    cursor.execute('SELECT pg_advisory_lock(%s);', (migration_lock_id,))
+    try:
+        applied_versions = get_applied_versions(cursor)
+        for version, name, migration, online in migrations:
+            if version in applied_versions:
+                continue
+            if target_version != None and version > target_version:
+                break
+            print('Applying migration {}: {}'.format(version, name))
+            cursor.execute('SET lock_timeout = %s;', (config.get('migrations', 'lock_timeout', fallback='5s'),)) #Gives up instead of queueing every query on the table behind a DDL lock
+            if online:
+                conn.autocommit = True
+                migration(conn, cursor)
+                cursor.execute('INSERT INTO schema_migrations(version, name) VALUES (%s, %s);', (version, name))
+            else:
+                conn.autocommit = False
+                try:
+                    migration(conn, cursor)
+                    cursor.execute('INSERT INTO schema_migrations(version, name) VALUES (%s, %s);', (version, name))
+                    conn.commit()
+                except:
+                    conn.rollback()
+                    raise
+                finally:
+                    conn.autocommit = True
+    finally:
+        conn.autocommit = True
+        cursor.execute('SELECT pg_advisory_unlock(%s);', (migration_lock_id,))
+        conn.close()
+
+def status(): #Prints every migration and whether it has been applied
+    conn = database.connect()
+    cursor = conn.cursor()
+    create_version_table(conn, cursor)
+    applied_versions = get_applied_versions(cursor)
+    for version, name, migration, online in migrations:
+        if version in applied_versions:
+            state = 'applied'
+        else:
+            state = 'pending'
+        print('{:>4}  {:<8}  {}'.format(version, state, name))
+    conn.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Manage the inventory database schema.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    migrate_parser = subparsers.add_parser('migrate', help='Apply pending migrations.')
+    migrate_parser.add_argument('--to', type=int, dest='target_version', help='Stop after this version.')
+    subparsers.add_parser('status', help='List migrations and whether they have been applied.')
+    args = parser.parse_args()
+    if args.command == 'migrate':
+        migrate(args.target_version)
+    else:
+        status()
@@ -0,0 +1,173 @@
+import configparser
+import os
+import secrets
+import sqlite3
+import threading
+import time
+import psycopg2
+from flask.sessions import SessionInterface, SessionMixin, session_json_serializer
+from werkzeug.datastructures import CallbackDict
+import database
+
+#Server side session stores, chosen with session_type in inventory.conf:
+#postgres keeps sessions in the sessions table of the app database (migration 10), so every app host shares them.
+#sqlite keeps them in a SQLite file on this host.
+#(filesystem, the default, is flask_session's file store and is set up in create_app instead.)
+#A session is only written when it changes, or when less than half of its lifetime is left so an active user isn't logged out part way through.
+#Expired sessions are never loaded. They are deleted by a sweep that runs at most once every session_sweep_interval seconds in each app process,
+#or by python maintenance.py sweep-sessions.
+
+config = configparser.ConfigParser()
+config.read('inventory.conf')
+
+class ServerSession(CallbackDict, SessionMixin): #Session dictionary that records whether it has been changed since it was loaded
+    def __init__(self, initial=None, session_id=None, expires_at=None):
+        def on_update(self):
+            self.modified = True
+        super().__init__(initial, on_update)
+        self.session_id = session_id
+        self.expires_at = expires_at #Unix time the stored copy expires. None if it isn't stored yet
+        self.modified = False
+
+class PostgresSessionStore: #Uses its own small pool of autocommit connections, so saving a session never commits or waits on the request's own transaction
+    def __init__(self):
+        self.pool = None
+        self.pool_lock = threading.Lock()
+        os.register_at_fork(after_in_child=self.reset_after_fork)
+
+    def reset_after_fork(self): #The child must not use the parent's sockets
+        self.pool = None
+        self.pool_lock = threading.Lock()
+
+    def get_pool(self):
+        if self.pool == None:
+            with self.pool_lock:
+                if self.pool == None:
+                    pool_connections = config.getint('flask', 'session_pool_connections', fallback=2)
+                    self.pool = database.BlockingConnectionPool(1, pool_connections, config.getfloat('postgres', 'pool_timeout', fallback=30),
+                        database=config.get('postgres', 'database_name'),
+                        user=config.get('postgres', 'user'),
+                        password=config.get('postgres', 'password'),
+                        host=config.get('postgres', 'host_ip'),
+                        port=config.get('postgres', 'host_port'))
+        return self.pool
+
+    def execute(self, query, query_params=()): #Runs one statement and returns its rows (or row count). A broken connection is discarded and the statement retried once on a fresh one
+        for attempt in range(2):
+            session_pool = self.get_pool()
+            db_conn = session_pool.getconn()
+            try:
+                db_conn.autocommit = True
+                with db_conn.cursor() as session_cursor:
+                    session_cursor.execute(query, query_params)
+                    result = session_cursor.fetchall() if session_cursor.description != None else session_cursor.rowcount
+                session_pool.putconn(db_conn)
+                return result
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                session_pool.putconn(db_conn, close=True)
+                if attempt == 1:
+                    raise
+            except:
+                session_pool.putconn(db_conn, close=True)
+                raise
+
+    def load(self, session_id): #Returns (data, expires_at), or None if there is no unexpired session with this id
+        rows = self.execute('''SELECT data, extract(epoch FROM expires_at) FROM sessions
+            WHERE session_id = %s AND expires_at > CURRENT_TIMESTAMP;''', (session_id,))
+        return (rows[0][0], float(rows[0][1])) if rows != [] else None
+
+    def save(self, session_id, data, expires_at):
+        self.execute('''INSERT INTO sessions(session_id, data, expires_at) VALUES (%s, %s, to_timestamp(%s))
+            ON CONFLICT (session_id) DO UPDATE SET data = excluded.data, expires_at = excluded.expires_at;''', (session_id, data, expires_at))
+
+    def delete(self, session_id):
+        self.execute('DELETE FROM sessions WHERE session_id = %s;', (session_id,))
+
+    def sweep(self): #Deletes expired sessions. Returns how many were deleted
+        return self.execute('DELETE FROM sessions WHERE expires_at <= CURRENT_TIMESTAMP;')
+
+class SQLiteSessionStore: #One SQLite connection per thread, since a connection can't be shared between threads
+    def __init__(self):
+        self.path = config.get('flask', 'session_sqlite_path', fallback='sessions.sqlite3')
+        self.connections = threading.local()
+        os.register_at_fork(after_in_child=self.reset_after_fork)
+
+    def reset_after_fork(self):
+        self.connections = threading.local()
+
+    def get_connection(self):
+        sqlite_conn = getattr(self.connections, 'sqlite_conn', None)
+        if sqlite_conn == None:
+            sqlite_conn = sqlite3.connect(self.path, timeout=config.getfloat('postgres', 'pool_timeout', fallback=30), isolation_level=None) #Autocommit
+            sqlite_conn.execute('PRAGMA journal_mode = WAL;') #Readers don't wait for writers
+            sqlite_conn.execute('PRAGMA synchronous = NORMAL;')
+            sqlite_conn.execute('''CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                expires_at REAL NOT NULL
+                ) WITHOUT ROWID;''')
+            sqlite_conn.execute('CREATE INDEX IF NOT EXISTS sessions_expires_at_idx ON sessions (expires_at);') #Lets the sweep find expired sessions without reading every row
+            self.connections.sqlite_conn = sqlite_conn
+        return sqlite_conn
+
+    def load(self, session_id):
+        return self.get_connection().execute('SELECT data, expires_at FROM sessions WHERE session_id = ? AND expires_at > ?;',
+            (session_id, time.time())).fetchone()
+
+    def save(self, session_id, data, expires_at):
+        self.get_connection().execute('''INSERT INTO sessions(session_id, data, expires_at) VALUES (?, ?, ?)
+            ON CONFLICT (session_id) DO UPDATE SET data = excluded.data, expires_at = excluded.expires_at;''', (session_id, data, expires_at))
+
+    def delete(self, session_id):
+        self.get_connection().execute('DELETE FROM sessions WHERE session_id = ?;', (session_id,))
+
+    def sweep(self):
+        return self.get_connection().execute('DELETE FROM sessions WHERE expires_at <= ?;', (time.time(),)).rowcount
+
+session_stores = {'postgres' : PostgresSessionStore, 'sqlite' : SQLiteSessionStore} #session_type: store class
+
+class StoreSessionInterface(SessionInterface): #Flask session interface that keeps only a random session id in the cookie and the session itself in a store
+    def __init__(self, store):
+        self.store = store
+        self.last_swept = time.monotonic() #The first sweep waits a full interval, so a batch of freshly started workers don't all sweep at once
+
+    def open_session(self, app, request):
+        session_id = request.cookies.get(self.get_cookie_name(app))
+        if session_id == None or request.endpoint == 'static': #Static files never use the session, so it isn't loaded for them
+            return ServerSession(session_id=session_id)
+        stored = self.store.load(session_id)
+        if stored == None: #Unknown or expired. Starts a new session with a new id
+            return ServerSession()
+        return ServerSession(session_json_serializer.loads(stored[0]), session_id, stored[1])
+
+    def save_session(self, app, session, response):
+        self.sweep_if_due()
+        cookie_name = self.get_cookie_name(app)
+        cookie_domain = self.get_cookie_domain(app)
+        cookie_path = self.get_cookie_path(app)
+        if not session: #Empty. Deletes the stored copy if the session was cleared during this request
+            if session.modified and session.session_id != None:
+                self.store.delete(session.session_id)
+                response.delete_cookie(cookie_name, domain=cookie_domain, path=cookie_path)
+            return
+        lifetime = app.permanent_session_lifetime.total_seconds()
+        if not session.modified and session.expires_at != None and session.expires_at - time.time() > lifetime / 2:
+            return #Unchanged and nowhere near expiring, so there is nothing to write
+        if session.session_id == None:
+            session.session_id = secrets.token_urlsafe(32)
+        self.store.save(session.session_id, session_json_serializer.dumps(dict(session)), time.time() + lifetime)
+        response.set_cookie(cookie_name, session.session_id, expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app), domain=cookie_domain, path=cookie_path,
+            secure=self.get_cookie_secure(app), samesite=self.get_cookie_samesite(app))
+
+    def sweep_if_due(self):
+        if time.monotonic() - self.last_swept < config.getfloat('flask', 'session_sweep_interval', fallback=300):
+            return
+        self.last_swept = time.monotonic()
+        try:
+            self.store.sweep()
+        except: #A failed sweep is retried next interval rather than failing the request
+            pass
+
+def create_store(session_type):
+    return session_stores[session_type]()
@@ -0,0 +1,29 @@
+// Fills the hostname datalist on the transactions forms as the user types, using the /hostnames/autocomplete prefix search.
+// Only the matching hostnames are fetched, so the form stays the same size however many hostnames there are.
+document.querySelectorAll('input[data-autocomplete-url]').forEach(function (input) {
+    var datalist = document.getElementById(input.getAttribute('list'));
+    var timer = null;
+    var lastPrefix = null;
+    input.addEventListener('input', function () {
+        clearTimeout(timer);
+        timer = setTimeout(function () { // Waits for a pause in typing before asking the server
+            var prefix = input.value.trim();
+            if (prefix === lastPrefix) {
+                return;
+            }
+            lastPrefix = prefix;
+            fetch(input.dataset.autocompleteUrl + '?prefix=' + encodeURIComponent(prefix), {credentials: 'same-origin'})
+                .then(function (response) { return response.json(); })
+                .then(function (hostnames) {
+                    if (prefix !== lastPrefix) { // A newer request has been sent since
+                        return;
+                    }
+                    datalist.replaceChildren.apply(datalist, hostnames.map(function (hostname) {
+                        var option = document.createElement('option');
+                        option.value = hostname;
+                        return option;
+                    }));
+                });
+        }, 150);
+    });
+});
@@ -0,0 +1,86 @@
+import configparser
+import json
+import pytest
+from ldap3 import Connection, MOCK_SYNC, MODIFY_ADD, SIMPLE
+import directory
+
+#Login checks against ldap3's in-memory directory. Run from the project folder: python -m pytest tests
+
+user_dir = 'CN=Users,DC=example,DC=com'
+admin_group_dn = 'CN=IT Admins,' + user_dir
+service_dn = 'CN=svc-inventory,' + user_dir
+
+def user_entry(username, password):
+    return {'dn' : 'CN={},{}'.format(username, user_dir), 'raw' : {'objectClass' : ['top', 'person', 'user'], 'objectCategory' : ['person'],
+        'sAMAccountName' : [username], 'userPassword' : [password]}}
+
+@pytest.fixture(params=['', service_dn], ids=['own connection', 'service connection'])
+def ldap(request, tmp_path, monkeypatch): #A MOCK_SYNC directory with one admin, one user and a service account, loaded through mock_directory_file
+    mock_directory_file = tmp_path / 'directory.json'
+    mock_directory_file.write_text(json.dumps({'entries' : [user_entry('aadmin', 'admin-password'), user_entry('buser', 'user-password'),
+        user_entry('svc-inventory', 'service-password'),
+        {'dn' : admin_group_dn, 'raw' : {'objectClass' : ['top', 'group'], 'objectCategory' : ['group'], 'cn' : ['IT Admins'],
+            'member' : ['CN=aadmin,' + user_dir]}}]}))
+    config = configparser.ConfigParser()
+    config['ldap'] = {'ldap_server_ip' : 'mock', 'ldap_server_port' : '636', 'ldap_user_dir' : '"{}"'.format(user_dir),
+        'admin_group_cn' : 'IT Admins', 'authentication' : 'SIMPLE', 'bind_user_format' : 'CN={},' + user_dir,
+        'service_user' : request.param, 'service_password' : 'service-password', 'client_strategy' : 'MOCK_SYNC',
+        'mock_directory_file' : str(mock_directory_file), 'admin_cache_seconds' : '300', 'admin_refresh_interval' : '30'}
+    monkeypatch.setattr(directory, 'config', config)
+    for name, value in (('server', None), ('service_conn', None), ('admin_members', frozenset()), ('admin_members_read', None),
+        ('mock_directory_loaded', False)): #Module state a previous test left behind
+        monkeypatch.setattr(directory, name, value)
+    group_reads = []
+    read_admin_members = directory.read_admin_members
+    def counted_read_admin_members(lookup_conn):
+        group_reads.append(lookup_conn)
+        read_admin_members(lookup_conn)
+    monkeypatch.setattr(directory, 'read_admin_members', counted_read_admin_members)
+    return group_reads
+
+def add_admin(username): #Adds a user to the admin group behind the app's back, as a directory administrator would
+    editor = Connection(directory.get_server(), user=service_dn, password='service-password', authentication=SIMPLE, client_strategy=MOCK_SYNC)
+    editor.bind()
+    editor.modify(admin_group_dn, {'member' : [(MODIFY_ADD, ['CN={},{}'.format(username, user_dir)])]})
+    editor.unbind()
+
+def test_admin_login(ldap):
+    assert directory.authenticate('aadmin', 'admin-password') == 'admin'
+
+def test_user_login(ldap):
+    assert directory.authenticate('buser', 'user-password') == 'user'
+
+def test_wrong_password(ldap):
+    assert directory.authenticate('aadmin', 'user-password') == 'invalid'
+    assert directory.authenticate('nobody', 'admin-password') == 'invalid'
+    assert directory.authenticate('aadmin', '') == 'invalid'
+
+def test_admin_cache_hit(ldap):
+    assert directory.authenticate('aadmin', 'admin-password') == 'admin'
+    directory.admin_members_read -= 60 #Past the refresh interval but within admin_cache_seconds. A member of the cached set never needs a re-read
+    assert directory.authenticate('aadmin', 'admin-password') == 'admin'
+    assert len(ldap) == 1
+
+def test_admin_refresh_on_miss(ldap):
+    assert directory.authenticate('buser', 'user-password') == 'user'
+    add_admin('buser')
+    assert directory.authenticate('buser', 'user-password') == 'user' #Within the refresh interval the cached set is still used
+    assert len(ldap) == 1
+    directory.admin_members_read -= 60
+    assert directory.authenticate('buser', 'user-password') == 'admin'
+    assert len(ldap) == 2
+
+def test_admin_cache_expiry(ldap):
+    assert directory.authenticate('aadmin', 'admin-password') == 'admin'
+    directory.admin_members_read -= 300
+    assert directory.authenticate('aadmin', 'admin-password') == 'admin'
+    assert len(ldap) == 2
+
+def test_service_connection_reused(ldap):
+    directory.authenticate('aadmin', 'admin-password')
+    directory.authenticate('buser', 'user-password')
+    if directory.config.get('ldap', 'service_user') == '':
+        assert directory.service_conn == None
+    else:
+        assert directory.service_conn != None and directory.service_conn.bound
+        assert ldap[0] is directory.service_conn
@@ -0,0 +1,5 @@
+from app import create_app
+
+#Entry point for WSGI servers, e.g. gunicorn -c gunicorn.conf.py
+
+app = create_app()